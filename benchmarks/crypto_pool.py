@@ -0,0 +1,74 @@
+"""Measure event-loop lag during a burst of wallet registrations.
+
+Each registration creates a keypair and encrypts its private key, once inline
+on the event loop (as before the crypto worker pool) and once through the
+keypair pool and crypto workers. A ticker task sleeping 1 ms at a time
+records how late the loop wakes it, which is the delay every other update
+would see during the burst.
+
+    python -m benchmarks.crypto_pool --registrations 300
+"""
+import argparse
+import asyncio
+import time
+from typing import List
+
+from bot.config import settings
+from bot.services.crypto import (
+    fernet, keypair_pool, encrypt_private_key, shutdown_crypto_pool, _generate_keypair
+)
+
+TICK = 0.001
+
+async def _ticker(lags: List[float], done: asyncio.Event) -> None:
+    """Record how late each 1 ms sleep wakes up."""
+    while not done.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(TICK)
+        lags.append(time.perf_counter() - started - TICK)
+
+async def _register_inline() -> None:
+    """Registration work as it ran on the event loop."""
+    address, private_key = _generate_keypair()
+    fernet.encrypt(private_key.encode())
+
+async def _register_pooled() -> None:
+    """Registration work through the keypair pool and crypto workers."""
+    address, private_key = await keypair_pool.pop()
+    await encrypt_private_key(private_key)
+
+async def _burst(label: str, register, count: int) -> None:
+    lags: List[float] = []
+    done = asyncio.Event()
+    ticker = asyncio.create_task(_ticker(lags, done))
+    await asyncio.sleep(0.05)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(register() for _ in range(count)))
+    elapsed = time.perf_counter() - started
+
+    done.set()
+    await ticker
+    lags.sort()
+    print(
+        f"{label:<7} {count} registrations in {elapsed * 1000:.0f} ms, "
+        f"event-loop lag max {lags[-1] * 1000:.1f} ms, p99 {lags[int(len(lags) * 0.99)] * 1000:.1f} ms"
+    )
+
+async def main(count: int) -> None:
+    await _burst("inline", _register_inline, count)
+
+    # The pool is filled at startup, before any burst arrives
+    await keypair_pool.start()
+    while keypair_pool.size < settings.KEYPAIR_POOL_SIZE:
+        await asyncio.sleep(0.01)
+    await _burst("pooled", _register_pooled, count)
+
+    await keypair_pool.stop()
+    shutdown_crypto_pool()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--registrations", type=int, default=300, help="registrations in the burst")
+    args = parser.parse_args()
+    asyncio.run(main(args.registrations))
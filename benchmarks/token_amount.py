@@ -0,0 +1,89 @@
+"""Compare Decimal token amounts with integer-backed TokenAmount on the tip path.
+
+The "before" side repeats what the handlers and blockchain service did per
+call before TokenAmount: build a Decimal from the user's string, rebuild the
+tip limits from settings, multiply by 10 ** TOKEN_DECIMALS to get wei and
+divide wei back down for display. The "after" side parses once and compares,
+converts and formats plain integers.
+
+    python -m benchmarks.token_amount --number 200000
+"""
+import argparse
+import timeit
+from decimal import Decimal
+
+from bot.config import settings
+from bot.utils.amount import TokenAmount
+
+TOKEN_DECIMALS = settings.TOKEN_DECIMALS
+AMOUNT = "12.5"
+MIN_TIP = TokenAmount.parse(settings.MIN_TIP_AMOUNT)
+MAX_TIP = TokenAmount.parse(settings.MAX_TIP_AMOUNT)
+
+def _validate_decimal(amount_str: str) -> int:
+    """The tip validation and wei conversion as they ran on Decimal."""
+    amount = Decimal(amount_str)
+    if amount < Decimal(str(settings.MIN_TIP_AMOUNT)):
+        raise ValueError("too low")
+    if amount > Decimal(str(settings.MAX_TIP_AMOUNT)):
+        raise ValueError("too high")
+    return int(amount * Decimal(10 ** TOKEN_DECIMALS))
+
+def _validate_token_amount(amount_str: str) -> int:
+    """The same validation with TokenAmount and precomputed limits."""
+    amount = TokenAmount.parse(amount_str)
+    if amount < MIN_TIP:
+        raise ValueError("too low")
+    if amount > MAX_TIP:
+        raise ValueError("too high")
+    return amount.raw
+
+def _cases():
+    decimal_amount = Decimal(AMOUNT)
+    token_amount = TokenAmount.parse(AMOUNT)
+    wei = token_amount.raw
+    return [
+        (
+            "parse",
+            lambda: Decimal(AMOUNT),
+            lambda: TokenAmount.parse(AMOUNT),
+        ),
+        (
+            "compare to tip limit",
+            lambda: decimal_amount < Decimal(str(settings.MIN_TIP_AMOUNT)),
+            lambda: token_amount < MIN_TIP,
+        ),
+        (
+            "to wei",
+            lambda: int(decimal_amount * Decimal(10 ** TOKEN_DECIMALS)),
+            lambda: token_amount.raw,
+        ),
+        (
+            "format balance",
+            lambda: str(Decimal(wei) / Decimal(10 ** TOKEN_DECIMALS)),
+            lambda: str(TokenAmount(wei)),
+        ),
+        (
+            "validate tip",
+            lambda: _validate_decimal(AMOUNT),
+            lambda: _validate_token_amount(AMOUNT),
+        ),
+    ]
+
+def _time(func, number: int) -> float:
+    """Best of five runs, in nanoseconds per call."""
+    return min(timeit.repeat(func, number=number, repeat=5)) / number * 1e9
+
+def main(number: int) -> None:
+    # Both sides must agree before their speed means anything
+    assert _validate_decimal(AMOUNT) == _validate_token_amount(AMOUNT)
+
+    print(f"{'':<22}{'Decimal':>10}{'TokenAmount':>14}")
+    for name, before, after in _cases():
+        print(f"{name:<22}{_time(before, number):>8.0f} ns{_time(after, number):>11.0f} ns")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--number", type=int, default=200_000, help="calls per timing run")
+    args = parser.parse_args()
+    main(args.number)
@@ -3,6 +3,20 @@ from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.fsm.storage.redis import RedisStorage
 
 from bot.config import settings
+from bot.services.blockchain import init_blockchain, close_blockchain
+from bot.services.cache import balance_cache
+from bot.services.database import profile_cache
+from bot.services.crypto import keypair_pool, shutdown_crypto_pool
+from bot.services.activity import activity_buffer
+from bot.services.migrations import migrate, check_schema
+from bot.services.tracker import receipt_tracker
+from bot.services.txlog import transaction_writer
+from bot.services.indexer import transfer_indexer
+from bot.services.ledger import ledger_enabled, netting_job
+from bot.services.settlement import settlement_queue
+from bot.services.ratelimit import rate_limiter
+from bot.middlewares.activity import ActivityMiddleware
+from bot.middlewares.database import DatabaseMiddleware
 from bot.middlewares.localization import I18nMiddleware
 from bot.middlewares.throttling import ThrottlingMiddleware
 from bot.handlers import (
@@ -21,10 +35,13 @@ else:
 dp = Dispatcher(storage=storage)
 
 # Register middlewares
+# Throttling runs first, so rejected updates do no database work
+dp.update.outer_middleware(ThrottlingMiddleware())
+# Outer middleware, so every other middleware and handler shares the update's session
+dp.update.outer_middleware(DatabaseMiddleware())
+dp.update.outer_middleware(ActivityMiddleware())
 dp.message.middleware(I18nMiddleware())
-dp.message.middleware(ThrottlingMiddleware())
 dp.callback_query.middleware(I18nMiddleware())
-dp.callback_query.middleware(ThrottlingMiddleware())
 
 # Include all routers
 dp.include_router(start.router)
@@ -35,3 +52,44 @@ dp.include_router(wallet.router)
 dp.include_router(balance.router)
 dp.include_router(referral.router)
 dp.include_router(transactions.router)
+
+@dp.startup()
+async def on_startup(bot: Bot):
+    """Open shared service connections and start background tasks."""
+    if ledger_enabled() and not settings.USE_INDEXER:
+        # Deposits only reach ledger balances through the transfer indexer
+        raise RuntimeError("TIP_SETTLEMENT_MODE=ledger requires USE_INDEXER=True")
+    
+    if settings.AUTO_MIGRATE:
+        await migrate()
+    else:
+        await check_schema()
+    
+    await keypair_pool.start()
+    await profile_cache.start()
+    await activity_buffer.start()
+    await transaction_writer.start()
+    await init_blockchain()
+    await receipt_tracker.start(bot)
+    if settings.USE_INDEXER:
+        await transfer_indexer.start()
+    if ledger_enabled():
+        await netting_job.start()
+        if settlement_queue.enabled:
+            await settlement_queue.start()
+
+@dp.shutdown()
+async def on_shutdown():
+    """Stop background tasks and close shared service connections."""
+    await transaction_writer.stop()
+    await settlement_queue.stop()
+    await netting_job.stop()
+    await transfer_indexer.stop()
+    await receipt_tracker.stop()
+    await close_blockchain()
+    await balance_cache.close()
+    await profile_cache.stop()
+    await rate_limiter.close()
+    await keypair_pool.stop()
+    await activity_buffer.stop()
+    shutdown_crypto_pool()
@@ -2,7 +2,7 @@ from aiogram import Router, F
 from aiogram.types import Message, CallbackQuery
 from aiogram.filters import Command
 
-from bot.services.database import get_user_referrals, get_user_by_id
+from bot.services.database import get_user_referrals
 from bot.keyboards.inline import get_referral_keyboard
 
 # Initialize router
@@ -17,28 +17,8 @@ async def command_referral(message: Message, _: callable):
     # Generate referral link
     referral_link = f"https://t.me/{bot_username}?start=ref{user_id}"
     
-    # Get referral stats
-    referral_count, referral_users = await get_user_referrals(user_id)
-    
-    # Create referral message
-    referral_message = _("referral_info").format(
-        link=referral_link,
-        count=referral_count,
-        bonus=referral_count * 10  # 10 TIP per referral
-    )
-    
-    # Add referral list if there are any
-    if referral_count > 0:
-        referral_list = "\n\n" + _("referral_list") + "\n"
-        for i, ref_id in enumerate(referral_users, 1):
-            user_data = await get_user_by_id(ref_id)
-            if user_data:
-                username = user_data.get("username", "")
-                name = user_data.get("first_name", "")
-                display_name = f"@{username}" if username else name or f"User {ref_id}"
-                referral_list += f"{i}. {display_name}\n"
-        
-        referral_message += referral_list
+    # Get referral stats and build the message
+    referral_message = await build_referral_message(user_id, referral_link, _)
     
     # Send message with inline keyboard
     await message.answer(
@@ -57,10 +37,24 @@ async def refresh_referrals(callback: CallbackQuery, _: callable):
     # Generate referral link
     referral_link = f"https://t.me/{bot_username}?start=ref{user_id}"
     
-    # Get updated referral stats
+    # Get updated referral stats and build the message
+    referral_message = await build_referral_message(user_id, referral_link, _)
+    
+    # Update message with new data
+    await callback.message.edit_text(
+        referral_message,
+        reply_markup=get_referral_keyboard(_, referral_link),
+        parse_mode="HTML",
+        disable_web_page_preview=True
+    )
+    
+    await callback.answer(_("referrals_refreshed"))
+
+async def build_referral_message(user_id: int, referral_link: str, _: callable) -> str:
+    """Build the referral info message with the list of referred users."""
     referral_count, referral_users = await get_user_referrals(user_id)
     
-    # Create updated referral message
+    # Create referral message
     referral_message = _("referral_info").format(
         link=referral_link,
         count=referral_count,
@@ -68,24 +62,14 @@ async def refresh_referrals(callback: CallbackQuery, _: callable):
     )
     
     # Add referral list if there are any
-    if referral_count > 0:
+    if referral_users:
         referral_list = "\n\n" + _("referral_list") + "\n"
-        for i, ref_id in enumerate(referral_users, 1):
-            user_data = await get_user_by_id(ref_id)
-            if user_data:
-                username = user_data.get("username", "")
-                name = user_data.get("first_name", "")
-                display_name = f"@{username}" if username else name or f"User {ref_id}"
-                referral_list += f"{i}. {display_name}\n"
+        for i, user in enumerate(referral_users, 1):
+            username = user["username"]
+            name = user["first_name"]
+            display_name = f"@{username}" if username else name or f"User {user['user_id']}"
+            referral_list += f"{i}. {display_name}\n"
         
         referral_message += referral_list
     
-    # Update message with new data
-    await callback.message.edit_text(
-        referral_message,
-        reply_markup=get_referral_keyboard(_, referral_link),
-        parse_mode="HTML",
-        disable_web_page_preview=True
-    )
-    
-    await callback.answer(_("referrals_refreshed"))
+    return referral_message
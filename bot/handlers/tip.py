@@ -1,6 +1,5 @@
 import re
 import logging
-from decimal import Decimal
 from aiogram import Router, F
 from aiogram.types import Message, CallbackQuery
 from aiogram.filters import Command
@@ -8,14 +7,23 @@ from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 
 from bot.config import settings
-from bot.services.blockchain import send_tip, get_token_balance
-from bot.services.database import get_user_wallet, save_transaction, get_user_by_username
+from bot.services.blockchain import send_tip
+from bot.services.balances import balance_service
+from bot.services.database import get_user_wallet, get_user_by_username, InsufficientBalanceError
+from bot.services.ledger import ledger_enabled, send_internal_tip
+from bot.services.tracker import receipt_tracker
+from bot.services.txlog import transaction_writer
+from bot.utils.amount import TokenAmount
 from bot.utils.idempotency import generate_idempotency_key, check_idempotency
 from bot.keyboards.inline import get_tip_confirmation_keyboard
 
 # Initialize router
 router = Router()
 
+# Tip limits, parsed once
+MIN_TIP = TokenAmount.parse(settings.MIN_TIP_AMOUNT)
+MAX_TIP = TokenAmount.parse(settings.MAX_TIP_AMOUNT)
+
 # Define FSM states
 class TipStates(StatesGroup):
     waiting_for_amount = State()
@@ -108,21 +116,21 @@ async def command_tip(message: Message, _: callable, state: FSMContext):
 async def process_tip(message, _, state, sender_id, recipient_id, amount_str):
     """Process the tip operation with validation."""
     try:
-        amount = Decimal(amount_str)
+        amount = TokenAmount.parse(amount_str)
     except (ValueError, TypeError):
         await message.answer(_("invalid_amount"))
         return
     
     # Validate amount
-    if amount < Decimal(str(settings.MIN_TIP_AMOUNT)):
+    if amount < MIN_TIP:
         await message.answer(_("tip_amount_too_low").format(
-            min_amount=settings.MIN_TIP_AMOUNT
+            min_amount=MIN_TIP
         ))
         return
     
-    if amount > Decimal(str(settings.MAX_TIP_AMOUNT)):
+    if amount > MAX_TIP:
         await message.answer(_("tip_amount_too_high").format(
-            max_amount=settings.MAX_TIP_AMOUNT
+            max_amount=MAX_TIP
         ))
         return
     
@@ -134,7 +142,7 @@ async def process_tip(message, _, state, sender_id, recipient_id, amount_str):
     
     # Check sender's balance
     sender_wallet = await get_user_wallet(sender_id)
-    balance = await get_token_balance(sender_wallet)
+    balance = await balance_service.get(sender_id, sender_wallet)
     
     if balance < amount:
         await message.answer(_("insufficient_balance").format(
@@ -147,8 +155,8 @@ async def process_tip(message, _, state, sender_id, recipient_id, amount_str):
     await state.update_data(
         recipient_id=recipient_id,
         recipient_wallet=recipient_wallet,
-        amount=str(amount),
-        idempotency_key=generate_idempotency_key()
+        amount=amount.raw,
+        idempotency_key=await generate_idempotency_key()
     )
     
     # Ask for confirmation
@@ -163,27 +171,22 @@ async def process_tip(message, _, state, sender_id, recipient_id, amount_str):
 @router.message(TipStates.waiting_for_amount)
 async def process_tip_amount(message: Message, _: callable, state: FSMContext):
     """Process tip amount when replying to a message."""
-    try:
-        amount = Decimal(message.text.strip())
-    except (ValueError, TypeError):
-        await message.answer(_("invalid_amount"))
-        return
-    
     # Get data from state
     data = await state.get_data()
     recipient_id = data.get("recipient_id")
     
     # Process the tip with the provided amount
-    await process_tip(message, _, state, message.from_user.id, recipient_id, str(amount))
+    await process_tip(message, _, state, message.from_user.id, recipient_id, message.text or "")
 
 @router.callback_query(F.data == "confirm_tip", TipStates.waiting_for_confirmation)
-async def confirm_tip(callback: CallbackQuery, _: callable, state: FSMContext):
+async def confirm_tip(callback: CallbackQuery, _: callable, state: FSMContext, user_lang: str):
     """Handle tip confirmation."""
     data = await state.get_data()
     sender_id = callback.from_user.id
     recipient_id = data.get("recipient_id")
     recipient_wallet = data.get("recipient_wallet")
-    amount_str = data.get("amount")
+    amount = TokenAmount(data.get("amount"))
+    amount_str = str(amount)
     idempotency_key = data.get("idempotency_key")
     
     # Check idempotency to prevent double-spending
@@ -200,26 +203,54 @@ async def confirm_tip(callback: CallbackQuery, _: callable, state: FSMContext):
         # Get sender's wallet
         sender_wallet = await get_user_wallet(sender_id)
         
-        # Send the tip
+        if ledger_enabled():
+            # Settle the tip on the internal ledger
+            transaction_id = await send_internal_tip(
+                sender_id=sender_id,
+                sender_wallet=sender_wallet,
+                recipient_id=recipient_id,
+                recipient_wallet=recipient_wallet,
+                amount=amount,
+                idempotency_key=idempotency_key
+            )
+            
+            if transaction_id is None:
+                await callback.message.edit_text(_("transaction_already_processed"))
+            else:
+                await balance_service.invalidate(sender_id, recipient_id)
+                await callback.message.edit_text(
+                    _("tip_success_internal").format(
+                        amount=amount_str,
+                        recipient_id=recipient_id
+                    ),
+                    parse_mode="HTML"
+                )
+            
+            await state.clear()
+            await callback.answer()
+            return
+        
+        # Broadcast the tip
         tx_hash = await send_tip(
-            sender_wallet_address=sender_wallet,
+            sender_id=sender_id,
             recipient_wallet_address=recipient_wallet,
-            amount=Decimal(amount_str)
+            amount=amount
         )
         
-        # Save transaction to database
-        await save_transaction(
+        # Save transaction as pending until the receipt tracker resolves it
+        await transaction_writer.save(
             sender_id=sender_id,
             recipient_id=recipient_id,
-            amount=Decimal(amount_str),
+            amount=amount.raw,
             tx_hash=tx_hash,
             tx_type="tip",
+            status="pending",
             idempotency_key=idempotency_key
         )
         
-        # Send success message
+        # Send pending message
         await callback.message.edit_text(
-            _("tip_success").format(
+            _("tip_pending").format(
                 amount=amount_str,
                 recipient_id=recipient_id,
                 tx_hash=tx_hash
@@ -227,6 +258,27 @@ async def confirm_tip(callback: CallbackQuery, _: callable, state: FSMContext):
             parse_mode="HTML"
         )
         
+        # Edit the message again once the tip confirms or fails, and drop
+        # the balances it changed
+        receipt_tracker.track(
+            tx_hash,
+            chat_id=callback.message.chat.id,
+            message_id=callback.message.message_id,
+            lang=user_lang,
+            success_key="tip_success",
+            failure_key="tip_failed",
+            on_receipt=lambda receipt: balance_service.invalidate(sender_id, recipient_id),
+            amount=amount_str,
+            recipient_id=recipient_id
+        )
+        
+    except InsufficientBalanceError:
+        balance = await balance_service.get(sender_id, sender_wallet, max_age=0)
+        await callback.message.edit_text(
+            _("insufficient_balance").format(balance=balance),
+            reply_markup=None
+        )
+    
     except Exception as e:
         logging.error(f"Error sending tip from {sender_id} to {recipient_id}: {e}")
         await callback.message.edit_text(
@@ -1,144 +1,111 @@
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional, Tuple
+
 from aiogram import Router, F
-from aiogram.types import Message, CallbackQuery
+from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.filters import Command
 
-from bot.services.database import get_user_transactions, get_user_by_id
+from bot.services.database import get_user_transactions, get_user_stats
+from bot.utils.amount import TokenAmount
 
 # Initialize router
 router = Router()
 
+# Transactions shown per page
+PAGE_SIZE = 10
+
+EPOCH = datetime(1970, 1, 1)
+
+def display_name(user_id: int, username: Optional[str], first_name: Optional[str]) -> str:
+    """Name to show for a counterparty."""
+    return f"@{username}" if username else first_name or f"User {user_id}"
+
+def encode_cursor(tx: Dict[str, Any]) -> str:
+    """Encode a transaction's (created_at, id) position as a compact cursor."""
+    micros = (tx["created_at"] - EPOCH) // timedelta(microseconds=1)
+    return f"{micros:x}.{tx['id']:x}"
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Decode a cursor produced by encode_cursor."""
+    micros, tx_id = cursor.split(".")
+    return EPOCH + timedelta(microseconds=int(micros, 16)), int(tx_id, 16)
+
 @router.message(Command("transactions"))
 async def command_transactions(message: Message, _: callable):
     """Handle /transactions command to show transaction history."""
     user_id = message.from_user.id
     
-    # Get transaction history
-    transactions = await get_user_transactions(user_id, limit=10)
+    # Get the newest page of transaction history
+    transactions, has_older = await get_user_transactions(user_id, limit=PAGE_SIZE)
     
     if not transactions:
         await message.answer(_("no_transactions"))
         return
     
-    # Create transaction list message
-    tx_message = _("transaction_history") + "\n\n"
-    
-    for tx in transactions:
-        tx_type = tx.get("tx_type", "unknown")
-        amount = tx.get("amount", 0)
-        tx_hash = tx.get("tx_hash", "")
-        timestamp = tx.get("created_at", "")
-        
-        # Format timestamp
-        if timestamp:
-            from datetime import datetime
-            try:
-                # Convert timestamp to readable format
-                dt = datetime.fromisoformat(str(timestamp).replace('Z', '+00:00'))
-                formatted_time = dt.strftime("%Y-%m-%d %H:%M:%S")
-            except:
-                formatted_time = str(timestamp)
-        else:
-            formatted_time = _("unknown_time")
-        
-        # Format transaction info based on type
-        if tx_type == "tip":
-            sender_id = tx.get("sender_id")
-            recipient_id = tx.get("recipient_id")
-            
-            if sender_id == user_id:
-                # Outgoing tip
-                recipient_data = await get_user_by_id(recipient_id)
-                recipient_name = "Unknown"
-                if recipient_data:
-                    username = recipient_data.get("username", "")
-                    name = recipient_data.get("first_name", "")
-                    recipient_name = f"@{username}" if username else name or f"User {recipient_id}"
-                
-                tx_message += _("outgoing_tip").format(
-                    amount=amount,
-                    recipient=recipient_name,
-                    time=formatted_time,
-                    tx_hash=tx_hash[:6] + "..." + tx_hash[-4:]
-                ) + "\n\n"
-            else:
-                # Incoming tip
-                sender_data = await get_user_by_id(sender_id)
-                sender_name = "Unknown"
-                if sender_data:
-                    username = sender_data.get("username", "")
-                    name = sender_data.get("first_name", "")
-                    sender_name = f"@{username}" if username else name or f"User {sender_id}"
-                
-                tx_message += _("incoming_tip").format(
-                    amount=amount,
-                    sender=sender_name,
-                    time=formatted_time,
-                    tx_hash=tx_hash[:6] + "..." + tx_hash[-4:]
-                ) + "\n\n"
-        
-        elif tx_type == "deposit":
-            tx_message += _("deposit_tx").format(
-                amount=amount,
-                time=formatted_time,
-                tx_hash=tx_hash[:6] + "..." + tx_hash[-4:]
-            ) + "\n\n"
-        
-        elif tx_type == "withdraw":
-            destination = tx.get("recipient_wallet", _("external_wallet"))
-            tx_message += _("withdraw_tx").format(
-                amount=amount,
-                destination=destination[:6] + "..." + destination[-4:] if len(destination) > 10 else destination,
-                time=formatted_time,
-                tx_hash=tx_hash[:6] + "..." + tx_hash[-4:]
-            ) + "\n\n"
-        
-        else:
-            # Unknown transaction type
-            tx_message += _("unknown_tx").format(
-                amount=amount,
-                type=tx_type,
-                time=formatted_time,
-                tx_hash=tx_hash[:6] + "..." + tx_hash[-4:]
-            ) + "\n\n"
-    
-    # Add view more option if there are more transactions
-    total_tx_count = await get_user_transactions(user_id, count_only=True)
-    if total_tx_count > 10:
-        tx_message += _("more_transactions").format(
-            remaining=total_tx_count - 10
-        )
-    
-    # Send transaction history
+    # Send transaction history, headed by the user's totals
+    title = _("transaction_history") + "\n\n" + format_totals(await get_user_stats(user_id), _)
     await message.answer(
-        tx_message,
+        format_transactions(title, transactions, user_id, _),
         parse_mode="HTML",
-        reply_markup=get_transaction_keyboard(_) if total_tx_count > 10 else None
+        reply_markup=get_transaction_keyboard(_, transactions, has_newer=False, has_older=has_older)
     )
 
-@router.callback_query(F.data == "view_more_transactions")
-async def view_more_transactions(callback: CallbackQuery, _: callable):
-    """Handle view more transactions request."""
+@router.callback_query(F.data.startswith("tx_older_") | F.data.startswith("tx_newer_"))
+async def page_transactions(callback: CallbackQuery, _: callable):
+    """Handle paging through transaction history."""
     user_id = callback.from_user.id
     
-    # Get additional transactions
-    transactions = await get_user_transactions(user_id, limit=10, offset=10)
+    try:
+        direction, cursor = callback.data[len("tx_"):].split("_", 1)
+        position = decode_cursor(cursor)
+    except ValueError:
+        await callback.answer()
+        return
+    
+    if direction == "older":
+        transactions, has_older = await get_user_transactions(user_id, limit=PAGE_SIZE, before=position)
+        has_newer = True
+    else:
+        transactions, has_newer = await get_user_transactions(user_id, limit=PAGE_SIZE, after=position)
+        has_older = True
     
     if not transactions:
         await callback.answer(_("no_more_transactions"))
         return
     
-    # Create transaction list message
-    tx_message = _("more_transaction_history") + "\n\n"
+    if has_newer:
+        title = _("more_transaction_history")
+    else:
+        title = _("transaction_history") + "\n\n" + format_totals(await get_user_stats(user_id), _)
+    await callback.message.edit_text(
+        format_transactions(title, transactions, user_id, _),
+        parse_mode="HTML",
+        reply_markup=get_transaction_keyboard(_, transactions, has_newer=has_newer, has_older=has_older)
+    )
+    
+    await callback.answer()
+
+def format_totals(stats: Dict[str, Any], _: callable) -> str:
+    """Render a user's tip totals."""
+    return _("transaction_totals").format(
+        sent_count=stats["tips_sent"],
+        sent_volume=TokenAmount(stats["volume_sent"]),
+        received_count=stats["tips_received"],
+        received_volume=TokenAmount(stats["volume_received"])
+    )
+
+def format_transactions(title: str, transactions: list, user_id: int, _: callable) -> str:
+    """Render a page of transactions."""
+    tx_message = title + "\n\n"
     
     for tx in transactions:
         tx_type = tx.get("tx_type", "unknown")
-        amount = tx.get("amount", 0)
-        tx_hash = tx.get("tx_hash", "")
+        amount = TokenAmount(tx.get("amount", 0))
+        tx_hash = tx.get("tx_hash") or ""
         timestamp = tx.get("created_at", "")
         
         # Format timestamp
         if timestamp:
-            from datetime import datetime
             try:
                 # Convert timestamp to readable format
                 dt = datetime.fromisoformat(str(timestamp).replace('Z', '+00:00'))
@@ -155,12 +122,9 @@ async def view_more_transactions(callback: CallbackQuery, _: callable):
             
             if sender_id == user_id:
                 # Outgoing tip
-                recipient_data = await get_user_by_id(recipient_id)
-                recipient_name = "Unknown"
-                if recipient_data:
-                    username = recipient_data.get("username", "")
-                    name = recipient_data.get("first_name", "")
-                    recipient_name = f"@{username}" if username else name or f"User {recipient_id}"
+                recipient_name = display_name(
+                    recipient_id, tx.get("recipient_username"), tx.get("recipient_first_name")
+                )
                 
                 tx_message += _("outgoing_tip").format(
                     amount=amount,
@@ -170,12 +134,9 @@ async def view_more_transactions(callback: CallbackQuery, _: callable):
                 ) + "\n\n"
             else:
                 # Incoming tip
-                sender_data = await get_user_by_id(sender_id)
-                sender_name = "Unknown"
-                if sender_data:
-                    username = sender_data.get("username", "")
-                    name = sender_data.get("first_name", "")
-                    sender_name = f"@{username}" if username else name or f"User {sender_id}"
+                sender_name = display_name(
+                    sender_id, tx.get("sender_username"), tx.get("sender_first_name")
+                )
                 
                 tx_message += _("incoming_tip").format(
                     amount=amount,
@@ -192,7 +153,7 @@ async def view_more_transactions(callback: CallbackQuery, _: callable):
             ) + "\n\n"
         
         elif tx_type == "withdraw":
-            destination = tx.get("recipient_wallet", _("external_wallet"))
+            destination = tx.get("recipient_wallet") or _("external_wallet")
             tx_message += _("withdraw_tx").format(
                 amount=amount,
                 destination=destination[:6] + "..." + destination[-4:] if len(destination) > 10 else destination,
@@ -209,27 +170,23 @@ async def view_more_transactions(callback: CallbackQuery, _: callable):
                 tx_hash=tx_hash[:6] + "..." + tx_hash[-4:]
             ) + "\n\n"
     
-    # Send additional transactions
-    await callback.message.answer(
-        tx_message,
-        parse_mode="HTML"
-    )
-    
-    await callback.answer()
+    return tx_message
 
-def get_transaction_keyboard(_):
-    """Create inline keyboard for transactions."""
-    from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+def get_transaction_keyboard(_, transactions: list, has_newer: bool, has_older: bool) -> Optional[InlineKeyboardMarkup]:
+    """Create newer/older paging buttons for a page of transactions."""
+    buttons = []
+    if has_newer:
+        buttons.append(InlineKeyboardButton(
+            text=_("newer_transactions"),
+            callback_data=f"tx_newer_{encode_cursor(transactions[0])}"
+        ))
+    if has_older:
+        buttons.append(InlineKeyboardButton(
+            text=_("older_transactions"),
+            callback_data=f"tx_older_{encode_cursor(transactions[-1])}"
+        ))
     
-    keyboard = InlineKeyboardMarkup(
-        inline_keyboard=[
-            [
-                InlineKeyboardButton(
-                    text=_("view_more"),
-                    callback_data="view_more_transactions"
-                )
-            ]
-        ]
-    )
+    if not buttons:
+        return None
     
-    return keyboard
+    return InlineKeyboardMarkup(inline_keyboard=[buttons])
@@ -4,10 +4,19 @@ from aiogram.types import Message, CallbackQuery
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
+from web3 import Web3
 
 from bot.config import settings
-from bot.services.blockchain import check_wallet_exists, get_token_balance
-from bot.services.database import get_user_wallet
+from bot.services.blockchain import check_wallet_exists
+from bot.services.database import get_user_wallet, InsufficientBalanceError
+from bot.services.balances import balance_service
+from bot.services.ledger import ledger_enabled, netting_job, request_withdrawal
+from bot.services.settlement import settlement_queue
+from bot.utils.address import checksum_address
+from bot.utils.amount import TokenAmount
+from bot.utils.idempotency import generate_idempotency_key
+from bot.services.tracker import receipt_tracker
+from bot.services.txlog import transaction_writer
 from bot.keyboards.inline import get_wallet_menu_keyboard
 
 # Initialize router
@@ -34,7 +43,7 @@ async def command_wallet(message: Message, _: callable, state: FSMContext):
         return
     
     # Get token balance
-    balance = await get_token_balance(wallet_address)
+    balance = await balance_service.get(user_id, wallet_address)
     
     # Format wallet address for display (first 6 and last 4 chars)
     formatted_address = f"{wallet_address[:6]}...{wallet_address[-4:]}"
@@ -86,9 +95,9 @@ async def wallet_withdraw(callback: CallbackQuery, _: callable, state: FSMContex
         return
     
     # Get token balance
-    balance = await get_token_balance(wallet_address)
+    balance = await balance_service.get(user_id, wallet_address)
     
-    if balance <= 0:
+    if not balance:
         await callback.message.edit_text(_("insufficient_balance_withdraw").format(balance=balance))
         await callback.answer()
         return
@@ -101,7 +110,7 @@ async def wallet_withdraw(callback: CallbackQuery, _: callable, state: FSMContex
     
     # Set state
     await state.set_state(WalletStates.waiting_for_withdraw_address)
-    await state.update_data(balance=str(balance))
+    await state.update_data(balance=balance.raw)
     
     await callback.answer()
 
@@ -110,17 +119,18 @@ async def process_withdraw_address(message: Message, _: callable, state: FSMCont
     """Process withdrawal destination address."""
     destination_address = message.text.strip()
     
-    # Basic validation of address format
-    if not destination_address.startswith("0x") or len(destination_address) != 42:
+    # Rejects malformed hex and mixed-case addresses with a bad checksum
+    if not Web3.is_address(destination_address):
         await message.answer(_("invalid_address_format"))
         return
+    destination_address = checksum_address(destination_address)
     
     # Save address to state
     await state.update_data(destination_address=destination_address)
     
     # Get balance from state
     data = await state.get_data()
-    balance = data.get("balance")
+    balance = TokenAmount(data.get("balance", 0))
     
     # Ask for amount
     await message.answer(
@@ -137,18 +147,18 @@ async def process_withdraw_address(message: Message, _: callable, state: FSMCont
 async def process_withdraw_amount(message: Message, _: callable, state: FSMContext):
     """Process withdrawal amount."""
     try:
-        amount = float(message.text.strip())
+        amount = TokenAmount.parse(message.text or "")
     except ValueError:
         await message.answer(_("invalid_amount"))
         return
     
     # Get data from state
     data = await state.get_data()
-    balance = float(data.get("balance", "0"))
+    balance = TokenAmount(data.get("balance", 0))
     destination_address = data.get("destination_address")
     
     # Validate amount
-    if amount <= 0:
+    if not amount:
         await message.answer(_("amount_must_be_positive"))
         return
     
@@ -157,7 +167,10 @@ async def process_withdraw_amount(message: Message, _: callable, state: FSMConte
         return
     
     # Save amount to state
-    await state.update_data(amount=str(amount))
+    await state.update_data(
+        amount=amount.raw,
+        idempotency_key=await generate_idempotency_key()
+    )
     
     # Ask for confirmation
     await message.answer(
@@ -173,14 +186,15 @@ async def process_withdraw_amount(message: Message, _: callable, state: FSMConte
     await state.set_state(WalletStates.waiting_for_withdraw_confirmation)
 
 @router.callback_query(F.data == "confirm_withdraw", WalletStates.waiting_for_withdraw_confirmation)
-async def confirm_withdraw(callback: CallbackQuery, _: callable, state: FSMContext):
+async def confirm_withdraw(callback: CallbackQuery, _: callable, state: FSMContext, user_lang: str):
     """Handle withdrawal confirmation."""
     user_id = callback.from_user.id
     
     # Get data from state
     data = await state.get_data()
-    amount = data.get("amount")
+    amount = TokenAmount(data.get("amount"))
     destination_address = data.get("destination_address")
+    idempotency_key = data.get("idempotency_key")
     
     # Show processing message
     await callback.message.edit_text(_("processing_withdraw"), reply_markup=None)
@@ -189,33 +203,111 @@ async def confirm_withdraw(callback: CallbackQuery, _: callable, state: FSMConte
         # Get user's wallet
         wallet_address = await get_user_wallet(user_id)
         
-        # Perform withdrawal (implementation in blockchain.py)
-        from bot.services.blockchain import withdraw_tokens
-        tx_hash = await withdraw_tokens(
-            wallet_address=wallet_address,
-            destination_address=destination_address,
-            amount=float(amount)
-        )
-        
-        # Save transaction to database
-        from bot.services.database import save_transaction
-        await save_transaction(
-            sender_id=user_id,
-            recipient_id=None,  # External withdrawal
-            amount=float(amount),
-            tx_hash=tx_hash,
-            tx_type="withdraw"
-        )
+        if ledger_enabled():
+            # Debit the ledger; settlement happens outside this update
+            transaction_id = await request_withdrawal(
+                user_id=user_id,
+                wallet_address=wallet_address,
+                destination_address=destination_address,
+                amount=amount,
+                idempotency_key=idempotency_key
+            )
+            if transaction_id is None:
+                await callback.message.edit_text(_("transaction_already_processed"))
+                await state.clear()
+                await callback.answer()
+                return
+            
+            if not settlement_queue.enabled:
+                # Netted in the background; edit the message once a transfer paying
+                # it confirms (a reverted transfer is planned and sent again)
+                netting_job.watch(
+                    transaction_id,
+                    chat_id=callback.message.chat.id,
+                    message_id=callback.message.message_id,
+                    lang=user_lang,
+                    success_key="withdraw_success",
+                    on_receipt=lambda receipt: balance_service.invalidate(user_id),
+                    amount=amount,
+                    destination=destination_address
+                )
+                await balance_service.invalidate(user_id)
+                await callback.message.edit_text(
+                    _("withdraw_queued").format(amount=amount, destination=destination_address),
+                    parse_mode="HTML"
+                )
+                await state.clear()
+                await callback.answer()
+                return
+            
+            # The ledger balance dropped as soon as the withdrawal was debited
+            await balance_service.invalidate(user_id)
+            try:
+                tx_hash = await settlement_queue.submit(transaction_id)
+            except Exception as e:
+                # Still debited and queued; a later batch pays it
+                logging.warning(f"Withdrawal {transaction_id} wasn't sent in this batch: {e}")
+                await callback.message.edit_text(
+                    _("withdraw_queued").format(amount=amount, destination=destination_address),
+                    parse_mode="HTML"
+                )
+                await state.clear()
+                await callback.answer()
+                return
+            # A reverted batch credits the withdrawal back to the ledger
+            failure_key = "withdraw_refunded"
+        else:
+            failure_key = "withdraw_failed"
+            
+            # Perform withdrawal (implementation in blockchain.py)
+            from bot.services.blockchain import withdraw_tokens
+            tx_hash = await withdraw_tokens(
+                user_id=user_id,
+                destination_address=destination_address,
+                amount=amount
+            )
+            
+            # Save transaction as pending until the receipt tracker resolves it
+            await transaction_writer.save(
+                sender_id=user_id,
+                recipient_id=None,  # External withdrawal
+                amount=amount.raw,
+                tx_hash=tx_hash,
+                tx_type="withdraw",
+                status="pending",
+                idempotency_key=idempotency_key
+            )
         
-        # Send success message
+        # Send pending message
         await callback.message.edit_text(
-            _("withdraw_success").format(
+            _("withdraw_pending").format(
                 amount=amount,
                 destination=destination_address,
                 tx_hash=tx_hash
             ),
             parse_mode="HTML"
         )
+        
+        # Edit the message again once the withdrawal confirms or fails, and drop
+        # the cached balance
+        receipt_tracker.track(
+            tx_hash,
+            chat_id=callback.message.chat.id,
+            message_id=callback.message.message_id,
+            lang=user_lang,
+            success_key="withdraw_success",
+            failure_key=failure_key,
+            on_receipt=lambda receipt: balance_service.invalidate(user_id),
+            amount=amount,
+            destination=destination_address
+        )
+    
+    except InsufficientBalanceError:
+        balance = await balance_service.get(user_id, wallet_address, max_age=0)
+        await callback.message.edit_text(
+            _("insufficient_balance_withdraw").format(balance=balance),
+            reply_markup=None
+        )
     
     except Exception as e:
         logging.error(f"Error processing withdrawal for user {user_id}: {e}")
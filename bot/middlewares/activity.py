@@ -0,0 +1,22 @@
+from typing import Callable, Dict, Any, Awaitable, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, User
+
+from bot.services.activity import activity_buffer
+
+class ActivityMiddleware(BaseMiddleware):
+    """Middleware recording user activity in the write-behind buffer."""
+    
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        """Process middleware logic."""
+        user: Optional[User] = data.get("event_from_user")
+        if user and not user.is_bot:
+            activity_buffer.touch(user.id, user.username, user.first_name, user.last_name)
+        
+        return await handler(event, data)
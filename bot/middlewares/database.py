@@ -0,0 +1,41 @@
+import logging
+import time
+from typing import Callable, Dict, Any, Awaitable
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+from bot.config import settings
+from bot.services.database import update_scope
+
+class DatabaseMiddleware(BaseMiddleware):
+    """Middleware giving each update one database session.
+    
+    Database helpers called while the update is handled (including by other
+    middlewares) share the session and its connection instead of each
+    checking out their own. The number of queries per update is logged.
+    """
+    
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        """Process middleware logic."""
+        started = time.monotonic()
+        
+        async with update_scope() as scope:
+            data["db"] = scope
+            try:
+                return await handler(event, data)
+            finally:
+                elapsed = (time.monotonic() - started) * 1000
+                update_id = event.update_id if isinstance(event, Update) else None
+                
+                if scope.query_count > settings.DB_QUERY_WARN_THRESHOLD:
+                    logging.warning(
+                        f"Update {update_id} ran {scope.query_count} queries in {elapsed:.0f}ms"
+                    )
+                else:
+                    logging.debug(f"Update {update_id} ran {scope.query_count} queries in {elapsed:.0f}ms")
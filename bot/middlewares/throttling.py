@@ -1,19 +1,22 @@
-import time
-from typing import Callable, Dict, Any, Awaitable
+import math
+from typing import Callable, Dict, Any, Awaitable, List, Optional
 
 from aiogram import BaseMiddleware
-from aiogram.types import TelegramObject, Message, CallbackQuery
-from cachetools import TTLCache
+from aiogram.types import TelegramObject, Update, User, Chat
 
 from bot.config import settings
+from bot.services.ratelimit import Limit, rate_limiter
+from bot.utils.i18n import get_translation_for_language
 
 class ThrottlingMiddleware(BaseMiddleware):
-    """Middleware for rate limiting user requests."""
+    """Middleware for rate limiting user requests.
     
-    def __init__(self):
-        # Use TTLCache to automatically expire old entries
-        # The cache stores (user_id, command) keys with timestamps as values
-        self.cache = TTLCache(maxsize=10000, ttl=settings.COMMAND_COOLDOWN)
+    Registered first on updates, so commands and callbacks of every type
+    share one set of budgets: per user, per group chat and per user command.
+    A rejected update costs one rate limiter round trip and never reaches
+    the database; the notice is translated from the user's Telegram
+    language instead of their stored one.
+    """
     
     async def __call__(
         self,
@@ -22,40 +25,44 @@ class ThrottlingMiddleware(BaseMiddleware):
         data: Dict[str, Any]
     ) -> Any:
         """Process middleware logic."""
-        # Skip throttling for admins
-        user_id = None
-        command = None
+        user: Optional[User] = data.get("event_from_user")
+        chat: Optional[Chat] = data.get("event_chat")
         
-        # Extract user_id and command from different event types
-        if isinstance(event, Message) and event.text:
-            user_id = event.from_user.id
-            command = event.text.split()[0] if event.text.startswith('/') else None
-        elif isinstance(event, CallbackQuery):
-            user_id = event.from_user.id
-            command = event.data if event.data else None
+        # Extract the command from messages and callbacks
+        command = None
+        if isinstance(event, Update):
+            if event.message and event.message.text and event.message.text.startswith("/"):
+                command = event.message.text.split()[0].split("@")[0]
+            elif event.callback_query and event.callback_query.data:
+                command = event.callback_query.data
         
-        # Skip if not a command or user_id not found
-        if not user_id or not command or user_id in settings.ADMINS:
+        # Skip if not a command or user not found, and never throttle admins
+        if not user or not command or user.id in settings.ADMINS:
             return await handler(event, data)
         
-        # Create a unique key for this user and command
-        key = (user_id, command)
-        
-        # Check if user is throttled
-        current_time = time.time()
-        if key in self.cache:
-            last_time = self.cache[key]
-            remaining = settings.COMMAND_COOLDOWN - (current_time - last_time)
-            
-            if remaining > 0:
-                # If throttled, notify the user
-                if isinstance(event, Message):
-                    _ = data.get("_", lambda x: x)
-                    await event.answer(_("throttling_message").format(seconds=int(remaining)))
-                return None
-        
-        # Update the cache with the current time
-        self.cache[key] = current_time
+        retry_after = await rate_limiter.hit(self.get_limits(user, chat, command))
+        if not retry_after:
+            return await handler(event, data)
         
-        # Continue processing
-        return await handler(event, data)
+        # Tell the user when to try again
+        _ = get_translation_for_language(user.language_code)
+        text = _("throttling_message").format(seconds=math.ceil(retry_after))
+        if event.message:
+            await event.message.answer(text)
+        elif event.callback_query:
+            await event.callback_query.answer(text)
+        return None
+    
+    @staticmethod
+    def get_limits(user: User, chat: Optional[Chat], command: str) -> List[Limit]:
+        """Budgets an event from this user, chat and command is charged to."""
+        limits = [
+            (f"user:{user.id}", settings.RATE_LIMIT_USER_EVENTS, settings.RATE_LIMIT_USER_PERIOD),
+            (f"cmd:{user.id}:{command}", 1, settings.COMMAND_COOLDOWN),
+        ]
+        # A private chat is the user's own budget
+        if chat and chat.type != "private":
+            limits.append(
+                (f"chat:{chat.id}", settings.RATE_LIMIT_CHAT_EVENTS, settings.RATE_LIMIT_CHAT_PERIOD)
+            )
+        return limits
@@ -0,0 +1,74 @@
+import asyncio
+import logging
+from datetime import datetime
+from typing import Dict, Any, Optional
+
+from bot.config import settings
+from bot.services.database import update_user_activity
+
+class ActivityBuffer:
+    """Write-behind buffer for users' last_active times and profile changes.
+    
+    Incoming updates only record the user in memory. The buffer is written
+    every ACTIVITY_FLUSH_INTERVAL seconds as one bulk UPDATE, so an active
+    user's row is written at most once per interval instead of once per
+    message. Activity that hasn't been flushed yet is lost if the process
+    dies, which is acceptable for this data.
+    """
+    
+    def __init__(self):
+        self._pending: Dict[int, Dict[str, Any]] = {}
+        self._task: Optional[asyncio.Task] = None
+    
+    async def start(self) -> None:
+        """Start flushing the buffer periodically."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+    
+    async def stop(self) -> None:
+        """Stop the flush loop and write what is still buffered."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+    
+    def touch(
+        self,
+        user_id: int,
+        username: Optional[str] = None,
+        first_name: Optional[str] = None,
+        last_name: Optional[str] = None
+    ) -> None:
+        """Record that a user was active, keeping only their latest profile."""
+        self._pending[user_id] = {
+            "last_active": datetime.utcnow(),
+            "username": username,
+            "first_name": first_name,
+            "last_name": last_name,
+        }
+    
+    async def flush(self) -> None:
+        """Write the buffered activity to the database."""
+        if not self._pending:
+            return
+        
+        pending, self._pending = self._pending, {}
+        try:
+            await update_user_activity(pending)
+        except Exception as e:
+            logging.error(f"Error flushing activity for {len(pending)} users: {e}")
+            # Put the entries back unless the user was seen again meanwhile
+            for user_id, entry in pending.items():
+                self._pending.setdefault(user_id, entry)
+    
+    async def _run(self) -> None:
+        """Flush the buffer every ACTIVITY_FLUSH_INTERVAL seconds."""
+        while True:
+            await asyncio.sleep(settings.ACTIVITY_FLUSH_INTERVAL)
+            await self.flush()
+
+activity_buffer = ActivityBuffer()
@@ -0,0 +1,107 @@
+import asyncio
+import logging
+import time
+from typing import Dict, Optional
+
+from bot.config import settings
+from bot.services.cache import Cache, balance_cache
+from bot.services.ledger import get_spendable_balance
+from bot.utils.amount import TokenAmount
+
+class BalanceService:
+    """Spendable balances shared by all handlers.
+
+    Balances are cached for BALANCE_CACHE_TTL seconds. A cached balance
+    older than BALANCE_FRESH_SECONDS is still returned right away, and a
+    refresh is started in the background (stale-while-revalidate).
+    Concurrent lookups for the same user share one in-flight read, so a
+    burst of /balance calls costs a single balanceOf.
+    """
+
+    def __init__(self, cache: Cache):
+        self._cache = cache
+        self._inflight: Dict[int, asyncio.Task] = {}
+
+        # Read statistics
+        self.reads = 0
+        self.coalesced = 0
+        self.stale_served = 0
+
+    async def get(self, user_id: int, wallet_address: str, max_age: Optional[float] = None) -> TokenAmount:
+        """Get a user's spendable balance.
+
+        Args:
+            user_id: The user's ID
+            wallet_address: The user's wallet address
+            max_age: Oldest cached value to accept, in seconds. When given,
+                older values are re-read instead of served stale; pass 0
+                to always read the current balance.
+        """
+        cached = await self._cache.get(self._key(user_id))
+        if cached is not None:
+            raw, fetched_at = cached
+            age = time.time() - fetched_at
+            if age <= (settings.BALANCE_FRESH_SECONDS if max_age is None else max_age):
+                return TokenAmount(raw)
+
+            if max_age is None:
+                self._refresh(user_id, wallet_address)
+                self.stale_served += 1
+                return TokenAmount(raw)
+
+        # Shielded so a caller giving up doesn't cancel the read for the others
+        return await asyncio.shield(self._refresh(user_id, wallet_address))
+
+    async def invalidate(self, *user_ids: int) -> None:
+        """Drop cached balances, e.g. after a transfer changed them."""
+        for user_id in user_ids:
+            # A read that is already running may predate the change, so it
+            # must not write its result back
+            self._inflight.pop(user_id, None)
+        await self._cache.delete(*(self._key(user_id) for user_id in user_ids))
+
+    def stats(self) -> Dict[str, int]:
+        """How many balance reads were made, coalesced and served stale."""
+        return {
+            "reads": self.reads,
+            "coalesced": self.coalesced,
+            "stale_served": self.stale_served,
+            "in_flight": len(self._inflight),
+        }
+
+    @staticmethod
+    def _key(user_id: int) -> str:
+        return f"balance:{user_id}"
+
+    def _refresh(self, user_id: int, wallet_address: str) -> asyncio.Task:
+        """Start reading a user's balance unless a read is already in flight."""
+        task = self._inflight.get(user_id)
+        if task is not None:
+            self.coalesced += 1
+            return task
+
+        task = asyncio.create_task(self._read(user_id, wallet_address))
+        task.add_done_callback(self._log_failure)
+        self._inflight[user_id] = task
+        return task
+
+    async def _read(self, user_id: int, wallet_address: str) -> TokenAmount:
+        """Read a balance and cache it."""
+        task = asyncio.current_task()
+        try:
+            self.reads += 1
+            balance = await get_spendable_balance(user_id, wallet_address)
+            if self._inflight.get(user_id) is task:
+                await self._cache.set(self._key(user_id), [balance.raw, time.time()])
+            return balance
+        finally:
+            if self._inflight.get(user_id) is task:
+                del self._inflight[user_id]
+
+    @staticmethod
+    def _log_failure(task: asyncio.Task) -> None:
+        """Log failed reads, including background refreshes nobody awaits."""
+        if not task.cancelled() and task.exception() is not None:
+            logging.error(f"Error reading balance: {task.exception()}")
+
+balance_service = BalanceService(balance_cache)
@@ -1,21 +1,32 @@
+import asyncio
 import logging
 import json
 import secrets
-from decimal import Decimal
-from typing import Tuple, Optional, Dict, Any
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from typing import AsyncIterator, Tuple, Optional, Dict, Any, Iterable, List
 
+from eth_abi import decode as abi_decode
 from eth_account import Account
 from eth_account.signers.local import LocalAccount
-import web3
-from web3 import Web3
-from web3.middleware import geth_poa_middleware
+from web3 import AsyncWeb3, Web3
+from web3.exceptions import TransactionNotFound
+from web3.middleware import ExtraDataToPOAMiddleware
 
 from bot.config import settings
-from bot.services.database import get_user_private_key
+from bot.services.crypto import keypair_pool, sign_transaction
+from bot.services.database import get_user_private_key, get_user_wallet, get_indexed_balance
+from bot.services.fees import FeeOracle
+from bot.services.rpc import RPCPool, PooledHTTPProvider
+from bot.utils.address import checksum_address
+from bot.utils.amount import TokenAmount, ZERO
 
-# Initialize Web3 connection to Polygon
-w3 = Web3(Web3.HTTPProvider(settings.POLYGON_RPC_URL))
-w3.middleware_onion.inject(geth_poa_middleware, layer=0)
+# Initialize async Web3 connection to Polygon
+# Every request is routed through a pool of RPC endpoints that share one
+# keep-alive HTTP session, opened in init_blockchain()
+rpc_pool = RPCPool(settings.rpc_urls)
+w3 = AsyncWeb3(PooledHTTPProvider(rpc_pool))
+w3.middleware_onion.inject(ExtraDataToPOAMiddleware, layer=0)
 
 # Load TIP token ABI
 # This is a simplified ERC20 ABI with just the methods we need
@@ -44,38 +55,309 @@ TOKEN_ABI = json.loads('''
         "name": "decimals",
         "outputs": [{"name": "", "type": "uint8"}],
         "type": "function"
+    },
+    {
+        "constant": true,
+        "inputs": [
+            {"name": "_owner", "type": "address"},
+            {"name": "_spender", "type": "address"}
+        ],
+        "name": "allowance",
+        "outputs": [{"name": "", "type": "uint256"}],
+        "type": "function"
+    },
+    {
+        "constant": false,
+        "inputs": [
+            {"name": "_spender", "type": "address"},
+            {"name": "_value", "type": "uint256"}
+        ],
+        "name": "approve",
+        "outputs": [{"name": "", "type": "bool"}],
+        "type": "function"
+    }
+]
+''')
+
+# Multicall3 ABI with just aggregate3, used to batch read-only calls
+MULTICALL3_ABI = json.loads('''
+[
+    {
+        "inputs": [
+            {
+                "components": [
+                    {"name": "target", "type": "address"},
+                    {"name": "allowFailure", "type": "bool"},
+                    {"name": "callData", "type": "bytes"}
+                ],
+                "name": "calls",
+                "type": "tuple[]"
+            }
+        ],
+        "name": "aggregate3",
+        "outputs": [
+            {
+                "components": [
+                    {"name": "success", "type": "bool"},
+                    {"name": "returnData", "type": "bytes"}
+                ],
+                "name": "returnData",
+                "type": "tuple[]"
+            }
+        ],
+        "stateMutability": "payable",
+        "type": "function"
     }
 ]
 ''')
 
+# Disperse ABI with just disperseToken, used to batch outgoing hot wallet transfers
+DISPERSE_ABI = json.loads('''
+[
+    {
+        "inputs": [
+            {"name": "token", "type": "address"},
+            {"name": "recipients", "type": "address[]"},
+            {"name": "values", "type": "uint256[]"}
+        ],
+        "name": "disperseToken",
+        "outputs": [],
+        "stateMutability": "nonpayable",
+        "type": "function"
+    }
+]
+''')
+
+# Initialize Multicall3 contract (deployed at the same address on most EVM chains)
+multicall_contract = w3.eth.contract(
+    address=Web3.to_checksum_address(settings.MULTICALL3_ADDRESS),
+    abi=MULTICALL3_ABI
+)
+
+# Initialize Disperse contract for batched transfers from the hot wallet
+disperse_contract = w3.eth.contract(
+    address=Web3.to_checksum_address(settings.DISPERSE_CONTRACT_ADDRESS),
+    abi=DISPERSE_ABI
+)
+
 # Initialize token contract
 try:
     token_contract = w3.eth.contract(
         address=Web3.to_checksum_address(settings.TIP_TOKEN_ADDRESS),
         abi=TOKEN_ABI
     )
-    # Get token decimals
-    TOKEN_DECIMALS = 18  # Default to 18 if not specified in contract
-    try:
-        TOKEN_DECIMALS = token_contract.functions.decimals().call()
-    except Exception as e:
-        logging.warning(f"Could not get token decimals, using default: {e}")
 except Exception as e:
     logging.error(f"Error initializing token contract: {e}")
     token_contract = None
 
+async def init_blockchain() -> None:
+    """Open the shared RPC connection pool and check the token metadata."""
+    await rpc_pool.open()
+    
+    if token_contract:
+        try:
+            decimals = await token_contract.functions.decimals().call()
+        except Exception as e:
+            logging.warning(f"Could not get token decimals, assuming {settings.TOKEN_DECIMALS}: {e}")
+        else:
+            # Stored amounts are base units, so a mismatch would misprice everything
+            if decimals != settings.TOKEN_DECIMALS:
+                raise ValueError(
+                    f"Token has {decimals} decimals but TOKEN_DECIMALS is {settings.TOKEN_DECIMALS}"
+                )
+    
+    await fee_oracle.start()
+
+async def close_blockchain() -> None:
+    """Finish batched RPC calls in flight and close the shared RPC connection pool."""
+    await fee_oracle.stop()
+    await w3.provider.disconnect()
+
+# RPC error fragments that mean our local nonce is out of sync with the node
+NONCE_ERRORS = (
+    "nonce too low",
+    "replacement transaction underpriced",
+)
+
+# RPC error fragments that mean this exact transaction is already in the mempool
+ALREADY_KNOWN_ERRORS = (
+    "already known",
+    "known transaction",
+)
+
+def is_nonce_error(error: Exception) -> bool:
+    """Check whether an RPC error was caused by a stale nonce."""
+    message = str(error).lower()
+    return any(fragment in message for fragment in NONCE_ERRORS)
+
+class NonceManager:
+    """Allocate transaction nonces per sender address from a local counter.
+    
+    Each address is seeded once from the chain with the `pending` tag and then
+    counted locally, so consecutive transfers from one wallet don't pay a
+    `get_transaction_count` round trip and never reuse a nonce.
+    """
+    
+    def __init__(self):
+        self._next_nonce: Dict[str, int] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+    
+    @asynccontextmanager
+    async def reserve(self, address: str) -> AsyncIterator[int]:
+        """Reserve the next nonce for an address while a transaction is sent.
+        
+        The address lock is held for the duration of the block, and the
+        counter only advances if the block exits without an error.
+        """
+        lock = self._locks.setdefault(address, asyncio.Lock())
+        async with lock:
+            nonce = self._next_nonce.get(address)
+            if nonce is None:
+                nonce = await w3.eth.get_transaction_count(address, "pending")
+            
+            try:
+                yield nonce
+            except Exception as e:
+                if is_nonce_error(e):
+                    # Resync from the chain on the next reservation
+                    self._next_nonce.pop(address, None)
+                else:
+                    self._next_nonce[address] = nonce
+                raise
+            
+            self._next_nonce[address] = nonce + 1
+    
+    def reset(self, address: str) -> None:
+        """Forget the local counter so it is reseeded from the chain."""
+        self._next_nonce.pop(address, None)
+
+nonce_manager = NonceManager()
+fee_oracle = FeeOracle(w3)
+
+# A transfer costs the most when it takes the recipient's balance from zero
+# (a fresh storage slot), so transfer gas limits are estimated against an
+# address that holds no tokens and cached per method rather than per
+# recipient, whose balance may drop to zero later
+_EMPTY_RECIPIENT = checksum_address("0x" + secrets.token_hex(20))
+
+def _worst_case_transfer() -> Any:
+    """A one base unit transfer to an empty address, to estimate transfer gas with."""
+    return token_contract.functions.transfer(_EMPTY_RECIPIENT, 1)
+
+async def _sign_contract_transaction(
+    contract_call: Any,
+    sender_address: str,
+    private_key: str,
+    nonce: int,
+    gas_cache_key: Optional[Any] = None,
+    default_gas: Optional[int] = None,
+    gas_call: Optional[Any] = None
+) -> Any:
+    """Build and sign a contract call from a custodial wallet at a given nonce.
+    
+    Builds an EIP-1559 (type 2) transaction from the fee oracle's cached
+    estimates. The gas limit is estimated from `gas_call` when given, a
+    worst case of `contract_call` whose estimate can be cached.
+    
+    Returns:
+        The signed transaction, with its `hash` and `raw_transaction`
+    """
+    chain_id, (max_fee, priority_fee), gas = await asyncio.gather(
+        fee_oracle.chain_id(),
+        fee_oracle.current_fees(),
+        fee_oracle.estimate_gas(gas_call or contract_call, sender_address, gas_cache_key, default_gas)
+    )
+    
+    tx = await contract_call.build_transaction({
+        'type': 2,
+        'chainId': chain_id,
+        'gas': gas,
+        'maxFeePerGas': max_fee,
+        'maxPriorityFeePerGas': priority_fee,
+        'nonce': nonce,
+    })
+    return await sign_transaction(tx, private_key)
+
+async def broadcast_transaction(raw_transaction: bytes) -> str:
+    """Send a signed transaction; confirmation is followed by the receipt tracker.
+    
+    Returns:
+        str: Transaction hash of the broadcast transaction
+    """
+    try:
+        await w3.eth.send_raw_transaction(raw_transaction)
+    except Exception as e:
+        # A resubmission of a transaction the node already has
+        # (e.g. after an RPC timeout) has still been broadcast
+        if not any(fragment in str(e).lower() for fragment in ALREADY_KNOWN_ERRORS):
+            raise
+    return Web3.to_hex(Web3.keccak(raw_transaction))
+
+async def _send_contract_transaction(
+    contract_call: Any,
+    sender_address: str,
+    private_key: str,
+    gas_cache_key: Optional[Any] = None,
+    default_gas: Optional[int] = None,
+    gas_call: Optional[Any] = None
+) -> str:
+    """Build, sign and broadcast a contract call from a custodial wallet.
+    
+    Retries once with a resynced nonce if the node reports a nonce conflict.
+    
+    Returns:
+        str: Transaction hash of the broadcast transaction
+    """
+    for attempt in range(2):
+        try:
+            async with nonce_manager.reserve(sender_address) as nonce:
+                signed_tx = await _sign_contract_transaction(
+                    contract_call, sender_address, private_key, nonce, gas_cache_key, default_gas, gas_call
+                )
+                return await broadcast_transaction(signed_tx.raw_transaction)
+        except Exception as e:
+            if attempt == 0 and is_nonce_error(e):
+                logging.warning(f"Nonce conflict for {sender_address}, resyncing: {e}")
+                continue
+            raise
+
+async def ensure_broadcast(tx_hash: str, raw_transaction: bytes, sender_address: str, nonce: int) -> bool:
+    """Make sure a recorded signed transaction reaches the network.
+    
+    The same signed bytes are sent again if the node doesn't know the
+    transaction, so it is never replaced by a different one.
+    
+    Returns:
+        bool: True if the transaction is mined or in the mempool, False if
+            another transaction used its nonce, so it can never be mined
+    """
+    try:
+        await w3.eth.get_transaction(tx_hash)
+        return True
+    except TransactionNotFound:
+        pass
+    
+    if await w3.eth.get_transaction_count(sender_address, "latest") > nonce:
+        # It may have been mined in the meantime
+        try:
+            await w3.eth.get_transaction(tx_hash)
+            return True
+        except TransactionNotFound:
+            return False
+    
+    await broadcast_transaction(raw_transaction)
+    return True
+
 async def create_wallet() -> Tuple[str, str]:
     """Create a new Ethereum/Polygon wallet.
     
+    Taken from the pre-generated keypair pool, so no key derivation runs on
+    the event loop.
+    
     Returns:
         Tuple[str, str]: (wallet_address, private_key)
     """
-    # Generate a secure random private key
-    private_key = "0x" + secrets.token_hex(32)
-    account: LocalAccount = Account.from_key(private_key)
-    wallet_address = account.address
-    
-    return wallet_address, private_key
+    return await keypair_pool.pop()
 
 async def check_wallet_exists(wallet_address: str) -> bool:
     """Check if a wallet exists on the blockchain."""
@@ -84,7 +366,7 @@ async def check_wallet_exists(wallet_address: str) -> bool:
             return False
         
         # Check if the address is valid
-        wallet_address = Web3.to_checksum_address(wallet_address)
+        wallet_address = checksum_address(wallet_address)
         
         # Check if address has any transactions or balance
         # This is a simple check that the address is valid format
@@ -93,101 +375,195 @@ async def check_wallet_exists(wallet_address: str) -> bool:
         logging.error(f"Error checking wallet existence: {e}")
         return False
 
-async def get_token_balance(wallet_address: str) -> Decimal:
-    """Get TIP token balance for a wallet."""
+async def get_token_balance(wallet_address: str) -> TokenAmount:
+    """Get TIP token balance for a wallet.
+    
+    Served from the indexed wallet_balances table when the transfer indexer
+    is enabled and tracks the wallet, otherwise read from the chain.
+    """
     try:
         if not token_contract or not wallet_address:
-            return Decimal('0')
+            return ZERO
         
         # Convert address to checksum format
-        wallet_address = Web3.to_checksum_address(wallet_address)
+        wallet_address = checksum_address(wallet_address)
         
-        # Call the balanceOf function
-        balance_wei = token_contract.functions.balanceOf(wallet_address).call()
+        if settings.USE_INDEXER:
+            balance_wei = await get_indexed_balance(wallet_address)
+            if balance_wei is not None:
+                return TokenAmount(balance_wei)
         
-        # Convert from wei to token units
-        balance = Decimal(balance_wei) / Decimal(10 ** TOKEN_DECIMALS)
+        # Call the balanceOf function
+        balance_wei = await token_contract.functions.balanceOf(wallet_address).call()
         
-        return balance
+        return TokenAmount(balance_wei)
     except Exception as e:
         logging.error(f"Error getting token balance: {e}")
-        return Decimal('0')
+        return ZERO
+
+async def get_token_balances(
+    addresses: Iterable[str],
+    block_identifier: Optional[Any] = None
+) -> Dict[str, TokenAmount]:
+    """Get TIP token balances for many wallets using batched Multicall3 reads.
+    
+    Addresses are packed into `aggregate3` calls of MULTICALL_CHUNK_SIZE
+    `balanceOf` calls each, and the chunks run concurrently. If a whole chunk
+    fails its addresses are read one by one instead; addresses whose
+    individual call fails are left out of the result. Balances are read at
+    `block_identifier`, or the latest block if it isn't given.
+    
+    Returns:
+        Dict[str, TokenAmount]: Balances keyed by checksummed wallet address
+    """
+    if not token_contract:
+        return {}
+    
+    # Normalize and deduplicate while keeping order
+    unique_addresses = list(dict.fromkeys(
+        checksum_address(address) for address in addresses if address
+    ))
+    
+    chunk_size = settings.MULTICALL_CHUNK_SIZE
+    chunks = [
+        unique_addresses[i:i + chunk_size]
+        for i in range(0, len(unique_addresses), chunk_size)
+    ]
+    results = await asyncio.gather(*(_get_balances_chunk(chunk, block_identifier) for chunk in chunks))
+    
+    balances: Dict[str, TokenAmount] = {}
+    for chunk_balances in results:
+        balances.update(chunk_balances)
+    return balances
+
+async def _get_balances_chunk(addresses: List[str], block_identifier: Optional[Any] = None) -> Dict[str, TokenAmount]:
+    """Read balances for one chunk of addresses with a single aggregate3 call."""
+    calls = [
+        (token_contract.address, True, token_contract.encode_abi("balanceOf", args=[address]))
+        for address in addresses
+    ]
+    
+    try:
+        responses = await multicall_contract.functions.aggregate3(calls).call(block_identifier=block_identifier)
+    except Exception as e:
+        logging.warning(f"Multicall balance read failed, reading {len(addresses)} balances individually: {e}")
+        fallback = await asyncio.gather(
+            *(
+                token_contract.functions.balanceOf(address).call(block_identifier=block_identifier)
+                for address in addresses
+            ),
+            return_exceptions=True
+        )
+        responses = [
+            (False, b"") if isinstance(balance_wei, Exception) else (True, balance_wei)
+            for balance_wei in fallback
+        ]
+    
+    balances: Dict[str, TokenAmount] = {}
+    for address, (success, return_data) in zip(addresses, responses):
+        if not success:
+            logging.error(f"Error getting token balance for {address}")
+            continue
+        
+        try:
+            balance_wei = return_data if isinstance(return_data, int) else abi_decode(["uint256"], return_data)[0]
+        except Exception as e:
+            logging.error(f"Error decoding token balance for {address}: {e}")
+            continue
+        
+        balances[address] = TokenAmount(balance_wei)
+    
+    return balances
 
 async def send_tip(
-    sender_wallet_address: str,
+    sender_id: int,
     recipient_wallet_address: str,
-    amount: Decimal
+    amount: TokenAmount
 ) -> str:
-    """Send TIP tokens from one wallet to another.
+    """Send TIP tokens from a user's wallet to another wallet.
     
     Args:
-        sender_wallet_address: The sender's wallet address
+        sender_id: The sender's user ID
         recipient_wallet_address: The recipient's wallet address
         amount: The amount to send
         
     Returns:
-        str: Transaction hash
+        str: Transaction hash of the broadcast (not yet mined) transaction
     """
     try:
-        if not token_contract:
-            raise ValueError("Token contract not initialized")
-        
-        # Get the sender's private key
-        from bot.services.database import get_user_private_key
-        sender_id = await get_user_id_by_wallet(sender_wallet_address)
-        if not sender_id:
-            raise ValueError("Sender ID not found")
-        
-        private_key = await get_user_private_key(sender_id)
-        if not private_key:
-            raise ValueError("Private key not found")
-        
-        # Convert addresses to checksum format
-        sender_address = Web3.to_checksum_address(sender_wallet_address)
-        recipient_address = Web3.to_checksum_address(recipient_wallet_address)
-        
-        # Convert amount to wei
-        amount_wei = int(amount * Decimal(10 ** TOKEN_DECIMALS))
-        
-        # Build the transaction
-        nonce = w3.eth.get_transaction_count(sender_address)
-        
-        # Create the transaction
-        tx = token_contract.functions.transfer(
-            recipient_address,
-            amount_wei
-        ).build_transaction({
-            'chainId': w3.eth.chain_id,
-            'gas': 100000,  # Adjust gas as needed
-            'gasPrice': w3.eth.gas_price,
-            'nonce': nonce,
-        })
-        
-        # Sign the transaction
-        signed_tx = w3.eth.account.sign_transaction(tx, private_key)
-        
-        # Send the transaction
-        tx_hash = w3.eth.send_raw_transaction(signed_tx.rawTransaction)
-        
-        # Wait for the transaction to be mined
-        tx_receipt = w3.eth.wait_for_transaction_receipt(tx_hash)
-        
-        # Return the transaction hash
-        return tx_receipt.transactionHash.hex()
+        return await transfer_from_user(sender_id, recipient_wallet_address, amount.raw)
     
     except Exception as e:
         logging.error(f"Error sending TIP tokens: {e}")
         raise
 
+async def _get_user_signer(sender_id: int) -> Tuple[str, str]:
+    """Get the wallet address and private key of a user's custodial wallet."""
+    if not token_contract:
+        raise ValueError("Token contract not initialized")
+    
+    sender_wallet_address = await get_user_wallet(sender_id)
+    if not sender_wallet_address:
+        raise ValueError("Sender wallet not found")
+    
+    # Get the sender's private key
+    private_key = await get_user_private_key(sender_id)
+    if not private_key:
+        raise ValueError("Private key not found")
+    
+    return sender_wallet_address, private_key
+
+async def transfer_from_user(sender_id: int, recipient_wallet_address: str, amount_wei: int) -> str:
+    """Send raw token units from a user's custodial wallet.
+    
+    Returns:
+        str: Transaction hash of the broadcast (not yet mined) transaction
+    """
+    sender_wallet_address, private_key = await _get_user_signer(sender_id)
+    
+    # Stored wallet addresses are already checksummed
+    recipient_address = checksum_address(recipient_wallet_address)
+    
+    # Build, sign and broadcast the transfer
+    transfer = token_contract.functions.transfer(recipient_address, amount_wei)
+    return await _send_contract_transaction(
+        transfer,
+        sender_wallet_address,
+        private_key,
+        gas_cache_key="transfer",
+        gas_call=_worst_case_transfer()
+    )
+
+async def sign_transfer_from_user(sender_id: int, recipient_wallet_address: str, amount_wei: int, nonce: int) -> Any:
+    """Sign a token transfer from a user's custodial wallet at a given nonce.
+    
+    The transaction isn't sent, so it can be recorded first and then
+    broadcast with broadcast_transaction().
+    
+    Returns:
+        The signed transaction, with its `hash` and `raw_transaction`
+    """
+    sender_wallet_address, private_key = await _get_user_signer(sender_id)
+    
+    transfer = token_contract.functions.transfer(checksum_address(recipient_wallet_address), amount_wei)
+    return await _sign_contract_transaction(
+        transfer,
+        sender_wallet_address,
+        private_key,
+        nonce,
+        gas_cache_key="transfer",
+        gas_call=_worst_case_transfer()
+    )
+
 async def withdraw_tokens(
-    wallet_address: str,
+    user_id: int,
     destination_address: str,
-    amount: float
+    amount: TokenAmount
 ) -> str:
     """Withdraw tokens to an external wallet.
     
     Args:
-        wallet_address: The user's wallet address
+        user_id: The withdrawing user's ID
         destination_address: The destination wallet address
         amount: The amount to withdraw
         
@@ -196,21 +572,81 @@ async def withdraw_tokens(
     """
     # This is essentially the same as send_tip with different parameter names
     return await send_tip(
-        sender_wallet_address=wallet_address,
+        sender_id=user_id,
         recipient_wallet_address=destination_address,
-        amount=Decimal(str(amount))
+        amount=amount
+    )
+
+@lru_cache(maxsize=1)
+def get_hot_wallet() -> Optional[LocalAccount]:
+    """Get the hot wallet account that pays batched transfers, if configured."""
+    if not settings.ADMIN_WALLET_PRIVATE_KEY:
+        return None
+    return Account.from_key(settings.ADMIN_WALLET_PRIVATE_KEY)
+
+async def get_hot_wallet_balance() -> TokenAmount:
+    """Get the hot wallet's token balance, net of transactions still in the mempool."""
+    hot_wallet = get_hot_wallet()
+    if not token_contract or not hot_wallet:
+        raise ValueError("Token contract or hot wallet not configured")
+    
+    balance_wei = await token_contract.functions.balanceOf(hot_wallet.address).call(block_identifier="pending")
+    return TokenAmount(balance_wei)
+
+async def ensure_batch_allowance(min_allowance: int) -> None:
+    """Approve the Disperse contract to spend the hot wallet's tokens if needed.
+    
+    `disperseToken` pulls the batch total from the hot wallet with
+    `transferFrom`, so the allowance is raised to the maximum once and then
+    reused by every batch.
+    """
+    hot_wallet = get_hot_wallet()
+    if not token_contract or not hot_wallet:
+        raise ValueError("Token contract or hot wallet not configured")
+    
+    allowance = await token_contract.functions.allowance(
+        hot_wallet.address, disperse_contract.address
+    ).call()
+    if allowance >= min_allowance:
+        return
+    
+    approve = token_contract.functions.approve(disperse_contract.address, 2 ** 256 - 1)
+    tx_hash = await _send_contract_transaction(approve, hot_wallet.address, hot_wallet.key)
+    receipt = await w3.eth.wait_for_transaction_receipt(tx_hash, timeout=settings.RECEIPT_TIMEOUT)
+    if receipt["status"] != 1:
+        raise ValueError(f"Approval transaction {tx_hash} failed")
+    logging.info(f"Approved Disperse contract for hot wallet {hot_wallet.address}")
+
+async def sign_batch_transfer(recipients: List[str], amounts_wei: List[int], nonce: int) -> Any:
+    """Sign several token transfers from the hot wallet as one transaction.
+    
+    The transaction isn't sent, so it can be recorded first and then
+    broadcast with broadcast_transaction().
+    
+    Returns:
+        The signed transaction, with its `hash` and `raw_transaction`
+    """
+    hot_wallet = get_hot_wallet()
+    if not token_contract or not hot_wallet:
+        raise ValueError("Token contract or hot wallet not configured")
+    
+    disperse = disperse_contract.functions.disperseToken(
+        token_contract.address,
+        [checksum_address(recipient) for recipient in recipients],
+        amounts_wei
+    )
+    return await _sign_contract_transaction(
+        disperse,
+        hot_wallet.address,
+        hot_wallet.key,
+        nonce,
+        default_gas=settings.DEFAULT_GAS_LIMIT * len(recipients)
     )
 
-async def get_user_id_by_wallet(wallet_address: str) -> Optional[int]:
-    """Get user ID from wallet address."""
-    # This function is a placeholder
-    # In a real implementation, you would query the database
-    from bot.services.database import async_session_maker
-    import sqlalchemy as sa
-    from bot.services.database import Users
-    
-    async with async_session_maker() as session:
-        query = sa.select(Users.user_id).where(Users.wallet_address == wallet_address)
-        result = await session.execute(query)
-        user_id = result.scalar_one_or_none()
-        return user_id
+async def estimate_transfer_gas(sender_address: str) -> int:
+    """Estimate the gas of a single token transfer, as a baseline for batches."""
+    return await fee_oracle.estimate_gas(
+        _worst_case_transfer(),
+        sender_address,
+        cache_key="transfer"
+    )
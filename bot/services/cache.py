@@ -1,51 +1,209 @@
 import json
 import logging
-from typing import Optional, Dict, Any
-from decimal import Decimal
-
-# Use in-memory cache as a simple solution
-# In production, consider using Redis or another distributed cache
-_balance_cache = {}
-
-async def cache_balance(user_id: int, balance: Decimal, ttl_seconds: int = 300) -> None:
-    """Cache a user's balance for faster retrieval."""
-    try:
-        import time
-        
-        # Store balance with expiration time
-        _balance_cache[user_id] = {
-            "balance": str(balance),  # Convert Decimal to string for JSON compatibility
-            "expires_at": time.time() + ttl_seconds
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional
+
+from bot.config import settings
+
+class Cache(ABC):
+    """Key-value cache with per-entry expiry.
+
+    Values must be JSON serializable so that every backend can store them.
+    Backends count hits, misses and evictions; `stats()` reports them.
+    """
+
+    async def get(self, key: str) -> Optional[Any]:
+        """Get a value, or None if it is missing or expired."""
+        return (await self.get_many([key])).get(key)
+
+    @abstractmethod
+    async def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        """Get several values; missing keys are left out."""
+
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        """Store a value for `ttl` seconds (the cache's default if not given)."""
+        await self.set_many({key: value}, ttl)
+
+    @abstractmethod
+    async def set_many(self, values: Dict[str, Any], ttl: Optional[float] = None) -> None:
+        """Store several values for `ttl` seconds."""
+
+    @abstractmethod
+    async def delete(self, *keys: str) -> None:
+        """Remove values."""
+
+    @abstractmethod
+    async def stats(self) -> Dict[str, Any]:
+        """Hit, miss and eviction counters."""
+
+    async def close(self) -> None:
+        """Release the backend's resources."""
+
+class _Entry:
+    """A cached value and its expiry time."""
+
+    __slots__ = ("value", "expires_at")
+
+    def __init__(self, value: Any, expires_at: float):
+        self.value = value
+        self.expires_at = expires_at
+
+class MemoryCache(Cache):
+    """In-process cache bounded to `maxsize` entries.
+
+    The least recently used entry is evicted when the cache is full, and
+    expired entries at the cold end are dropped on every write, so memory
+    stays bounded even for keys that are never read again.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    async def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        now = time.monotonic()
+        found = {}
+        for key in keys:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+            elif entry.expires_at <= now:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+            else:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                found[key] = entry.value
+        return found
+
+    async def set_many(self, values: Dict[str, Any], ttl: Optional[float] = None) -> None:
+        now = time.monotonic()
+        expires_at = now + (self.ttl if ttl is None else ttl)
+        for key, value in values.items():
+            entry = self._entries.get(key)
+            if entry is None:
+                self._entries[key] = _Entry(value, expires_at)
+            else:
+                entry.value = value
+                entry.expires_at = expires_at
+                self._entries.move_to_end(key)
+
+        # Drop expired entries from the cold end, then enforce the size bound
+        while self._entries:
+            key, entry = next(iter(self._entries.items()))
+            if entry.expires_at > now:
+                break
+            del self._entries[key]
+            self.expirations += 1
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    async def delete(self, *keys: str) -> None:
+        for key in keys:
+            self._entries.pop(key, None)
+
+    async def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": "memory",
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
         }
-    except Exception as e:
-        logging.error(f"Error caching balance: {e}")
-
-async def get_cached_balance(user_id: int) -> Optional[Decimal]:
-    """Get a user's cached balance if it exists and is not expired."""
-    try:
-        import time
-        
-        # Check if balance is in cache
-        if user_id not in _balance_cache:
-            return None
-        
-        # Check if cached balance is expired
-        cache_data = _balance_cache[user_id]
-        if time.time() > cache_data.get("expires_at", 0):
-            # Cache expired, remove it
-            del _balance_cache[user_id]
-            return None
-        
-        # Return cached balance
-        return Decimal(cache_data.get("balance", "0"))
-    except Exception as e:
-        logging.error(f"Error getting cached balance: {e}")
-        return None
-
-async def invalidate_balance_cache(user_id: int) -> None:
-    """Invalidate a user's cached balance."""
-    try:
-        if user_id in _balance_cache:
-            del _balance_cache[user_id]
-    except Exception as e:
-        logging.error(f"Error invalidating balance cache: {e}")
+
+class RedisCache(Cache):
+    """Cache shared by all bot processes through Redis.
+
+    Reads of several keys are a single MGET and writes are pipelined, so
+    each call is one round trip. Redis errors are logged and treated as
+    misses, so an unavailable Redis degrades to uncached reads.
+    """
+
+    def __init__(self, url: str, ttl: float, prefix: str = "tipbot:cache:"):
+        # Only needed when Redis is enabled
+        from redis.asyncio import Redis
+
+        self._redis = Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+        self.hits = 0
+        self.misses = 0
+
+    async def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        keys = list(keys)
+        if not keys:
+            return {}
+
+        try:
+            raw_values = await self._redis.mget([self.prefix + key for key in keys])
+        except Exception as e:
+            logging.error(f"Error reading from Redis cache: {e}")
+            self.misses += len(keys)
+            return {}
+
+        found = {}
+        for key, raw in zip(keys, raw_values):
+            if raw is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                found[key] = json.loads(raw)
+        return found
+
+    async def set_many(self, values: Dict[str, Any], ttl: Optional[float] = None) -> None:
+        if not values:
+            return
+
+        # Redis expiries are whole milliseconds
+        ttl_ms = max(1, int((self.ttl if ttl is None else ttl) * 1000))
+        try:
+            async with self._redis.pipeline(transaction=False) as pipe:
+                for key, value in values.items():
+                    pipe.set(self.prefix + key, json.dumps(value), px=ttl_ms)
+                await pipe.execute()
+        except Exception as e:
+            logging.error(f"Error writing to Redis cache: {e}")
+
+    async def delete(self, *keys: str) -> None:
+        if not keys:
+            return
+
+        try:
+            await self._redis.delete(*(self.prefix + key for key in keys))
+        except Exception as e:
+            logging.error(f"Error deleting from Redis cache: {e}")
+
+    async def stats(self) -> Dict[str, Any]:
+        stats = {"backend": "redis", "hits": self.hits, "misses": self.misses}
+
+        # Evictions happen on the server, under its maxmemory policy
+        try:
+            info = await self._redis.info("stats")
+            stats["evictions"] = info.get("evicted_keys")
+            stats["expirations"] = info.get("expired_keys")
+        except Exception as e:
+            logging.error(f"Error reading Redis stats: {e}")
+        return stats
+
+    async def close(self) -> None:
+        await self._redis.aclose()
+
+def create_cache(maxsize: int, ttl: float) -> Cache:
+    """Create a cache on Redis if it is enabled, otherwise in process."""
+    if settings.USE_REDIS:
+        return RedisCache(settings.REDIS_URL, ttl)
+    return MemoryCache(maxsize, ttl)
+
+balance_cache = create_cache(settings.BALANCE_CACHE_SIZE, settings.BALANCE_CACHE_TTL)
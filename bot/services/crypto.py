@@ -0,0 +1,121 @@
+import asyncio
+import logging
+import secrets
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Deque, Dict, Optional, Tuple, TypeVar
+
+from cryptography.fernet import Fernet
+from eth_account import Account
+from eth_account.datastructures import SignedTransaction
+
+from bot.config import settings
+
+T = TypeVar("T")
+
+# Initialize encryption for private keys
+# In production, use a secure key management solution
+ENCRYPTION_KEY = Fernet.generate_key()
+fernet = Fernet(ENCRYPTION_KEY)
+
+# Key generation, encryption and signing run here instead of on the event loop
+_executor = ThreadPoolExecutor(max_workers=settings.CRYPTO_WORKERS, thread_name_prefix="crypto")
+_semaphore = asyncio.Semaphore(settings.CRYPTO_MAX_PENDING)
+
+async def run_in_crypto_pool(func: Callable[..., T], *args: Any) -> T:
+    """Run a CPU-bound crypto function on the worker pool.
+
+    At most CRYPTO_MAX_PENDING calls are queued at once, so a burst can't
+    pile up unbounded work behind the workers.
+    """
+    async with _semaphore:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_executor, partial(func, *args))
+
+def shutdown_crypto_pool() -> None:
+    """Stop the worker threads."""
+    _executor.shutdown(wait=False, cancel_futures=True)
+
+def _generate_keypair() -> Tuple[str, str]:
+    """Generate a private key and derive its address."""
+    # Generate a secure random private key
+    private_key = "0x" + secrets.token_hex(32)
+    return Account.from_key(private_key).address, private_key
+
+async def encrypt_private_key(private_key: str) -> str:
+    """Encrypt a private key for storage."""
+    encrypted = await run_in_crypto_pool(fernet.encrypt, private_key.encode())
+    return encrypted.decode()
+
+async def decrypt_private_key(encrypted_key: str) -> str:
+    """Decrypt a stored private key."""
+    decrypted = await run_in_crypto_pool(fernet.decrypt, encrypted_key.encode())
+    return decrypted.decode()
+
+async def sign_transaction(tx: Dict[str, Any], private_key: str) -> SignedTransaction:
+    """Sign a transaction on the worker pool."""
+    return await run_in_crypto_pool(Account.sign_transaction, tx, private_key)
+
+class KeypairPool:
+    """Pool of pre-generated wallet keypairs.
+
+    Keeps up to KEYPAIR_POOL_SIZE fresh keypairs in memory and tops the pool
+    up in the background, so creating a wallet during registration is just a
+    pop. Keys handed out are removed from the pool and never reused.
+    """
+
+    def __init__(self):
+        self._keypairs: Deque[Tuple[str, str]] = deque()
+        self._refill = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        """Start filling the pool in the background."""
+        if self._task is None:
+            self._refill.set()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the refill task and drop the pooled keys."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._keypairs.clear()
+
+    @property
+    def size(self) -> int:
+        """Number of keypairs ready to hand out."""
+        return len(self._keypairs)
+
+    async def pop(self) -> Tuple[str, str]:
+        """Take a fresh (wallet_address, private_key) pair, generating one if the pool is empty."""
+        self._refill.set()
+        if self._keypairs:
+            return self._keypairs.popleft()
+        return await run_in_crypto_pool(_generate_keypair)
+
+    async def _run(self) -> None:
+        """Refill the pool whenever keypairs have been taken."""
+        while True:
+            await self._refill.wait()
+            self._refill.clear()
+
+            try:
+                # Refill a few keys at a time so signing isn't starved of workers
+                while len(self._keypairs) < settings.KEYPAIR_POOL_SIZE:
+                    count = min(settings.CRYPTO_WORKERS, settings.KEYPAIR_POOL_SIZE - len(self._keypairs))
+                    keypairs = await asyncio.gather(
+                        *(run_in_crypto_pool(_generate_keypair) for _ in range(count))
+                    )
+                    self._keypairs.extend(keypairs)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"Error refilling keypair pool: {e}")
+
+keypair_pool = KeypairPool()
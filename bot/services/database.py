@@ -1,38 +1,125 @@
+import asyncio
 import logging
 import json
-from typing import Dict, List, Tuple, Optional, Any, Union
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import AsyncIterator, Dict, List, Tuple, Optional, Any, Union, Iterable, Set
 from datetime import datetime
 
 import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.ext.asyncio import async_sessionmaker
-from sqlalchemy.orm import declarative_base
-from cryptography.fernet import Fernet
+from sqlalchemy.orm import declarative_base, aliased
+from cachetools import LRUCache
 
 from bot.config import settings
+from bot.services.crypto import encrypt_private_key, decrypt_private_key
+from bot.services.profiles import ProfileCache
+from bot.utils.address import checksum_address
 
 # Initialize SQLAlchemy engine and session
 engine = create_async_engine(settings.DATABASE_URL)
 async_session_maker = async_sessionmaker(engine, expire_on_commit=False)
 Base = declarative_base()
 
-# Initialize encryption for private keys
-# In production, use a secure key management solution
-ENCRYPTION_KEY = Fernet.generate_key()
-fernet = Fernet(ENCRYPTION_KEY)
+class UpdateScope:
+    """Database state shared by the helpers called while one update is handled.
+    
+    The session is bound to the engine, so it only holds a pool connection
+    while a helper is in a transaction and gives it back on every commit or
+    rollback; a handler awaiting other tasks that need connections never
+    keeps one checked out meanwhile. Helpers still commit their own writes,
+    so a write is durable before anything that depends on it (such as
+    broadcasting a transaction) happens.
+    """
+    
+    def __init__(self):
+        self.session: Optional[AsyncSession] = None
+        # Only the task handling the update uses the shared session
+        self.task = asyncio.current_task()
+        self.depth = 0
+        self.closed = False
+        self.query_count = 0
+    
+    def get_session(self) -> AsyncSession:
+        """Get the update's session, creating it on first use."""
+        if self.session is None:
+            self.session = async_session_maker()
+        return self.session
+    
+    async def close(self) -> None:
+        """Close the session, returning its connection to the pool if it still holds one."""
+        self.closed = True
+        if self.session is not None:
+            await self.session.close()
+
+# Scope of the update being handled, set by DatabaseMiddleware
+_current_update: ContextVar[Optional[UpdateScope]] = ContextVar("current_update", default=None)
+
+@asynccontextmanager
+async def update_scope() -> AsyncIterator[UpdateScope]:
+    """Share one session between the helpers called in this block."""
+    scope = UpdateScope()
+    token = _current_update.set(scope)
+    try:
+        yield scope
+    finally:
+        _current_update.reset(token)
+        await scope.close()
+
+@sa.event.listens_for(engine.sync_engine, "before_cursor_execute")
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    """Count the queries run on behalf of the current update."""
+    scope = _current_update.get()
+    if scope is not None:
+        scope.query_count += 1
+
+@asynccontextmanager
+async def session_scope(session: Optional[AsyncSession] = None) -> AsyncIterator[AsyncSession]:
+    """Get the session a database helper should use.
+    
+    An explicitly passed session is used as is. Otherwise the current
+    update's session is reused. Helpers running in other tasks (started with
+    asyncio.gather or create_task while handling the update) open a
+    separate session, so they never use the shared one concurrently or
+    after the update is done.
+    """
+    if session is not None:
+        yield session
+        return
+    
+    scope = _current_update.get()
+    if scope is None or scope.closed or scope.task is not asyncio.current_task():
+        async with async_session_maker() as new_session:
+            yield new_session
+        return
+    
+    scope.depth += 1
+    try:
+        yield scope.get_session()
+    finally:
+        scope.depth -= 1
+        if not scope.depth:
+            # Like closing a session of its own, discard whatever the helper
+            # left uncommitted (including a failed transaction); this also
+            # returns the connection to the pool
+            if scope.session is not None and scope.session.in_transaction():
+                await scope.session.rollback()
 
 # Define database models (tables)
 class Users(Base):
     __tablename__ = "users"
     
     user_id = sa.Column(sa.BigInteger, primary_key=True)
-    username = sa.Column(sa.String, nullable=True)
+    username = sa.Column(sa.String, nullable=True, index=True)
     first_name = sa.Column(sa.String, nullable=True)
     last_name = sa.Column(sa.String, nullable=True)
     language = sa.Column(sa.String(2), default="en")
-    wallet_address = sa.Column(sa.String, nullable=True)
+    wallet_address = sa.Column(sa.String, nullable=True, unique=True, index=True)  # Checksummed
     encrypted_private_key = sa.Column(sa.String, nullable=True)
-    referrer_id = sa.Column(sa.BigInteger, nullable=True)
+    referrer_id = sa.Column(sa.BigInteger, nullable=True, index=True)
     referral_count = sa.Column(sa.Integer, default=0)
     created_at = sa.Column(sa.DateTime, default=datetime.utcnow)
     last_active = sa.Column(sa.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -45,18 +132,124 @@ class Transactions(Base):
     recipient_id = sa.Column(sa.BigInteger, nullable=True)
     sender_wallet = sa.Column(sa.String, nullable=True)
     recipient_wallet = sa.Column(sa.String, nullable=True)
-    amount = sa.Column(sa.Float, nullable=False)
-    tx_hash = sa.Column(sa.String, nullable=True)
+    amount = sa.Column(sa.Numeric(78, 0), nullable=False)  # Raw token units
+    tx_hash = sa.Column(sa.String, nullable=True, index=True)
     tx_type = sa.Column(sa.String, nullable=False)  # tip, withdraw, deposit, etc.
     status = sa.Column(sa.String, default="completed")
     idempotency_key = sa.Column(sa.String, nullable=True, unique=True)
     created_at = sa.Column(sa.DateTime, default=datetime.utcnow)
 
-async def init_db():
-    """Initialize database tables."""
-    async with engine.begin() as conn:
-        # Create tables if they don't exist
-        await conn.run_sync(Base.metadata.create_all)
+# History is read per user, newest first
+sa.Index("ix_transactions_sender_id_created_at", Transactions.sender_id, Transactions.created_at.desc())
+sa.Index("ix_transactions_recipient_id_created_at", Transactions.recipient_id, Transactions.created_at.desc())
+sa.Index(
+    "ix_transactions_pending",
+    Transactions.id,
+    postgresql_where=Transactions.status == "pending"
+)
+
+class WalletBalances(Base):
+    __tablename__ = "wallet_balances"
+    
+    wallet_address = sa.Column(sa.String, primary_key=True)
+    user_id = sa.Column(sa.BigInteger, nullable=True)
+    balance = sa.Column(sa.Numeric(78, 0), nullable=False, default=0)  # Raw token units
+    updated_block = sa.Column(sa.BigInteger, nullable=True)
+
+class SchemaVersion(Base):
+    __tablename__ = "schema_version"
+    
+    version = sa.Column(sa.Integer, primary_key=True)
+    description = sa.Column(sa.String, nullable=False)
+    applied_at = sa.Column(sa.DateTime, default=datetime.utcnow)
+
+class IndexerState(Base):
+    __tablename__ = "indexer_state"
+    
+    name = sa.Column(sa.String, primary_key=True)
+    last_block = sa.Column(sa.BigInteger, nullable=False)
+
+class UserStats(Base):
+    __tablename__ = "user_stats"
+    
+    # Running totals, only ever changed with server-side increments
+    user_id = sa.Column(sa.BigInteger, primary_key=True)
+    tips_sent = sa.Column(sa.Integer, nullable=False, default=0)
+    tips_received = sa.Column(sa.Integer, nullable=False, default=0)
+    volume_sent = sa.Column(sa.Numeric(78, 0), nullable=False, default=0)  # Raw token units
+    volume_received = sa.Column(sa.Numeric(78, 0), nullable=False, default=0)  # Raw token units
+
+class LedgerBalances(Base):
+    __tablename__ = "ledger_balances"
+    
+    user_id = sa.Column(sa.BigInteger, primary_key=True)
+    balance = sa.Column(sa.Numeric(78, 0), nullable=False, default=0)  # Raw token units
+    updated_at = sa.Column(sa.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class LedgerEntries(Base):
+    __tablename__ = "ledger_entries"
+    
+    id = sa.Column(sa.BigInteger, primary_key=True, autoincrement=True)
+    transaction_id = sa.Column(sa.Integer, nullable=False)
+    user_id = sa.Column(sa.BigInteger, nullable=False)
+    amount = sa.Column(sa.Numeric(78, 0), nullable=False)  # Signed raw token units
+    settled = sa.Column(sa.Boolean, nullable=False, default=False)
+    created_at = sa.Column(sa.DateTime, default=datetime.utcnow)
+
+sa.Index(
+    "ix_ledger_entries_unsettled",
+    LedgerEntries.id,
+    postgresql_where=LedgerEntries.settled.is_(False)
+)
+
+class SettlementTransfers(Base):
+    __tablename__ = "settlement_transfers"
+    
+    id = sa.Column(sa.Integer, primary_key=True, autoincrement=True)
+    sender_id = sa.Column(sa.BigInteger, nullable=False)
+    recipient_wallet = sa.Column(sa.String, nullable=False)
+    amount = sa.Column(sa.Numeric(78, 0), nullable=False)  # Raw token units
+    transaction_id = sa.Column(sa.Integer, nullable=True)  # Withdrawal paid by this transfer
+    tx_hash = sa.Column(sa.String, nullable=True)
+    # Transfers are stored signed before they are broadcast, like settlement batches
+    nonce = sa.Column(sa.BigInteger, nullable=True)
+    raw_transaction = sa.Column(sa.String, nullable=True)  # Hex encoded
+    status = sa.Column(sa.String, default="planned")  # planned, signed, pending, completed, failed
+    created_at = sa.Column(sa.DateTime, default=datetime.utcnow)
+
+class SettlementBatches(Base):
+    __tablename__ = "settlement_batches"
+    
+    # Hot wallet batches are stored signed before they are broadcast, so a
+    # batch whose broadcast was lost is sent again instead of paid twice
+    id = sa.Column(sa.Integer, primary_key=True, autoincrement=True)
+    tx_hash = sa.Column(sa.String, nullable=False, unique=True)
+    nonce = sa.Column(sa.BigInteger, nullable=False)
+    raw_transaction = sa.Column(sa.String, nullable=False)  # Hex encoded
+    status = sa.Column(sa.String, nullable=False, default="signed")  # signed, sent, dropped
+    created_at = sa.Column(sa.DateTime, default=datetime.utcnow)
+
+sa.Index(
+    "ix_settlement_batches_signed",
+    SettlementBatches.id,
+    postgresql_where=SettlementBatches.status == "signed"
+)
+
+# Wallet owners never change, so the wallet -> user mapping is kept in a
+# bounded in-process cache; user -> wallet goes through the profile cache
+_user_by_wallet: LRUCache = LRUCache(maxsize=settings.ADDRESS_CACHE_SIZE)
+
+# Ledger account standing for everything outside the bot (deposits and withdrawals)
+EXTERNAL_ACCOUNT_ID = 0
+
+class InsufficientBalanceError(Exception):
+    """Raised when a ledger account can't cover a debit."""
+
+class SettlementConflictError(Exception):
+    """Raised when ledger entries or withdrawals are already being settled elsewhere."""
+
+class CheckpointConflictError(Exception):
+    """Raised when an indexed block range no longer follows the stored checkpoint."""
 
 async def create_user_if_not_exists(
     user_id: int,
@@ -64,32 +257,20 @@ async def create_user_if_not_exists(
     first_name: Optional[str] = None,
     last_name: Optional[str] = None,
     language: str = "en",
-    referrer_id: Optional[int] = None
+    referrer_id: Optional[int] = None,
+    session: Optional[AsyncSession] = None
 ) -> bool:
     """Create a new user if they don't already exist in the database.
     Returns True if a new user was created, False if user already existed.
+    
+    Runs as a single upsert, so concurrent registrations can't race. An
+    existing row is only written when the profile actually changed;
+    last_active is tracked separately by the activity buffer.
     """
-    async with async_session_maker() as session:
-        # Check if user exists
-        query = sa.select(Users).where(Users.user_id == user_id)
-        result = await session.execute(query)
-        user = result.scalar_one_or_none()
-        
-        if user:
-            # User exists, update last active
-            user.last_active = datetime.utcnow()
-            if username and user.username != username:
-                user.username = username
-            if first_name and user.first_name != first_name:
-                user.first_name = first_name
-            if last_name and user.last_name != last_name:
-                user.last_name = last_name
-            
-            await session.commit()
-            return False
-        
-        # Create new user
-        new_user = Users(
+    users_table = Users.__table__
+    
+    async with session_scope(session) as session:
+        insert = pg_insert(Users).values(
             user_id=user_id,
             username=username,
             first_name=first_name,
@@ -97,13 +278,77 @@ async def create_user_if_not_exists(
             language=language,
             referrer_id=referrer_id if referrer_id != user_id else None  # Prevent self-referral
         )
-        session.add(new_user)
+        
+        # Keep the stored profile fields the update doesn't provide
+        profile = {
+            name: sa.func.coalesce(insert.excluded[name], users_table.c[name])
+            for name in ("username", "first_name", "last_name")
+        }
+        changed = sa.or_(*(
+            users_table.c[name].is_distinct_from(value) for name, value in profile.items()
+        ))
+        
+        # xmax is 0 only for a freshly inserted row
+        result = await session.execute(
+            insert.on_conflict_do_update(
+                index_elements=[Users.user_id],
+                set_=profile,
+                where=changed
+            ).returning(sa.literal_column("xmax = 0"))
+        )
+        created = result.scalar_one_or_none()
+        await session.commit()
+    
+    # No row is returned when the user exists and nothing changed
+    if created:
+        # The user may be cached as unknown
+        await profile_cache.invalidate(user_id)
+    return bool(created)
+
+async def update_user_activity(activity: Dict[int, Dict[str, Any]], session: Optional[AsyncSession] = None) -> None:
+    """Write buffered last_active times and profile changes with one bulk UPDATE.
+    
+    Args:
+        activity: Maps user_id to its last_active, username, first_name and last_name
+    """
+    if not activity:
+        return
+    
+    values = sa.values(
+        sa.column("user_id", sa.BigInteger),
+        sa.column("last_active", sa.DateTime),
+        sa.column("username", sa.String),
+        sa.column("first_name", sa.String),
+        sa.column("last_name", sa.String),
+        name="activity"
+    )
+    users_table = Users.__table__
+    
+    # Lock rows in user_id order so concurrent flushes can't deadlock
+    rows = [
+        (user_id, entry["last_active"], entry.get("username"), entry.get("first_name"), entry.get("last_name"))
+        for user_id, entry in sorted(activity.items())
+    ]
+    
+    async with session_scope(session) as session:
+        # Stay well below the bind parameter limit
+        for start in range(0, len(rows), 1000):
+            chunk = values.data(rows[start:start + 1000])
+            await session.execute(
+                sa.update(users_table)
+                .where(users_table.c.user_id == chunk.c.user_id)
+                .values(
+                    last_active=sa.func.greatest(users_table.c.last_active, chunk.c.last_active),
+                    username=sa.func.coalesce(chunk.c.username, users_table.c.username),
+                    first_name=sa.func.coalesce(chunk.c.first_name, users_table.c.first_name),
+                    last_name=sa.func.coalesce(chunk.c.last_name, users_table.c.last_name)
+                )
+            )
         await session.commit()
-        return True
 
-async def get_user_by_id(user_id: int) -> Optional[Dict[str, Any]]:
+async def get_user_by_id(user_id: int, session: Optional[AsyncSession] = None) -> Optional[Dict[str, Any]]:
     """Get user data by user_id."""
-    async with async_session_maker() as session:
+    async with session_scope(session) as session:
         query = sa.select(Users).where(Users.user_id == user_id)
         result = await session.execute(query)
         user = result.scalar_one_or_none()
@@ -124,9 +369,44 @@ async def get_user_by_id(user_id: int) -> Optional[Dict[str, Any]]:
             "last_active": user.last_active
         }
 
-async def get_user_by_username(username: str) -> Optional[Dict[str, Any]]:
+async def get_users_by_ids(user_ids: Iterable[int], session: Optional[AsyncSession] = None) -> Dict[int, Dict[str, Any]]:
+    """Get display data for several users in one query."""
+    user_ids = list(set(user_ids))
+    if not user_ids:
+        return {}
+    
+    async with session_scope(session) as session:
+        query = sa.select(
+            Users.user_id,
+            Users.username,
+            Users.first_name,
+            Users.last_name,
+            Users.language,
+            Users.wallet_address
+        ).where(Users.user_id.in_(user_ids))
+        result = await session.execute(query)
+        return {row.user_id: dict(row._mapping) for row in result}
+
+async def get_user_profile(user_id: int, session: Optional[AsyncSession] = None) -> Optional[Dict[str, Any]]:
+    """Get the user fields most updates need, bypassing the profile cache."""
+    async with session_scope(session) as session:
+        query = sa.select(
+            Users.language,
+            Users.wallet_address,
+            Users.username,
+            Users.referral_count
+        ).where(Users.user_id == user_id)
+        result = await session.execute(query)
+        row = result.one_or_none()
+        return dict(row._mapping) if row else None
+
+# Profiles read on almost every update (language, wallet); writers below
+# invalidate them
+profile_cache = ProfileCache(get_user_profile, settings.PROFILE_CACHE_SIZE, settings.PROFILE_CACHE_TTL)
+
+async def get_user_by_username(username: str, session: Optional[AsyncSession] = None) -> Optional[Dict[str, Any]]:
     """Get user data by username."""
-    async with async_session_maker() as session:
+    async with session_scope(session) as session:
         query = sa.select(Users).where(Users.username == username)
         result = await session.execute(query)
         user = result.scalar_one_or_none()
@@ -147,9 +427,9 @@ async def get_user_by_username(username: str) -> Optional[Dict[str, Any]]:
             "last_active": user.last_active
         }
 
-async def update_user_language(user_id: int, language: str) -> bool:
+async def update_user_language(user_id: int, language: str, session: Optional[AsyncSession] = None) -> bool:
     """Update user's preferred language."""
-    async with async_session_maker() as session:
+    async with session_scope(session) as session:
         query = sa.select(Users).where(Users.user_id == user_id)
         result = await session.execute(query)
         user = result.scalar_one_or_none()
@@ -159,22 +439,23 @@ async def update_user_language(user_id: int, language: str) -> bool:
         
         user.language = language
         await session.commit()
-        return True
+    
+    await profile_cache.invalidate(user_id)
+    return True
 
-async def get_user_language(user_id: int) -> Optional[str]:
+async def get_user_language(user_id: int, session: Optional[AsyncSession] = None) -> Optional[str]:
     """Get user's preferred language."""
-    async with async_session_maker() as session:
-        query = sa.select(Users.language).where(Users.user_id == user_id)
-        result = await session.execute(query)
-        language = result.scalar_one_or_none()
-        return language
+    profile = await profile_cache.get(user_id, session=session)
+    return profile["language"] if profile else None
 
-async def update_user_wallet(user_id: int, wallet_address: str, private_key: str) -> bool:
+async def update_user_wallet(user_id: int, wallet_address: str, private_key: str, session: Optional[AsyncSession] = None) -> bool:
     """Update user's wallet information."""
+    wallet_address = checksum_address(wallet_address)
+    
     # Encrypt the private key before storing
-    encrypted_key = fernet.encrypt(private_key.encode()).decode()
+    encrypted_key = await encrypt_private_key(private_key)
     
-    async with async_session_maker() as session:
+    async with session_scope(session) as session:
         query = sa.select(Users).where(Users.user_id == user_id)
         result = await session.execute(query)
         user = result.scalar_one_or_none()
@@ -182,22 +463,37 @@ async def update_user_wallet(user_id: int, wallet_address: str, private_key: str
         if not user:
             return False
         
+        old_wallet = user.wallet_address
         user.wallet_address = wallet_address
         user.encrypted_private_key = encrypted_key
+        
+        # A freshly generated wallet starts empty, so the indexer can track it
+        # from zero without seeding it from the chain
+        if settings.USE_INDEXER:
+            await session.execute(
+                pg_insert(WalletBalances).values(
+                    wallet_address=wallet_address,
+                    user_id=user_id,
+                    balance=0
+                ).on_conflict_do_nothing(index_elements=["wallet_address"])
+            )
+        
         await session.commit()
-        return True
+    
+    if old_wallet:
+        _user_by_wallet.pop(old_wallet, None)
+    _user_by_wallet[wallet_address] = user_id
+    await profile_cache.invalidate(user_id)
+    return True
 
-async def get_user_wallet(user_id: int) -> Optional[str]:
-    """Get user's wallet address."""
-    async with async_session_maker() as session:
-        query = sa.select(Users.wallet_address).where(Users.user_id == user_id)
-        result = await session.execute(query)
-        wallet_address = result.scalar_one_or_none()
-        return wallet_address
+async def get_user_wallet(user_id: int, session: Optional[AsyncSession] = None) -> Optional[str]:
+    """Get user's checksummed wallet address."""
+    profile = await profile_cache.get(user_id, session=session)
+    return profile["wallet_address"] if profile else None
 
-async def get_user_private_key(user_id: int) -> Optional[str]:
+async def get_user_private_key(user_id: int, session: Optional[AsyncSession] = None) -> Optional[str]:
     """Get user's decrypted private key."""
-    async with async_session_maker() as session:
+    async with session_scope(session) as session:
         query = sa.select(Users.encrypted_private_key).where(Users.user_id == user_id)
         result = await session.execute(query)
         encrypted_key = result.scalar_one_or_none()
@@ -207,7 +503,7 @@ async def get_user_private_key(user_id: int) -> Optional[str]:
         
         # Decrypt the private key
         try:
-            decrypted_key = fernet.decrypt(encrypted_key.encode()).decode()
+            decrypted_key = await decrypt_private_key(encrypted_key)
             return decrypted_key
         except Exception as e:
             logging.error(f"Error decrypting private key for user {user_id}: {e}")
@@ -218,92 +514,416 @@ async def save_transaction(
     recipient_id: Optional[int] = None,
     sender_wallet: Optional[str] = None,
     recipient_wallet: Optional[str] = None,
-    amount: float = 0.0,
+    amount: int = 0,
     tx_hash: Optional[str] = None,
     tx_type: str = "tip",
     status: str = "completed",
-    idempotency_key: Optional[str] = None
+    idempotency_key: Optional[str] = None,
+    session: Optional[AsyncSession] = None
 ) -> bool:
-    """Save a transaction to the database."""
-    async with async_session_maker() as session:
-        # Get wallet addresses if not provided
-        if sender_id and not sender_wallet:
-            sender_wallet = await get_user_wallet(sender_id)
+    """Save a transaction to the database. `amount` is in raw token units.
+    Returns False if a transaction with the same idempotency key already exists.
+    """
+    record = {
+        "sender_id": sender_id,
+        "recipient_id": recipient_id,
+        "sender_wallet": sender_wallet,
+        "recipient_wallet": recipient_wallet,
+        "amount": amount,
+        "tx_hash": tx_hash,
+        "tx_type": tx_type,
+        "status": status,
+        "idempotency_key": idempotency_key,
+    }
+    return (await save_transactions([record], session))[0]
+
+async def save_transactions(records: List[Dict[str, Any]], session: Optional[AsyncSession] = None) -> List[bool]:
+    """Save several transactions with one multi-row INSERT and one commit.
+    
+    Records take the keyword arguments of save_transaction. A record whose
+    idempotency key already exists, in the database or earlier in `records`,
+    is skipped.
+    
+    Returns:
+        List[bool]: For each record, whether it was inserted
+    """
+    if not records:
+        return []
+    
+    rows = []
+    first_with_key: Dict[str, int] = {}
+    for i, record in enumerate(records):
+        row = {
+            "sender_id": record.get("sender_id"),
+            "recipient_id": record.get("recipient_id"),
+            "sender_wallet": record.get("sender_wallet"),
+            "recipient_wallet": record.get("recipient_wallet"),
+            "amount": record.get("amount", 0),
+            "tx_hash": record.get("tx_hash"),
+            "tx_type": record.get("tx_type", "tip"),
+            "status": record.get("status", "completed"),
+            "idempotency_key": record.get("idempotency_key"),
+        }
         
-        if recipient_id and not recipient_wallet:
-            recipient_wallet = await get_user_wallet(recipient_id)
+        # Get wallet addresses if not provided
+        if row["sender_id"] and not row["sender_wallet"]:
+            row["sender_wallet"] = await get_user_wallet(row["sender_id"], session)
+        if row["recipient_id"] and not row["recipient_wallet"]:
+            row["recipient_wallet"] = await get_user_wallet(row["recipient_id"], session)
         
-        # Create transaction record
-        transaction = Transactions(
-            sender_id=sender_id,
-            recipient_id=recipient_id,
-            sender_wallet=sender_wallet,
-            recipient_wallet=recipient_wallet,
-            amount=amount,
-            tx_hash=tx_hash,
-            tx_type=tx_type,
-            status=status,
-            idempotency_key=idempotency_key
+        key = row["idempotency_key"]
+        if key is not None:
+            if key in first_with_key:
+                continue
+            first_with_key[key] = i
+        rows.append(row)
+    
+    async with session_scope(session) as session:
+        result = await session.execute(
+            pg_insert(Transactions).values(rows).on_conflict_do_nothing(
+                index_elements=["idempotency_key"]
+            ).returning(Transactions.idempotency_key)
         )
+        inserted_keys = {key for key, in result if key is not None}
         
-        session.add(transaction)
+        inserted = [
+            record.get("idempotency_key") is None
+            or (first_with_key[record["idempotency_key"]] == i and record["idempotency_key"] in inserted_keys)
+            for i, record in enumerate(records)
+        ]
+        
+        tips = [
+            (row["sender_id"], row["recipient_id"], row["amount"])
+            for row in rows
+            if row["tx_type"] == "tip" and row["status"] == "completed"
+            and (row["idempotency_key"] is None or row["idempotency_key"] in inserted_keys)
+        ]
+        await _count_tips(session, tips)
         await session.commit()
-        return True
+        return inserted
 
-async def get_user_transactions(
-    user_id: int,
-    limit: int = 10,
-    offset: int = 0,
-    count_only: bool = False
-) -> Union[List[Dict[str, Any]], int]:
-    """Get user's transaction history."""
-    async with async_session_maker() as session:
-        if count_only:
-            # Count total transactions
-            query = sa.select(sa.func.count(Transactions.id)).where(
-                sa.or_(
-                    Transactions.sender_id == user_id,
-                    Transactions.recipient_id == user_id
-                )
+async def update_transaction_statuses(statuses: Dict[str, str], session: Optional[AsyncSession] = None) -> None:
+    """Update the status of several transactions and settlement transfers, keyed by tx hash.
+    
+    A withdrawal paid by netting transfers resolves once all of its
+    transfers have, rather than by the hash stored on its row.
+    """
+    if not statuses:
+        return
+    
+    params = [{"b_tx_hash": tx_hash, "b_status": status} for tx_hash, status in statuses.items()]
+    completed = [tx_hash for tx_hash, status in statuses.items() if status == "completed"]
+    failed = [tx_hash for tx_hash, status in statuses.items() if status == "failed"]
+    
+    async with session_scope(session) as session:
+        # Tips count towards the stats once they confirm; locking the rows
+        # makes sure each one is only counted once
+        tips = []
+        if completed:
+            result = await session.execute(
+                sa.select(Transactions.sender_id, Transactions.recipient_id, Transactions.amount).where(
+                    Transactions.tx_hash.in_(completed),
+                    Transactions.tx_type == "tip",
+                    Transactions.status == "pending"
+                ).with_for_update()
             )
-            result = await session.execute(query)
-            return result.scalar_one() or 0
+            tips = [tuple(row) for row in result]
         
-        # Get transactions with pagination
-        query = sa.select(Transactions).where(
-            sa.or_(
-                Transactions.sender_id == user_id,
-                Transactions.recipient_id == user_id
+        netted = sa.exists().where(SettlementTransfers.transaction_id == Transactions.id)
+        if failed:
+            # Withdrawals in a reverted batch get their ledger debit back
+            result = await session.execute(
+                sa.select(Transactions.id).where(
+                    Transactions.tx_hash.in_(failed),
+                    Transactions.tx_type == "withdraw",
+                    Transactions.status == "pending",
+                    ~netted
+                ).with_for_update()
+            )
+            await _refund_withdrawals(session, list(result.scalars()))
+            
+            # Reverted netting transfers are planned and signed again
+            await session.execute(
+                sa.update(Transactions).where(
+                    Transactions.tx_hash.in_(failed),
+                    Transactions.status == "pending",
+                    netted
+                ).values(tx_hash=None)
+            )
+            await session.execute(
+                sa.update(SettlementTransfers).where(
+                    SettlementTransfers.tx_hash.in_(failed),
+                    SettlementTransfers.status.in_(["signed", "pending"])
+                ).values(tx_hash=None, nonce=None, raw_transaction=None, status="planned")
             )
-        ).order_by(
-            Transactions.created_at.desc()
-        ).limit(limit).offset(offset)
         
-        result = await session.execute(query)
-        transactions = result.scalars().all()
+        await session.execute(
+            sa.update(Transactions.__table__).where(
+                Transactions.tx_hash == sa.bindparam("b_tx_hash"),
+                Transactions.status == "pending",
+                ~netted
+            ).values(status=sa.bindparam("b_status")),
+            params
+        )
+        # A settlement transfer can confirm before it is marked sent
+        await session.execute(
+            sa.update(SettlementTransfers.__table__).where(
+                SettlementTransfers.tx_hash == sa.bindparam("b_tx_hash"),
+                sa.or_(SettlementTransfers.status == "signed", SettlementTransfers.status == "pending")
+            ).values(status=sa.bindparam("b_status")),
+            params
+        )
+        await _resolve_netted_withdrawals(session, list(statuses))
         
-        return [
-            {
-                "id": tx.id,
-                "sender_id": tx.sender_id,
-                "recipient_id": tx.recipient_id,
-                "sender_wallet": tx.sender_wallet,
-                "recipient_wallet": tx.recipient_wallet,
-                "amount": tx.amount,
-                "tx_hash": tx.tx_hash,
-                "tx_type": tx.tx_type,
-                "status": tx.status,
-                "created_at": tx.created_at
+        await _count_tips(session, tips)
+        await session.commit()
+
+async def fail_withdrawals(transaction_ids: List[int], session: Optional[AsyncSession] = None) -> None:
+    """Fail pending withdrawals that can't be paid, e.g. to an invalid address, refunding their ledger debits."""
+    async with session_scope(session) as session:
+        result = await session.execute(
+            sa.select(Transactions.id).where(
+                Transactions.id.in_(transaction_ids),
+                Transactions.status == "pending"
+            ).with_for_update()
+        )
+        await _refund_withdrawals(session, list(result.scalars()))
+        await session.commit()
+
+async def _refund_withdrawals(session: AsyncSession, transaction_ids: List[int]) -> None:
+    """Mark pending withdrawals failed and credit their unsettled ledger debits back.
+    
+    The entries are marked settled as they are reversed, so a withdrawal is
+    refunded at most once and the netting job never reimburses it.
+    """
+    if not transaction_ids:
+        return
+    
+    result = await session.execute(
+        sa.update(LedgerEntries).where(
+            LedgerEntries.transaction_id.in_(transaction_ids),
+            LedgerEntries.settled.is_(False)
+        ).values(settled=True).returning(LedgerEntries.user_id, LedgerEntries.amount)
+    )
+    refunds: Dict[int, int] = defaultdict(int)
+    for user_id, amount in result:
+        refunds[user_id] -= int(amount)
+    
+    # In user_id order, like ledger_transfer(), so concurrent updates can't deadlock
+    balances_table = LedgerBalances.__table__
+    for user_id in sorted(refunds):
+        await session.execute(
+            sa.update(balances_table).where(
+                balances_table.c.user_id == user_id
+            ).values(balance=balances_table.c.balance + refunds[user_id])
+        )
+    
+    await session.execute(
+        sa.update(Transactions).where(
+            Transactions.id.in_(transaction_ids),
+            Transactions.status == "pending"
+        ).values(status="failed")
+    )
+
+async def _resolve_netted_withdrawals(session: AsyncSession, tx_hashes: List[str]) -> None:
+    """Resolve the withdrawals paid by the given settlement transfers once all their transfers are mined."""
+    transfers = aliased(SettlementTransfers)
+    paid_by = sa.select(SettlementTransfers.transaction_id).where(SettlementTransfers.tx_hash.in_(tx_hashes))
+    
+    def any_transfer(*conditions):
+        return sa.exists().where(transfers.transaction_id == Transactions.id, *conditions)
+    
+    await session.execute(
+        sa.update(Transactions).where(
+            Transactions.id.in_(paid_by),
+            Transactions.status == "pending",
+            ~any_transfer(transfers.status.not_in(["completed", "failed"]))
+        ).values(
+            status=sa.case((any_transfer(transfers.status == "failed"), "failed"), else_="completed")
+        )
+    )
+
+async def _count_tips(session: AsyncSession, tips: List[Tuple[Optional[int], Optional[int], int]]) -> None:
+    """Add (sender_id, recipient_id, raw amount) tips to the users' stats with atomic increments."""
+    deltas: Dict[int, Dict[str, Any]] = {}
+    for sender_id, recipient_id, amount in tips:
+        amount = int(amount)
+        if sender_id:
+            delta = deltas.setdefault(sender_id, _empty_stats(sender_id))
+            delta["tips_sent"] += 1
+            delta["volume_sent"] += amount
+        if recipient_id:
+            delta = deltas.setdefault(recipient_id, _empty_stats(recipient_id))
+            delta["tips_received"] += 1
+            delta["volume_received"] += amount
+    
+    if not deltas:
+        return
+    
+    # One upsert for all users, in user_id order so concurrent updates can't deadlock
+    insert = pg_insert(UserStats).values([deltas[user_id] for user_id in sorted(deltas)])
+    stats_table = UserStats.__table__
+    await session.execute(
+        insert.on_conflict_do_update(
+            index_elements=[UserStats.user_id],
+            set_={
+                name: stats_table.c[name] + insert.excluded[name]
+                for name in ("tips_sent", "tips_received", "volume_sent", "volume_received")
             }
-            for tx in transactions
-        ]
+        )
+    )
+
+def _empty_stats(user_id: int) -> Dict[str, Any]:
+    """Stats of a user without any tips."""
+    return {
+        "user_id": user_id,
+        "tips_sent": 0,
+        "tips_received": 0,
+        "volume_sent": 0,
+        "volume_received": 0,
+    }
+
+async def get_user_stats(user_id: int, session: Optional[AsyncSession] = None) -> Dict[str, Any]:
+    """Get a user's tip totals; volumes are in raw token units."""
+    async with session_scope(session) as session:
+        result = await session.execute(
+            sa.select(
+                UserStats.tips_sent,
+                UserStats.tips_received,
+                UserStats.volume_sent,
+                UserStats.volume_received
+            ).where(UserStats.user_id == user_id)
+        )
+        row = result.one_or_none()
+        
+        stats = _empty_stats(user_id)
+        if row:
+            stats.update(
+                tips_sent=row.tips_sent,
+                tips_received=row.tips_received,
+                volume_sent=int(row.volume_sent),
+                volume_received=int(row.volume_received)
+            )
+        return stats
+
+async def get_pending_transactions(session: Optional[AsyncSession] = None) -> List[Dict[str, Any]]:
+    """Get broadcast transactions that are still waiting for a receipt."""
+    async with session_scope(session) as session:
+        query = sa.select(
+            Transactions.tx_hash,
+            Transactions.tx_type,
+            Transactions.sender_id,
+            Transactions.recipient_id
+        ).where(
+            Transactions.status == "pending",
+            Transactions.tx_hash.is_not(None)
+        )
+        result = await session.execute(query)
+        return [dict(row._mapping) for row in result]
+
+async def get_pending_settlement_hashes(session: Optional[AsyncSession] = None) -> List[str]:
+    """Get the hashes of broadcast settlement transfers that are still waiting for a receipt."""
+    async with session_scope(session) as session:
+        query = sa.select(SettlementTransfers.tx_hash).where(SettlementTransfers.status == "pending")
+        result = await session.execute(query)
+        return list(result.scalars())
+
+async def get_user_transactions(
+    user_id: int,
+    limit: int = 10,
+    before: Optional[Tuple[datetime, int]] = None,
+    after: Optional[Tuple[datetime, int]] = None,
+    session: Optional[AsyncSession] = None
+) -> Tuple[List[Dict[str, Any]], bool]:
+    """Get one page of a user's transaction history, newest first.
+    
+    Pages are keyset ranges on (created_at, id): `before` gives the page
+    older than a cursor and `after` the page newer than it. Sent and
+    received transactions are read as two index range scans, and one extra
+    row is fetched to tell whether another page follows, so every page costs
+    the same whatever its depth.
+    
+    Returns:
+        Tuple[List[Dict[str, Any]], bool]: (transactions, whether more
+            transactions follow in the paging direction)
+    """
+    newer = after is not None
+    cursor = after if newer else before
+    
+    def side(*conditions):
+        query = sa.select(Transactions).where(*conditions)
+        if cursor is not None:
+            created_at, tx_id = cursor
+            if newer:
+                query = query.where(
+                    Transactions.created_at >= created_at,
+                    sa.tuple_(Transactions.created_at, Transactions.id) > sa.tuple_(created_at, tx_id)
+                )
+            else:
+                query = query.where(
+                    Transactions.created_at <= created_at,
+                    sa.tuple_(Transactions.created_at, Transactions.id) < sa.tuple_(created_at, tx_id)
+                )
+        if newer:
+            query = query.order_by(Transactions.created_at.asc(), Transactions.id.asc())
+        else:
+            query = query.order_by(Transactions.created_at.desc(), Transactions.id.desc())
+        return query.limit(limit + 1)
+    
+    history = sa.union_all(
+        side(Transactions.sender_id == user_id),
+        side(
+            Transactions.recipient_id == user_id,
+            Transactions.sender_id.is_distinct_from(user_id)
+        )
+    ).subquery()
+    
+    if newer:
+        order = (history.c.created_at.asc(), history.c.id.asc())
+    else:
+        order = (history.c.created_at.desc(), history.c.id.desc())
+    
+    # Counterparty display names are joined in rather than looked up per row
+    sender = aliased(Users)
+    recipient = aliased(Users)
+    query = sa.select(
+        history.c.id,
+        history.c.sender_id,
+        history.c.recipient_id,
+        history.c.sender_wallet,
+        history.c.recipient_wallet,
+        history.c.amount,
+        history.c.tx_hash,
+        history.c.tx_type,
+        history.c.status,
+        history.c.created_at,
+        sender.username.label("sender_username"),
+        sender.first_name.label("sender_first_name"),
+        recipient.username.label("recipient_username"),
+        recipient.first_name.label("recipient_first_name")
+    ).outerjoin(
+        sender, sender.user_id == history.c.sender_id
+    ).outerjoin(
+        recipient, recipient.user_id == history.c.recipient_id
+    ).order_by(*order).limit(limit + 1)
+    
+    async with session_scope(session) as session:
+        result = await session.execute(query)
+        transactions = [{**row._mapping, "amount": int(row.amount)} for row in result]
+    
+    has_more = len(transactions) > limit
+    transactions = transactions[:limit]
+    if newer:
+        transactions.reverse()
+    
+    return transactions, has_more
 
-async def check_transaction_exists(idempotency_key: str) -> bool:
+async def check_transaction_exists(idempotency_key: str, session: Optional[AsyncSession] = None) -> bool:
     """Check if a transaction with the given idempotency key exists."""
     if not idempotency_key:
         return False
     
-    async with async_session_maker() as session:
+    async with session_scope(session) as session:
         query = sa.select(sa.func.count(Transactions.id)).where(
             Transactions.idempotency_key == idempotency_key
         )
@@ -311,31 +931,625 @@ async def check_transaction_exists(idempotency_key: str) -> bool:
         count = result.scalar_one() or 0
         return count > 0
 
-async def increment_referral_count(referrer_id: int) -> bool:
+async def increment_referral_count(referrer_id: int, session: Optional[AsyncSession] = None) -> bool:
     """Increment the referral count for a user."""
-    async with async_session_maker() as session:
-        query = sa.select(Users).where(Users.user_id == referrer_id)
-        result = await session.execute(query)
-        user = result.scalar_one_or_none()
-        
-        if not user:
-            return False
-        
-        user.referral_count = (user.referral_count or 0) + 1
+    async with session_scope(session) as session:
+        # Increment in the database so concurrent referrals aren't lost
+        result = await session.execute(
+            sa.update(Users).where(Users.user_id == referrer_id).values(
+                referral_count=sa.func.coalesce(Users.referral_count, 0) + 1
+            ).returning(Users.user_id)
+        )
+        updated = result.scalar_one_or_none() is not None
         await session.commit()
-        return True
+    
+    if updated:
+        await profile_cache.invalidate(referrer_id)
+    return updated
 
-async def get_user_referrals(user_id: int) -> Tuple[int, List[int]]:
-    """Get user's referral count and list of referred users."""
-    async with async_session_maker() as session:
+async def get_user_referrals(user_id: int, session: Optional[AsyncSession] = None) -> Tuple[int, List[Dict[str, Any]]]:
+    """Get user's referral count and the referred users with their display names."""
+    async with session_scope(session) as session:
         # Get referral count
         count_query = sa.select(Users.referral_count).where(Users.user_id == user_id)
         count_result = await session.execute(count_query)
         referral_count = count_result.scalar_one_or_none() or 0
         
         # Get referred users
-        users_query = sa.select(Users.user_id).where(Users.referrer_id == user_id)
+        users_query = sa.select(
+            Users.user_id,
+            Users.username,
+            Users.first_name
+        ).where(Users.referrer_id == user_id).order_by(Users.created_at)
         users_result = await session.execute(users_query)
-        referred_users = [user_id for user_id, in users_result]
+        referred_users = [dict(row._mapping) for row in users_result]
         
         return referral_count, referred_users
+
+async def get_indexer_checkpoint(name: str, session: Optional[AsyncSession] = None) -> Optional[int]:
+    """Get the last block processed by an indexer."""
+    async with session_scope(session) as session:
+        query = sa.select(IndexerState.last_block).where(IndexerState.name == name)
+        result = await session.execute(query)
+        return result.scalar_one_or_none()
+
+async def set_indexer_checkpoint(name: str, last_block: int, session: Optional[AsyncSession] = None) -> None:
+    """Set the last block processed by an indexer."""
+    async with session_scope(session) as session:
+        await session.execute(_checkpoint_upsert(name, last_block))
+        await session.commit()
+
+def _checkpoint_upsert(name: str, last_block: int):
+    """Build an upsert statement for an indexer checkpoint."""
+    query = pg_insert(IndexerState).values(name=name, last_block=last_block)
+    return query.on_conflict_do_update(
+        index_elements=["name"],
+        set_={"last_block": query.excluded.last_block}
+    )
+
+async def get_wallet_owners(wallet_addresses: Iterable[str], session: Optional[AsyncSession] = None) -> Dict[str, int]:
+    """Map checksummed wallet addresses to the users that own them."""
+    owners: Dict[str, int] = {}
+    missing: List[str] = []
+    for wallet_address in wallet_addresses:
+        user_id = _user_by_wallet.get(wallet_address)
+        if user_id is None:
+            missing.append(wallet_address)
+        else:
+            owners[wallet_address] = user_id
+    
+    if not missing:
+        return owners
+    
+    async with session_scope(session) as session:
+        query = sa.select(Users.wallet_address, Users.user_id).where(
+            Users.wallet_address.in_(missing)
+        )
+        result = await session.execute(query)
+        for wallet_address, user_id in result:
+            owners[wallet_address] = user_id
+            _user_by_wallet[wallet_address] = user_id
+    
+    return owners
+
+async def get_indexed_wallets(wallet_addresses: Iterable[str], session: Optional[AsyncSession] = None) -> Set[str]:
+    """Get which of the given wallets already have an indexed balance."""
+    wallet_addresses = list(wallet_addresses)
+    if not wallet_addresses:
+        return set()
+    
+    async with session_scope(session) as session:
+        query = sa.select(WalletBalances.wallet_address).where(
+            WalletBalances.wallet_address.in_(wallet_addresses)
+        )
+        result = await session.execute(query)
+        return set(result.scalars())
+
+async def get_indexed_balance(wallet_address: str, session: Optional[AsyncSession] = None) -> Optional[int]:
+    """Get a wallet's indexed balance in raw token units, if it is tracked."""
+    async with session_scope(session) as session:
+        query = sa.select(WalletBalances.balance).where(
+            WalletBalances.wallet_address == wallet_address
+        )
+        result = await session.execute(query)
+        balance = result.scalar_one_or_none()
+        return int(balance) if balance is not None else None
+
+async def apply_indexed_transfers(
+    name: str,
+    from_block: int,
+    last_block: int,
+    seeded_balances: Dict[str, Tuple[int, int]],
+    balance_deltas: Dict[str, int],
+    deposits: List[Dict[str, Any]],
+    session: Optional[AsyncSession] = None
+) -> None:
+    """Apply one indexed block range atomically.
+    
+    The checkpoint row is locked first, so when several replicas index the
+    same range only the first one applies it.
+    
+    Args:
+        name: Indexer name for the checkpoint
+        from_block: First block included in this range
+        last_block: Last block included in this range
+        seeded_balances: {wallet: (user_id, balance)} for wallets seen for the first time
+        balance_deltas: {wallet: delta} for wallets that were already tracked
+        deposits: Transaction rows for incoming transfers from external wallets
+    
+    Raises:
+        CheckpointConflictError: If the checkpoint isn't at from_block - 1
+    """
+    balances_table = WalletBalances.__table__
+    
+    async with session_scope(session) as session:
+        result = await session.execute(
+            sa.select(IndexerState.last_block).where(IndexerState.name == name).with_for_update()
+        )
+        checkpoint = result.scalar_one_or_none()
+        if checkpoint != from_block - 1:
+            raise CheckpointConflictError(
+                f"Indexer {name} is at block {checkpoint}, can't apply blocks {from_block}-{last_block}"
+            )
+        
+        if seeded_balances:
+            query = pg_insert(WalletBalances)
+            await session.execute(
+                query.on_conflict_do_update(
+                    index_elements=["wallet_address"],
+                    set_={
+                        "balance": query.excluded.balance,
+                        "updated_block": query.excluded.updated_block
+                    }
+                ),
+                [
+                    {
+                        "wallet_address": wallet_address,
+                        "user_id": user_id,
+                        "balance": balance,
+                        "updated_block": last_block
+                    }
+                    for wallet_address, (user_id, balance) in seeded_balances.items()
+                ]
+            )
+        
+        if balance_deltas:
+            await session.execute(
+                sa.update(balances_table).where(
+                    balances_table.c.wallet_address == sa.bindparam("b_wallet")
+                ).values(
+                    balance=balances_table.c.balance + sa.bindparam("b_delta"),
+                    updated_block=last_block
+                ),
+                [
+                    {"b_wallet": wallet_address, "b_delta": delta}
+                    for wallet_address, delta in balance_deltas.items()
+                ]
+            )
+        
+        if deposits:
+            result = await session.execute(
+                pg_insert(Transactions).on_conflict_do_nothing(
+                    index_elements=["idempotency_key"]
+                ).returning(Transactions.id, Transactions.idempotency_key),
+                deposits
+            )
+            inserted = {key: tx_id for tx_id, key in result}
+            
+            # Credit new deposits to ledger accounts that already exist; accounts
+            # created later are seeded from wallet_balances, which includes them.
+            # This runs after the wallet_balances update above so that it waits
+            # for a concurrent account seed holding the wallet row lock.
+            credits = [
+                (inserted[deposit["idempotency_key"]], deposit["recipient_id"], deposit["amount"])
+                for deposit in deposits
+                if deposit["idempotency_key"] in inserted
+            ]
+            if credits and settings.TIP_SETTLEMENT_MODE == "ledger":
+                await _credit_ledger_deposits(session, credits)
+        
+        await session.execute(_checkpoint_upsert(name, last_block))
+        await session.commit()
+
+async def _credit_ledger_deposits(session: AsyncSession, credits: List[Tuple[int, int, int]]) -> None:
+    """Credit (transaction_id, user_id, amount) deposits to existing ledger accounts."""
+    user_ids = {user_id for _, user_id, _ in credits}
+    result = await session.execute(
+        sa.select(LedgerBalances.user_id).where(LedgerBalances.user_id.in_(user_ids))
+    )
+    accounts = set(result.scalars())
+    credits = [credit for credit in credits if credit[1] in accounts]
+    if not credits:
+        return
+    
+    balances_table = LedgerBalances.__table__
+    await session.execute(
+        sa.update(balances_table).where(
+            balances_table.c.user_id == sa.bindparam("b_user_id")
+        ).values(balance=balances_table.c.balance + sa.bindparam("b_amount")),
+        [{"b_user_id": user_id, "b_amount": amount} for _, user_id, amount in credits]
+    )
+    await _ensure_ledger_account(session, EXTERNAL_ACCOUNT_ID)
+    await session.execute(
+        sa.update(balances_table).where(
+            balances_table.c.user_id == EXTERNAL_ACCOUNT_ID
+        ).values(balance=balances_table.c.balance - sum(amount for _, _, amount in credits))
+    )
+    
+    # Deposits are already on-chain in the user's wallet, so they are born settled
+    entries = []
+    for transaction_id, user_id, amount in credits:
+        entries.append({"transaction_id": transaction_id, "user_id": EXTERNAL_ACCOUNT_ID, "amount": -amount, "settled": True})
+        entries.append({"transaction_id": transaction_id, "user_id": user_id, "amount": amount, "settled": True})
+    await session.execute(sa.insert(LedgerEntries), entries)
+
+async def _ensure_ledger_account(session: AsyncSession, user_id: int) -> None:
+    """Create an empty ledger account if it doesn't exist yet."""
+    await session.execute(
+        pg_insert(LedgerBalances).values(user_id=user_id, balance=0).on_conflict_do_nothing(
+            index_elements=["user_id"]
+        )
+    )
+
+async def get_ledger_balance(user_id: int, session: Optional[AsyncSession] = None) -> Optional[int]:
+    """Get a user's ledger balance in raw token units, if the account exists."""
+    async with session_scope(session) as session:
+        query = sa.select(LedgerBalances.balance).where(LedgerBalances.user_id == user_id)
+        result = await session.execute(query)
+        balance = result.scalar_one_or_none()
+        return int(balance) if balance is not None else None
+
+async def open_ledger_account(user_id: int, wallet_address: str, fallback_balance: Optional[int] = None, session: Optional[AsyncSession] = None) -> int:
+    """Open a user's ledger account, seeded with their indexed on-chain balance.
+    
+    The indexed wallet row is locked while the account is created so that a
+    concurrently indexed deposit is either included in the seed or credited
+    to the new account, never both or neither. `fallback_balance` is used
+    when the wallet isn't indexed.
+    
+    Returns:
+        int: The account balance in raw token units
+    """
+    async with session_scope(session) as session:
+        query = sa.select(WalletBalances.balance).where(
+            WalletBalances.wallet_address == wallet_address
+        ).with_for_update()
+        result = await session.execute(query)
+        indexed = result.scalar_one_or_none()
+        seed = int(indexed) if indexed is not None else (fallback_balance or 0)
+        
+        await session.execute(
+            pg_insert(LedgerBalances).values(user_id=user_id, balance=seed).on_conflict_do_nothing(
+                index_elements=["user_id"]
+            )
+        )
+        result = await session.execute(
+            sa.select(LedgerBalances.balance).where(LedgerBalances.user_id == user_id)
+        )
+        balance = int(result.scalar_one())
+        await session.commit()
+        return balance
+
+async def ledger_transfer(
+    sender_id: int,
+    recipient_id: int,
+    amount_raw: int,
+    tx_type: str = "tip",
+    status: str = "completed",
+    recipient_wallet: Optional[str] = None,
+    idempotency_key: Optional[str] = None,
+    session: Optional[AsyncSession] = None
+) -> Optional[int]:
+    """Move funds between two ledger accounts in a single database transaction.
+    
+    Writes the Transactions row, debits the sender, credits the recipient and
+    records the matching pair of ledger entries. Account rows are locked in
+    user_id order so opposite transfers can't deadlock.
+    
+    Returns:
+        Optional[int]: The Transactions row id, or None if the idempotency key was already used
+    
+    Raises:
+        InsufficientBalanceError: If the sender's ledger balance is too low
+    """
+    balances_table = LedgerBalances.__table__
+    
+    async with session_scope(session) as session:
+        async with session.begin():
+            result = await session.execute(
+                pg_insert(Transactions).values(
+                    sender_id=sender_id if sender_id != EXTERNAL_ACCOUNT_ID else None,
+                    recipient_id=recipient_id if recipient_id != EXTERNAL_ACCOUNT_ID else None,
+                    recipient_wallet=recipient_wallet,
+                    amount=amount_raw,
+                    tx_type=tx_type,
+                    status=status,
+                    idempotency_key=idempotency_key
+                ).on_conflict_do_nothing(index_elements=["idempotency_key"]).returning(Transactions.id)
+            )
+            transaction_id = result.scalar_one_or_none()
+            if transaction_id is None:
+                return None
+            
+            await _ensure_ledger_account(session, recipient_id)
+            await session.execute(
+                sa.select(LedgerBalances.user_id).where(
+                    LedgerBalances.user_id.in_([sender_id, recipient_id])
+                ).order_by(LedgerBalances.user_id).with_for_update()
+            )
+            
+            result = await session.execute(
+                sa.update(balances_table).where(
+                    balances_table.c.user_id == sender_id,
+                    balances_table.c.balance >= amount_raw
+                ).values(balance=balances_table.c.balance - amount_raw).returning(balances_table.c.user_id)
+            )
+            if result.scalar_one_or_none() is None:
+                raise InsufficientBalanceError(f"Insufficient ledger balance for user {sender_id}")
+            
+            await session.execute(
+                sa.update(balances_table).where(
+                    balances_table.c.user_id == recipient_id
+                ).values(balance=balances_table.c.balance + amount_raw)
+            )
+            await session.execute(sa.insert(LedgerEntries), [
+                {"transaction_id": transaction_id, "user_id": sender_id, "amount": -amount_raw},
+                {"transaction_id": transaction_id, "user_id": recipient_id, "amount": amount_raw},
+            ])
+            
+            if tx_type == "tip" and status == "completed":
+                await _count_tips(session, [(sender_id, recipient_id, amount_raw)])
+            
+            return transaction_id
+
+async def get_unsettled_entries(pending_withdrawals: bool = True, session: Optional[AsyncSession] = None) -> List[Dict[str, Any]]:
+    """Get ledger entries that haven't been settled on-chain yet, with their transaction details.
+    
+    With `pending_withdrawals=False` the entries of withdrawals that haven't
+    confirmed yet are left out, e.g. while a hot wallet batch paying them
+    may still revert.
+    """
+    async with session_scope(session) as session:
+        query = sa.select(
+            LedgerEntries.id,
+            LedgerEntries.transaction_id,
+            LedgerEntries.user_id,
+            LedgerEntries.amount,
+            Transactions.tx_type,
+            Transactions.sender_id,
+            Transactions.recipient_wallet
+        ).join(
+            Transactions, Transactions.id == LedgerEntries.transaction_id
+        ).where(
+            LedgerEntries.settled.is_(False)
+        ).order_by(LedgerEntries.id)
+        if not pending_withdrawals:
+            query = query.where(sa.or_(Transactions.tx_type != "withdraw", Transactions.status == "completed"))
+        result = await session.execute(query)
+        return [
+            {**row._mapping, "amount": int(row.amount)}
+            for row in result
+        ]
+
+async def create_settlement_plan(entry_ids: List[int], transfers: List[Dict[str, Any]], session: Optional[AsyncSession] = None) -> None:
+    """Mark entries settled and record the on-chain transfers that settle them, atomically.
+    
+    The entries are locked first, so of two replicas planning the same
+    entries only one stores its plan.
+    
+    Raises:
+        SettlementConflictError: If any entry is already settled or being planned elsewhere
+    """
+    async with session_scope(session) as session:
+        if entry_ids:
+            result = await session.execute(
+                sa.select(LedgerEntries.id).where(
+                    LedgerEntries.id.in_(entry_ids),
+                    LedgerEntries.settled.is_(False)
+                ).with_for_update(skip_locked=True)
+            )
+            if len(result.all()) != len(entry_ids):
+                raise SettlementConflictError(f"{len(entry_ids)} ledger entries are already being settled")
+            
+            result = await session.execute(
+                sa.update(LedgerEntries).where(
+                    LedgerEntries.id.in_(entry_ids),
+                    LedgerEntries.settled.is_(False)
+                ).values(settled=True)
+            )
+            if result.rowcount != len(entry_ids):
+                raise SettlementConflictError(f"{len(entry_ids)} ledger entries are already being settled")
+        if transfers:
+            await session.execute(sa.insert(SettlementTransfers), transfers)
+        await session.commit()
+
+async def get_open_settlement_transfers(session: Optional[AsyncSession] = None) -> List[Dict[str, Any]]:
+    """Get planned settlement transfers that haven't been broadcast yet."""
+    async with session_scope(session) as session:
+        query = sa.select(
+            SettlementTransfers.id,
+            SettlementTransfers.sender_id,
+            SettlementTransfers.recipient_wallet,
+            SettlementTransfers.amount,
+            SettlementTransfers.transaction_id
+        ).where(
+            SettlementTransfers.status == "planned"
+        ).order_by(SettlementTransfers.id)
+        result = await session.execute(query)
+        return [
+            {**row._mapping, "amount": int(row.amount)}
+            for row in result
+        ]
+
+async def record_settlement_transfer(
+    transfer_id: int,
+    tx_hash: str,
+    nonce: int,
+    raw_transaction: str,
+    transaction_id: Optional[int] = None,
+    session: Optional[AsyncSession] = None
+) -> None:
+    """Store the signed transaction of a planned settlement transfer, and the withdrawal it pays.
+    
+    Raises:
+        SettlementConflictError: If the transfer was already signed elsewhere
+    """
+    async with session_scope(session) as session:
+        result = await session.execute(
+            sa.update(SettlementTransfers).where(
+                SettlementTransfers.id == transfer_id,
+                SettlementTransfers.status == "planned"
+            ).values(tx_hash=tx_hash, nonce=nonce, raw_transaction=raw_transaction, status="signed")
+        )
+        if result.rowcount != 1:
+            raise SettlementConflictError(f"Settlement transfer {transfer_id} is already signed")
+        if transaction_id is not None:
+            await session.execute(
+                sa.update(Transactions).where(
+                    Transactions.id == transaction_id,
+                    Transactions.tx_hash.is_(None)
+                ).values(tx_hash=tx_hash)
+            )
+        await session.commit()
+
+async def get_signed_settlement_transfers(session: Optional[AsyncSession] = None) -> List[Dict[str, Any]]:
+    """Get settlement transfers that were signed but aren't known to have been broadcast, oldest first."""
+    async with session_scope(session) as session:
+        query = sa.select(
+            SettlementTransfers.id,
+            SettlementTransfers.sender_id,
+            SettlementTransfers.transaction_id,
+            SettlementTransfers.tx_hash,
+            SettlementTransfers.nonce,
+            SettlementTransfers.raw_transaction
+        ).where(
+            SettlementTransfers.status == "signed"
+        ).order_by(SettlementTransfers.id)
+        result = await session.execute(query)
+        return [dict(row._mapping) for row in result]
+
+async def mark_settlement_transfer_sent(transfer_id: int, session: Optional[AsyncSession] = None) -> None:
+    """Record that a signed settlement transfer reached the network."""
+    async with session_scope(session) as session:
+        await session.execute(
+            sa.update(SettlementTransfers).where(
+                SettlementTransfers.id == transfer_id,
+                SettlementTransfers.status == "signed"
+            ).values(status="pending")
+        )
+        await session.commit()
+
+async def replan_settlement_transfer(transfer_id: int, tx_hash: str, session: Optional[AsyncSession] = None) -> None:
+    """Put a signed settlement transfer that can never be mined back in the plan."""
+    async with session_scope(session) as session:
+        await session.execute(
+            sa.update(SettlementTransfers).where(
+                SettlementTransfers.id == transfer_id,
+                SettlementTransfers.status == "signed"
+            ).values(tx_hash=None, nonce=None, raw_transaction=None, status="planned")
+        )
+        await session.execute(
+            sa.update(Transactions).where(
+                Transactions.tx_hash == tx_hash,
+                Transactions.status == "pending"
+            ).values(tx_hash=None)
+        )
+        await session.commit()
+
+async def get_transaction_hash(transaction_id: int, session: Optional[AsyncSession] = None) -> Optional[str]:
+    """Get the on-chain hash recorded for a transaction row."""
+    async with session_scope(session) as session:
+        query = sa.select(Transactions.tx_hash).where(Transactions.id == transaction_id)
+        result = await session.execute(query)
+        return result.scalar_one_or_none()
+
+async def get_unbroadcast_withdrawals(limit: int, session: Optional[AsyncSession] = None) -> List[Dict[str, Any]]:
+    """Get ledger withdrawals that haven't been sent on-chain yet, oldest first."""
+    async with session_scope(session) as session:
+        query = sa.select(
+            Transactions.id,
+            Transactions.recipient_wallet,
+            LedgerEntries.amount
+        ).join(
+            LedgerEntries,
+            sa.and_(
+                LedgerEntries.transaction_id == Transactions.id,
+                LedgerEntries.user_id == EXTERNAL_ACCOUNT_ID
+            )
+        ).where(
+            Transactions.tx_type == "withdraw",
+            Transactions.status == "pending",
+            Transactions.tx_hash.is_(None)
+        ).order_by(Transactions.id).limit(limit)
+        result = await session.execute(query)
+        return [
+            {"id": row.id, "recipient_wallet": row.recipient_wallet, "amount": int(row.amount)}
+            for row in result
+        ]
+
+async def record_settlement_batch(
+    transaction_ids: List[int],
+    tx_hash: str,
+    nonce: int,
+    raw_transaction: str,
+    session: Optional[AsyncSession] = None
+) -> None:
+    """Store a signed batch transaction and the withdrawals it pays, atomically.
+    
+    Raises:
+        SettlementConflictError: If any of the withdrawals is already paid by another batch
+    """
+    async with session_scope(session) as session:
+        await session.execute(sa.insert(SettlementBatches).values(
+            tx_hash=tx_hash,
+            nonce=nonce,
+            raw_transaction=raw_transaction,
+            status="signed"
+        ))
+        result = await session.execute(
+            sa.update(Transactions).where(
+                Transactions.id.in_(transaction_ids),
+                Transactions.tx_hash.is_(None)
+            ).values(tx_hash=tx_hash)
+        )
+        if result.rowcount != len(transaction_ids):
+            raise SettlementConflictError(f"Withdrawals {transaction_ids} are already paid by another batch")
+        await session.commit()
+
+async def get_signed_settlement_batches(session: Optional[AsyncSession] = None) -> List[Dict[str, Any]]:
+    """Get batches that were signed but aren't known to have been broadcast, oldest first."""
+    async with session_scope(session) as session:
+        query = sa.select(
+            SettlementBatches.tx_hash,
+            SettlementBatches.nonce,
+            SettlementBatches.raw_transaction
+        ).where(
+            SettlementBatches.status == "signed"
+        ).order_by(SettlementBatches.id)
+        result = await session.execute(query)
+        return [dict(row._mapping) for row in result]
+
+async def mark_settlement_batch_sent(tx_hash: str, session: Optional[AsyncSession] = None) -> None:
+    """Record that a signed batch reached the network."""
+    async with session_scope(session) as session:
+        await session.execute(
+            sa.update(SettlementBatches).where(
+                SettlementBatches.tx_hash == tx_hash
+            ).values(status="sent")
+        )
+        await session.commit()
+
+async def drop_settlement_batch(tx_hash: str, session: Optional[AsyncSession] = None) -> int:
+    """Retire a signed batch that can never be mined and release its withdrawals.
+    
+    Returns:
+        int: Number of withdrawals released for the next batch
+    """
+    async with session_scope(session) as session:
+        await session.execute(
+            sa.update(SettlementBatches).where(
+                SettlementBatches.tx_hash == tx_hash
+            ).values(status="dropped")
+        )
+        result = await session.execute(
+            sa.update(Transactions).where(
+                Transactions.tx_hash == tx_hash,
+                Transactions.status == "pending"
+            ).values(tx_hash=None)
+        )
+        await session.commit()
+        return result.rowcount
+
+async def get_user_wallets(user_ids: Iterable[int], session: Optional[AsyncSession] = None) -> Dict[int, str]:
+    """Get wallet addresses for several users."""
+    user_ids = list(user_ids)
+    if not user_ids:
+        return {}
+    
+    async with session_scope(session) as session:
+        query = sa.select(Users.user_id, Users.wallet_address).where(
+            Users.user_id.in_(user_ids),
+            Users.wallet_address.is_not(None)
+        )
+        result = await session.execute(query)
+        return {user_id: wallet_address for user_id, wallet_address in result}
@@ -0,0 +1,126 @@
+import asyncio
+import logging
+import time
+from statistics import median
+from typing import Any, Hashable, Optional, Tuple
+
+from cachetools import TTLCache
+from web3 import AsyncWeb3
+
+from bot.config import settings
+
+class FeeOracle:
+    """Cached chain id, EIP-1559 fee estimates and per-transfer gas limits.
+
+    The chain id is fetched once and kept for the life of the process. Base
+    and priority fees are derived from `eth_feeHistory` and refreshed by a
+    background task, so `current_fees()` normally returns without any RPC.
+    """
+
+    def __init__(self, w3: AsyncWeb3):
+        self.w3 = w3
+        self._chain_id: Optional[int] = None
+        self._fees: Optional[Tuple[int, int]] = None
+        self._updated_at = 0.0
+        self._task: Optional[asyncio.Task] = None
+        self._refresh_lock = asyncio.Lock()
+        self._gas_cache = TTLCache(
+            maxsize=settings.GAS_ESTIMATE_CACHE_SIZE,
+            ttl=settings.GAS_ESTIMATE_TTL
+        )
+
+    async def start(self) -> None:
+        """Load the initial estimate and start the background refresh."""
+        try:
+            await self.refresh()
+        except Exception as e:
+            logging.warning(f"Could not load initial fee estimate: {e}")
+
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the background refresh."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def chain_id(self) -> int:
+        """Get the chain id, querying the node only once."""
+        if self._chain_id is None:
+            self._chain_id = await self.w3.eth.chain_id
+        return self._chain_id
+
+    async def current_fees(self) -> Tuple[int, int]:
+        """Get (max_fee_per_gas, max_priority_fee_per_gas) in wei.
+
+        Served from memory unless the cached estimate is missing or the
+        background refresh has fallen behind.
+        """
+        max_age = settings.FEE_REFRESH_INTERVAL * 3
+        if self._fees is None or time.monotonic() - self._updated_at > max_age:
+            await self.refresh()
+        return self._fees
+
+    async def refresh(self) -> None:
+        """Recompute the fee estimate from recent blocks."""
+        async with self._refresh_lock:
+            history = await self.w3.eth.fee_history(
+                settings.FEE_HISTORY_BLOCKS,
+                "latest",
+                [settings.FEE_PRIORITY_PERCENTILE]
+            )
+
+            # The last entry is the base fee of the next (pending) block
+            base_fee = history["baseFeePerGas"][-1]
+
+            rewards = [reward[0] for reward in history.get("reward", []) if reward]
+            min_priority_fee = AsyncWeb3.to_wei(settings.MIN_PRIORITY_FEE_GWEI, "gwei")
+            priority_fee = max(int(median(rewards)) if rewards else 0, min_priority_fee)
+
+            # Leave room for the base fee to double before the transaction lands
+            max_fee = base_fee * 2 + priority_fee
+
+            self._fees = (max_fee, priority_fee)
+            self._updated_at = time.monotonic()
+
+    async def estimate_gas(
+        self,
+        contract_call: Any,
+        sender_address: str,
+        cache_key: Optional[Hashable] = None,
+        default_gas: Optional[int] = None
+    ) -> int:
+        """Estimate the gas limit for a contract call, caching by key.
+
+        Falls back to `default_gas`, or DEFAULT_GAS_LIMIT if not given, when
+        the node can't estimate the call.
+        """
+        if cache_key is not None and cache_key in self._gas_cache:
+            return self._gas_cache[cache_key]
+
+        try:
+            estimate = await contract_call.estimate_gas({"from": sender_address})
+            gas = int(estimate * settings.GAS_LIMIT_MULTIPLIER)
+        except Exception as e:
+            logging.warning(f"Gas estimation failed, using default: {e}")
+            return default_gas or settings.DEFAULT_GAS_LIMIT
+
+        if cache_key is not None:
+            self._gas_cache[cache_key] = gas
+        return gas
+
+    async def _run(self) -> None:
+        """Refresh the fee estimate periodically."""
+        while True:
+            await asyncio.sleep(settings.FEE_REFRESH_INTERVAL)
+            try:
+                await self.refresh()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"Error refreshing fee estimate: {e}")
@@ -0,0 +1,183 @@
+import asyncio
+import logging
+from typing import Dict, Any, List, Optional, Tuple
+
+from web3 import Web3
+
+from bot.config import settings
+from bot.services import blockchain
+from bot.services.database import (
+    get_indexer_checkpoint, set_indexer_checkpoint, get_wallet_owners,
+    get_indexed_wallets, apply_indexed_transfers, CheckpointConflictError
+)
+
+# keccak256("Transfer(address,address,uint256)")
+TRANSFER_TOPIC = Web3.to_hex(Web3.keccak(text="Transfer(address,address,uint256)"))
+
+CHECKPOINT_NAME = "tip_transfers"
+
+def _topic_to_address(topic: bytes) -> str:
+    """Convert an indexed address topic to a checksummed address."""
+    return Web3.to_checksum_address(bytes(topic)[-20:])
+
+class TransferIndexer:
+    """Incrementally index TIP token Transfer logs into the database.
+
+    Logs are fetched with `eth_getLogs` in block ranges that grow while they
+    succeed and shrink when the node rejects them. Only blocks at least
+    INDEXER_CONFIRMATIONS deep are processed, so reorgs above that depth
+    never reach the database. Each range is applied in one transaction
+    together with its checkpoint.
+    """
+
+    def __init__(self):
+        self._range = settings.INDEXER_MIN_RANGE
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        """Start the indexer loop."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the indexer loop."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        """Index ranges back to back until caught up, then poll."""
+        while True:
+            caught_up = True
+            try:
+                caught_up = await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"Error in transfer indexer: {e}")
+
+            if caught_up:
+                await asyncio.sleep(settings.INDEXER_POLL_INTERVAL)
+
+    async def run_once(self) -> bool:
+        """Index the next block range.
+
+        Returns:
+            bool: True if the indexer has caught up with the confirmed head
+        """
+        if not blockchain.token_contract:
+            return True
+
+        safe_head = await blockchain.w3.eth.block_number - settings.INDEXER_CONFIRMATIONS
+        last_block = await get_indexer_checkpoint(CHECKPOINT_NAME)
+
+        if last_block is None:
+            # First run: start from the configured block or the current safe head
+            last_block = settings.INDEXER_START_BLOCK - 1 if settings.INDEXER_START_BLOCK else safe_head
+            await set_indexer_checkpoint(CHECKPOINT_NAME, last_block)
+
+        if last_block >= safe_head:
+            return True
+
+        from_block = last_block + 1
+        to_block = min(from_block + self._range - 1, safe_head)
+
+        try:
+            logs = await blockchain.w3.eth.get_logs({
+                "fromBlock": from_block,
+                "toBlock": to_block,
+                "address": blockchain.token_contract.address,
+                "topics": [TRANSFER_TOPIC]
+            })
+        except Exception as e:
+            if self._range > settings.INDEXER_MIN_RANGE:
+                # Range too large for the node; retry with a smaller one
+                self._range = max(settings.INDEXER_MIN_RANGE, self._range // 2)
+                logging.info(f"Shrinking indexer range to {self._range} blocks: {e}")
+                return False
+            raise
+
+        try:
+            await self._apply_logs(logs, from_block, to_block)
+        except CheckpointConflictError as e:
+            # Another replica applied this range first; continue from its checkpoint
+            logging.info(f"Skipping indexed range: {e}")
+            return False
+
+        # Grow the range while responses stay small
+        if len(logs) < settings.INDEXER_TARGET_LOGS:
+            self._range = min(settings.INDEXER_MAX_RANGE, self._range * 2)
+
+        return to_block >= safe_head
+
+    async def _apply_logs(self, logs: List[Dict[str, Any]], from_block: int, to_block: int) -> None:
+        """Turn Transfer logs into balance changes and deposit rows."""
+        transfers: List[Tuple[str, str, int, Dict[str, Any]]] = []
+        for log in logs:
+            if len(log["topics"]) < 3:
+                continue
+            sender = _topic_to_address(log["topics"][1])
+            recipient = _topic_to_address(log["topics"][2])
+            value = int.from_bytes(bytes(log["data"])[:32], "big")
+            transfers.append((sender, recipient, value, log))
+
+        addresses = {address for sender, recipient, _, _ in transfers for address in (sender, recipient)}
+        owners = await get_wallet_owners(addresses)
+        tracked = await get_indexed_wallets(owners)
+
+        # Wallets seen for the first time are seeded with their balance at
+        # to_block, which already includes this range's transfers
+        untracked = [address for address in owners if address not in tracked]
+        seeded_balances: Dict[str, Tuple[int, int]] = {}
+        if untracked:
+            balances = await blockchain.get_token_balances(untracked, block_identifier=to_block)
+            missing = [address for address in untracked if address not in balances]
+            if missing:
+                # Retry the whole range rather than seed a wallet with a wrong balance
+                raise ValueError(f"Could not read the balances of {len(missing)} wallets at block {to_block}")
+            seeded_balances = {
+                address: (owners[address], balances[address].raw)
+                for address in untracked
+            }
+
+        balance_deltas: Dict[str, int] = {}
+        deposits: List[Dict[str, Any]] = []
+
+        for sender, recipient, value, log in transfers:
+            if sender in tracked:
+                balance_deltas[sender] = balance_deltas.get(sender, 0) - value
+            if recipient in tracked:
+                balance_deltas[recipient] = balance_deltas.get(recipient, 0) + value
+
+            # Incoming transfers from outside the bot are deposits
+            if recipient in owners and sender not in owners:
+                tx_hash = Web3.to_hex(log["transactionHash"])
+                deposits.append({
+                    "sender_id": None,
+                    "recipient_id": owners[recipient],
+                    "sender_wallet": sender,
+                    "recipient_wallet": recipient,
+                    "amount": value,
+                    "tx_hash": tx_hash,
+                    "tx_type": "deposit",
+                    "status": "completed",
+                    "idempotency_key": f"deposit:{tx_hash}:{log['logIndex']}"
+                })
+
+        await apply_indexed_transfers(
+            CHECKPOINT_NAME,
+            from_block,
+            to_block,
+            seeded_balances,
+            {address: delta for address, delta in balance_deltas.items() if delta},
+            deposits
+        )
+
+        if deposits:
+            logging.info(f"Indexed {len(deposits)} deposits up to block {to_block}")
+
+transfer_indexer = TransferIndexer()
@@ -0,0 +1,367 @@
+import asyncio
+import logging
+from collections import defaultdict
+from typing import Dict, Any, List, Optional, Set
+
+from web3 import Web3
+
+from bot.config import settings
+from bot.services import blockchain
+from bot.services.database import (
+    EXTERNAL_ACCOUNT_ID, SettlementConflictError, get_ledger_balance, open_ledger_account, ledger_transfer,
+    get_unsettled_entries, create_settlement_plan, get_open_settlement_transfers,
+    record_settlement_transfer, get_signed_settlement_transfers, mark_settlement_transfer_sent,
+    replan_settlement_transfer, fail_withdrawals, get_user_wallet, get_user_wallets
+)
+from bot.services.settlement import settlement_queue
+from bot.services.tracker import receipt_tracker
+from bot.utils.amount import TokenAmount
+
+def ledger_enabled() -> bool:
+    """Whether tips between bot users are settled on the internal ledger."""
+    return settings.TIP_SETTLEMENT_MODE == "ledger"
+
+async def _ensure_account(user_id: int, wallet_address: str) -> int:
+    """Get a user's ledger balance, opening the account from their on-chain balance if needed."""
+    balance_raw = await get_ledger_balance(user_id)
+    if balance_raw is None:
+        on_chain = await blockchain.get_token_balance(wallet_address)
+        balance_raw = await open_ledger_account(user_id, wallet_address, on_chain.raw)
+    return balance_raw
+
+async def get_spendable_balance(user_id: int, wallet_address: str) -> TokenAmount:
+    """Get the balance a user can tip or withdraw.
+    
+    In ledger mode this is the user's ledger balance; otherwise it is the
+    token balance of their wallet.
+    """
+    if not ledger_enabled():
+        return await blockchain.get_token_balance(wallet_address)
+    
+    return TokenAmount(await _ensure_account(user_id, wallet_address))
+
+async def send_internal_tip(
+    sender_id: int,
+    sender_wallet: str,
+    recipient_id: int,
+    recipient_wallet: str,
+    amount: TokenAmount,
+    idempotency_key: Optional[str] = None
+) -> Optional[int]:
+    """Tip another bot user on the internal ledger.
+    
+    Returns:
+        Optional[int]: Transaction row id, or None if the tip was already processed
+    
+    Raises:
+        InsufficientBalanceError: If the sender's ledger balance is too low
+    """
+    await asyncio.gather(
+        _ensure_account(sender_id, sender_wallet),
+        _ensure_account(recipient_id, recipient_wallet)
+    )
+    
+    return await ledger_transfer(
+        sender_id=sender_id,
+        recipient_id=recipient_id,
+        amount_raw=amount.raw,
+        tx_type="tip",
+        idempotency_key=idempotency_key
+    )
+
+async def request_withdrawal(
+    user_id: int,
+    wallet_address: str,
+    destination_address: str,
+    amount: TokenAmount,
+    idempotency_key: Optional[str] = None
+) -> Optional[int]:
+    """Debit a withdrawal from the ledger and hand it over for settlement.
+    
+    Returns as soon as the debit is recorded. With batched settlement the
+    withdrawal is paid from the hot wallet in the next batch (see
+    settlement_queue.submit()); otherwise the netting job is woken to net
+    it and pay it from the users' wallets in the background.
+    
+    Returns:
+        Optional[int]: Transaction row id of the withdrawal, or None if it
+            was already processed
+    
+    Raises:
+        InsufficientBalanceError: If the user's ledger balance is too low
+    """
+    await _ensure_account(user_id, wallet_address)
+    
+    transaction_id = await ledger_transfer(
+        sender_id=user_id,
+        recipient_id=EXTERNAL_ACCOUNT_ID,
+        amount_raw=amount.raw,
+        tx_type="withdraw",
+        status="pending",
+        recipient_wallet=destination_address,
+        idempotency_key=idempotency_key
+    )
+    if transaction_id is not None and not settlement_queue.enabled:
+        netting_job.schedule()
+    return transaction_id
+
+def plan_settlement(
+    entries: List[Dict[str, Any]],
+    wallets: Dict[int, str],
+    hot_wallet: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    """Net unsettled ledger entries into a minimal list of on-chain transfers.
+    
+    Each user's unsettled entries are summed into a net position. Wallets
+    with a negative position hold more tokens than their ledger balance and
+    pay out; wallets with a positive position and pending withdrawals are
+    paid. Withdrawals are paid from the withdrawing user's own wallet first
+    so the common case needs a single transfer.
+    
+    If `hot_wallet` is given, withdrawals have already been paid from it in
+    batches, so the hot wallet is reimbursed instead of the destination.
+    """
+    net: Dict[int, int] = defaultdict(int)
+    withdrawals: List[Dict[str, Any]] = []
+    
+    for entry in entries:
+        if entry["user_id"] == EXTERNAL_ACCOUNT_ID:
+            if entry["tx_type"] == "withdraw":
+                withdrawals.append({
+                    "transaction_id": None if hot_wallet else entry["transaction_id"],
+                    "user_id": entry["sender_id"],
+                    "wallet": hot_wallet or entry["recipient_wallet"],
+                    "amount": entry["amount"]
+                })
+            continue
+        net[entry["user_id"]] += entry["amount"]
+    
+    transfers: List[Dict[str, Any]] = []
+    
+    def add_transfer(sender_id: int, recipient_wallet: str, amount: int, transaction_id: Optional[int] = None):
+        transfers.append({
+            "sender_id": sender_id,
+            "recipient_wallet": recipient_wallet,
+            "amount": amount,
+            "transaction_id": transaction_id,
+            "status": "planned"
+        })
+    
+    # Pay withdrawals from the withdrawing user's own surplus first
+    for withdrawal in withdrawals:
+        user_id = withdrawal["user_id"]
+        if net[user_id] < 0:
+            paid = min(withdrawal["amount"], -net[user_id])
+            add_transfer(user_id, withdrawal["wallet"], paid, withdrawal["transaction_id"])
+            net[user_id] += paid
+            withdrawal["amount"] -= paid
+    
+    debtors = sorted(
+        ([user_id, -amount] for user_id, amount in net.items() if amount < 0),
+        key=lambda debtor: -debtor[1]
+    )
+    creditors = sorted(
+        [[wallets[user_id], amount, None] for user_id, amount in net.items() if amount > 0] +
+        [[w["wallet"], w["amount"], w["transaction_id"]] for w in withdrawals if w["amount"] > 0],
+        key=lambda creditor: -creditor[1]
+    )
+    
+    # Greedily match the largest remaining debtor with the largest creditor
+    i = j = 0
+    while i < len(debtors) and j < len(creditors):
+        paid = min(debtors[i][1], creditors[j][1])
+        add_transfer(debtors[i][0], creditors[j][0], paid, creditors[j][2])
+        debtors[i][1] -= paid
+        creditors[j][1] -= paid
+        if debtors[i][1] == 0:
+            i += 1
+        if creditors[j][1] == 0:
+            j += 1
+    
+    return transfers
+
+class NettingJob:
+    """Settle net ledger positions with on-chain transfers, periodically and on withdrawals."""
+    
+    def __init__(self):
+        self._lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._watchers: Dict[int, Dict[str, Any]] = {}
+        self._task: Optional[asyncio.Task] = None
+    
+    async def start(self) -> None:
+        """Start the periodic netting loop."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+    
+    async def stop(self) -> None:
+        """Stop the periodic netting loop."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+    
+    def schedule(self) -> None:
+        """Run netting in the background loop as soon as it is idle."""
+        self._wakeup.set()
+    
+    def watch(self, transaction_id: int, **track_kwargs: Any) -> None:
+        """Follow the transfers paying a withdrawal once they are broadcast.
+        
+        `track_kwargs` are passed on to receipt_tracker.track(), e.g. to edit
+        a message when a transfer confirms. Must be called before the caller
+        yields to the event loop after request_withdrawal(), so the job can't
+        broadcast the withdrawal first.
+        """
+        self._watchers[transaction_id] = track_kwargs
+    
+    async def _run(self) -> None:
+        """Run netting when scheduled, or every LEDGER_NETTING_INTERVAL seconds."""
+        while True:
+            # Withdrawals scheduled during a run get another one
+            self._wakeup.clear()
+            try:
+                await self.run()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"Error in ledger netting: {e}")
+            
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=settings.LEDGER_NETTING_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+    
+    async def run(self) -> None:
+        """Plan transfers for all unsettled entries and broadcast them.
+        
+        The plan is stored and the entries marked settled in one database
+        transaction before anything is signed, and each transfer is signed
+        and recorded before it is broadcast, so a crash never leads to
+        paying the same position twice; transfers that weren't sent are
+        picked up by the next run.
+        """
+        async with self._lock:
+            sent_ids = await self.reconcile()
+            
+            # The hot wallet is only reimbursed for withdrawals its batches
+            # actually paid; a reverted batch refunds them instead
+            hot_wallet = settlement_queue.hot_wallet_address if settlement_queue.enabled else None
+            entries = await get_unsettled_entries(pending_withdrawals=hot_wallet is None)
+            
+            # A withdrawal to an invalid address could never be signed, so it
+            # is failed and refunded before it is planned
+            invalid = {
+                entry["transaction_id"] for entry in entries
+                if entry["tx_type"] == "withdraw" and not Web3.is_address(entry["recipient_wallet"] or "")
+            }
+            if invalid:
+                await fail_withdrawals(sorted(invalid))
+                logging.warning(f"Failed withdrawals {sorted(invalid)} to invalid addresses and refunded them")
+                for transaction_id in invalid:
+                    self._watchers.pop(transaction_id, None)
+                entries = [entry for entry in entries if entry["transaction_id"] not in invalid]
+            
+            if entries:
+                wallets = await get_user_wallets(
+                    {entry["user_id"] for entry in entries if entry["user_id"] != EXTERNAL_ACCOUNT_ID}
+                )
+                transfers = plan_settlement(entries, wallets, hot_wallet)
+                try:
+                    await create_settlement_plan([entry["id"] for entry in entries], transfers)
+                    logging.info(f"Netted {len(entries)} ledger entries into {len(transfers)} transfers")
+                except SettlementConflictError as e:
+                    # Another replica planned them; its plan is broadcast below or by it
+                    logging.info(f"Skipping netting: {e}")
+            
+            planned = await get_open_settlement_transfers()
+            sent = await asyncio.gather(*(self._broadcast(transfer) for transfer in planned))
+            
+            # Stop watching withdrawals once every transfer paying them is out
+            unsent = {transfer["transaction_id"] for transfer, ok in zip(planned, sent) if not ok}
+            for transaction_id in sent_ids | {transfer["transaction_id"] for transfer in planned}:
+                if transaction_id not in unsent:
+                    self._watchers.pop(transaction_id, None)
+    
+    async def reconcile(self) -> Set[Optional[int]]:
+        """Make sure every signed settlement transfer reached the network, oldest first.
+        
+        A transfer the node doesn't know is broadcast again as signed. One
+        whose nonce was used by another transaction can never be mined, so
+        it is put back in the plan and signed again.
+        
+        Returns:
+            Set[Optional[int]]: Withdrawals paid by the transfers that reached the network
+        """
+        signed = await get_signed_settlement_transfers()
+        if not signed:
+            return set()
+        
+        wallets = await get_user_wallets({transfer["sender_id"] for transfer in signed})
+        sent_ids = set()
+        for transfer in signed:
+            tx_hash = transfer["tx_hash"]
+            sender_wallet = wallets[transfer["sender_id"]]
+            raw_transaction = Web3.to_bytes(hexstr=transfer["raw_transaction"])
+            if await blockchain.ensure_broadcast(tx_hash, raw_transaction, sender_wallet, transfer["nonce"]):
+                await mark_settlement_transfer_sent(transfer["id"])
+                receipt_tracker.track(tx_hash, **self._watchers.get(transfer["transaction_id"], {}))
+                sent_ids.add(transfer["transaction_id"])
+                logging.info(f"Settlement transfer {transfer['id']} ({tx_hash}) reached the network")
+                continue
+            
+            await replan_settlement_transfer(transfer["id"], tx_hash)
+            blockchain.nonce_manager.reset(sender_wallet)
+            logging.warning(
+                f"Nonce {transfer['nonce']} of settlement transfer {transfer['id']} was used by "
+                f"another transaction, planning it again"
+            )
+        return sent_ids
+    
+    async def _broadcast(self, transfer: Dict[str, Any]) -> bool:
+        """Sign, record and send one planned settlement transfer.
+        
+        Returns:
+            bool: Whether the transfer was broadcast
+        """
+        try:
+            sender_wallet = await get_user_wallet(transfer["sender_id"])
+            if not sender_wallet:
+                raise ValueError("Sender wallet not found")
+            
+            # The nonce is only used up if the transfer is recorded
+            async with blockchain.nonce_manager.reserve(sender_wallet) as nonce:
+                signed_tx = await blockchain.sign_transfer_from_user(
+                    transfer["sender_id"],
+                    transfer["recipient_wallet"],
+                    transfer["amount"],
+                    nonce
+                )
+                tx_hash = Web3.to_hex(signed_tx.hash)
+                await record_settlement_transfer(
+                    transfer["id"],
+                    tx_hash,
+                    nonce,
+                    Web3.to_hex(signed_tx.raw_transaction),
+                    transfer["transaction_id"]
+                )
+        except Exception as e:
+            logging.error(f"Error signing settlement transfer {transfer['id']}: {e}")
+            return False
+        
+        # The transfer is now recorded; if the broadcast fails, reconcile()
+        # sends the same one again
+        try:
+            await blockchain.broadcast_transaction(signed_tx.raw_transaction)
+            await mark_settlement_transfer_sent(transfer["id"])
+        except Exception as e:
+            logging.error(f"Error broadcasting settlement transfer {transfer['id']} ({tx_hash}), will retry: {e}")
+            return False
+        
+        receipt_tracker.track(tx_hash, **self._watchers.get(transfer["transaction_id"], {}))
+        return True
+
+netting_job = NettingJob()
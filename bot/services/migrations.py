@@ -0,0 +1,172 @@
+import asyncio
+import logging
+from typing import Callable, List, Tuple, Union
+
+import sqlalchemy as sa
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from bot.config import settings
+from bot.services.database import engine, SchemaVersion
+
+# Arbitrary key for the advisory lock that serializes concurrent migrators
+MIGRATION_LOCK_ID = 7_246_130
+
+# A step is a SQL statement or a function run against the sync connection
+Step = Union[str, Callable[[sa.engine.Connection], None]]
+
+def _to_base_units(table: str, column: str) -> str:
+    """Convert a column of token amounts to NUMERIC(78, 0) base units."""
+    return (
+        f"ALTER TABLE {table} ALTER COLUMN {column} TYPE NUMERIC(78, 0) "
+        f"USING round({column}::numeric * {10 ** settings.TOKEN_DECIMALS})"
+    )
+
+# Versioned migrations, applied in order. Each one is frozen DDL for the
+# schema as it was at its version, never derived from the current models:
+# databases created before versioning (version 0) already have some of the
+# tables, and later migrations rely on the column types their predecessors
+# left behind.
+MIGRATIONS: List[Tuple[int, str, List[Step]]] = [
+    (1, "Create tables", [
+        "CREATE TABLE IF NOT EXISTS users ("
+        "user_id BIGSERIAL NOT NULL, username VARCHAR, first_name VARCHAR, last_name VARCHAR, "
+        "language VARCHAR(2), wallet_address VARCHAR, encrypted_private_key VARCHAR, "
+        "referrer_id BIGINT, referral_count INTEGER, created_at TIMESTAMP WITHOUT TIME ZONE, "
+        "last_active TIMESTAMP WITHOUT TIME ZONE, PRIMARY KEY (user_id))",
+        # Amounts were token units at this version; migration 4 converts them
+        "CREATE TABLE IF NOT EXISTS transactions ("
+        "id SERIAL NOT NULL, sender_id BIGINT, recipient_id BIGINT, sender_wallet VARCHAR, "
+        "recipient_wallet VARCHAR, amount FLOAT NOT NULL, tx_hash VARCHAR, "
+        "tx_type VARCHAR NOT NULL, status VARCHAR, idempotency_key VARCHAR, "
+        "created_at TIMESTAMP WITHOUT TIME ZONE, PRIMARY KEY (id), UNIQUE (idempotency_key))",
+        "CREATE TABLE IF NOT EXISTS wallet_balances ("
+        "wallet_address VARCHAR NOT NULL, user_id BIGINT, balance NUMERIC(78, 0) NOT NULL, "
+        "updated_block BIGINT, PRIMARY KEY (wallet_address))",
+        "CREATE TABLE IF NOT EXISTS indexer_state ("
+        "name VARCHAR NOT NULL, last_block BIGINT NOT NULL, PRIMARY KEY (name))",
+        "CREATE TABLE IF NOT EXISTS ledger_balances ("
+        "user_id BIGSERIAL NOT NULL, balance NUMERIC(78, 0) NOT NULL, "
+        "updated_at TIMESTAMP WITHOUT TIME ZONE, PRIMARY KEY (user_id))",
+        "CREATE TABLE IF NOT EXISTS ledger_entries ("
+        "id BIGSERIAL NOT NULL, transaction_id INTEGER NOT NULL, user_id BIGINT NOT NULL, "
+        "amount NUMERIC(78, 0) NOT NULL, settled BOOLEAN NOT NULL, "
+        "created_at TIMESTAMP WITHOUT TIME ZONE, PRIMARY KEY (id))",
+        "CREATE TABLE IF NOT EXISTS settlement_transfers ("
+        "id SERIAL NOT NULL, sender_id BIGINT NOT NULL, recipient_wallet VARCHAR NOT NULL, "
+        "amount NUMERIC(78, 0) NOT NULL, transaction_id INTEGER, tx_hash VARCHAR, "
+        "status VARCHAR, created_at TIMESTAMP WITHOUT TIME ZONE, PRIMARY KEY (id))",
+    ]),
+    (2, "Add indexes for user lookups and transaction history", [
+        "CREATE INDEX IF NOT EXISTS ix_users_username ON users (username)",
+        "CREATE INDEX IF NOT EXISTS ix_users_referrer_id ON users (referrer_id)",
+        "CREATE UNIQUE INDEX IF NOT EXISTS ix_users_wallet_address ON users (wallet_address)",
+        "CREATE INDEX IF NOT EXISTS ix_transactions_sender_id_created_at "
+        "ON transactions (sender_id, created_at DESC)",
+        "CREATE INDEX IF NOT EXISTS ix_transactions_recipient_id_created_at "
+        "ON transactions (recipient_id, created_at DESC)",
+        "CREATE INDEX IF NOT EXISTS ix_transactions_tx_hash ON transactions (tx_hash)",
+        "CREATE INDEX IF NOT EXISTS ix_transactions_pending ON transactions (id) "
+        "WHERE status = 'pending'",
+        "CREATE INDEX IF NOT EXISTS ix_ledger_entries_unsettled ON ledger_entries (id) "
+        "WHERE settled = false",
+    ]),
+    (3, "Add per-user tip counters", [
+        # Volumes were token units at this version; migration 4 converts them
+        "CREATE TABLE IF NOT EXISTS user_stats ("
+        "user_id BIGINT NOT NULL, tips_sent INTEGER NOT NULL, tips_received INTEGER NOT NULL, "
+        "volume_sent NUMERIC(36, 18) NOT NULL, volume_received NUMERIC(36, 18) NOT NULL, "
+        "PRIMARY KEY (user_id))",
+        "UPDATE users SET referral_count = 0 WHERE referral_count IS NULL",
+        # Backfill from confirmed tips; a fresh database has nothing to count
+        "INSERT INTO user_stats (user_id, tips_sent, tips_received, volume_sent, volume_received) "
+        "SELECT user_id, sum(sent), sum(received), sum(volume_sent), sum(volume_received) FROM ("
+        "SELECT sender_id AS user_id, 1 AS sent, 0 AS received, "
+        "amount::numeric AS volume_sent, 0 AS volume_received "
+        "FROM transactions WHERE tx_type = 'tip' AND status = 'completed' AND sender_id IS NOT NULL "
+        "UNION ALL "
+        "SELECT recipient_id, 0, 1, 0, amount::numeric "
+        "FROM transactions WHERE tx_type = 'tip' AND status = 'completed' AND recipient_id IS NOT NULL"
+        ") tips GROUP BY user_id "
+        "ON CONFLICT (user_id) DO NOTHING",
+    ]),
+    (4, "Store token amounts as integer base units", [
+        _to_base_units("transactions", "amount"),
+        _to_base_units("user_stats", "volume_sent"),
+        _to_base_units("user_stats", "volume_received"),
+    ]),
+    (5, "Record signed settlement batches before broadcasting", [
+        "CREATE TABLE IF NOT EXISTS settlement_batches ("
+        "id SERIAL NOT NULL, tx_hash VARCHAR NOT NULL, nonce BIGINT NOT NULL, "
+        "raw_transaction VARCHAR NOT NULL, status VARCHAR NOT NULL, "
+        "created_at TIMESTAMP WITHOUT TIME ZONE, PRIMARY KEY (id), UNIQUE (tx_hash))",
+        "CREATE INDEX IF NOT EXISTS ix_settlement_batches_signed ON settlement_batches (id) "
+        "WHERE status = 'signed'",
+    ]),
+    (6, "Record signed settlement transfers before broadcasting", [
+        "ALTER TABLE settlement_transfers ADD COLUMN IF NOT EXISTS nonce BIGINT",
+        "ALTER TABLE settlement_transfers ADD COLUMN IF NOT EXISTS raw_transaction VARCHAR",
+    ]),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+class SchemaVersionError(Exception):
+    """Raised when the database schema is older or newer than the code expects."""
+
+async def _current_version(conn: AsyncConnection) -> int:
+    """Get the applied schema version, creating the version table if needed."""
+    await conn.run_sync(lambda sync_conn: SchemaVersion.__table__.create(sync_conn, checkfirst=True))
+    result = await conn.execute(sa.select(sa.func.max(SchemaVersion.version)))
+    return result.scalar_one_or_none() or 0
+
+async def get_schema_version() -> int:
+    """Get the schema version the database is at."""
+    async with engine.begin() as conn:
+        return await _current_version(conn)
+
+async def migrate() -> int:
+    """Apply all pending migrations in one transaction.
+
+    Returns:
+        int: The schema version after migrating
+    """
+    async with engine.begin() as conn:
+        await conn.execute(sa.text("SELECT pg_advisory_xact_lock(:key)"), {"key": MIGRATION_LOCK_ID})
+        current = await _current_version(conn)
+
+        if current > LATEST_VERSION:
+            raise SchemaVersionError(
+                f"Database schema version {current} is newer than this code ({LATEST_VERSION})"
+            )
+
+        for version, description, steps in MIGRATIONS:
+            if version <= current:
+                continue
+
+            logging.info(f"Applying migration {version}: {description}")
+            for step in steps:
+                if isinstance(step, str):
+                    await conn.execute(sa.text(step))
+                else:
+                    await conn.run_sync(step)
+
+            await conn.execute(sa.insert(SchemaVersion).values(version=version, description=description))
+
+    return LATEST_VERSION
+
+async def check_schema() -> None:
+    """Make sure the database schema is at the version this code expects.
+
+    Raises:
+        SchemaVersionError: If migrations are pending or the schema is newer
+    """
+    current = await get_schema_version()
+    if current != LATEST_VERSION:
+        raise SchemaVersionError(
+            f"Database schema is at version {current}, expected {LATEST_VERSION}; "
+            f"run `python -m bot.services.migrations`"
+        )
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    print(f"Schema is at version {asyncio.run(migrate())}")
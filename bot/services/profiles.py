@@ -0,0 +1,149 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from bot.config import settings
+from bot.services.cache import Cache, MemoryCache, RedisCache
+
+# Channel on which replicas announce changed profiles
+INVALIDATION_CHANNEL = "tipbot:profiles:invalidate"
+
+# Loads a profile from the database, or None for an unknown user
+ProfileLoader = Callable[..., Awaitable[Optional[Dict[str, Any]]]]
+
+class ProfileCache:
+    """Two-tier cache of the user fields read on almost every update.
+
+    Profiles (language, wallet, username and referral count) are kept in an
+    in-process LRU and, with Redis enabled, in Redis shared by all
+    replicas. Unknown users are cached too, so messages from people who
+    never registered don't reach the database either.
+
+    Writes call invalidate(), which drops the profile from both tiers and
+    announces it over Redis pub/sub so other replicas drop their local
+    copy. If the subscription is lost, the local tier is cleared on
+    reconnect; the TTL bounds staleness for changes not invalidated
+    explicitly (usernames written by the activity buffer).
+    """
+
+    def __init__(self, loader: ProfileLoader, maxsize: int, ttl: float):
+        self._loader = loader
+        self._local = MemoryCache(maxsize, ttl)
+        self._shared: Optional[Cache] = (
+            RedisCache(settings.REDIS_URL, ttl, prefix="tipbot:profile:") if settings.USE_REDIS else None
+        )
+        # Bumped by every invalidation, so a load that raced one isn't cached
+        self._generation = 0
+        self._redis = None
+        self._task: Optional[asyncio.Task] = None
+
+        self.loads = 0
+
+    async def start(self) -> None:
+        """Subscribe to invalidations from other replicas."""
+        if self._shared is None or self._task is not None:
+            return
+
+        from redis.asyncio import Redis
+
+        self._redis = Redis.from_url(settings.REDIS_URL)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop listening for invalidations and close the Redis connections."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._redis is not None:
+            await self._redis.aclose()
+            self._redis = None
+        if self._shared is not None:
+            await self._shared.close()
+
+    async def get(self, user_id: int, session=None) -> Optional[Dict[str, Any]]:
+        """Get a user's profile, or None if the user isn't registered."""
+        key = str(user_id)
+
+        # Unknown users are cached as False
+        profile = await self._local.get(key)
+        if profile is not None:
+            return profile or None
+
+        generation = self._generation
+        if self._shared is not None:
+            profile = await self._shared.get(key)
+            if profile is not None:
+                if generation == self._generation:
+                    await self._local.set(key, profile)
+                return profile or None
+
+        self.loads += 1
+        profile = await self._loader(user_id, session=session) or False
+        if generation == self._generation:
+            await self._local.set(key, profile)
+            if self._shared is not None:
+                await self._shared.set(key, profile)
+        return profile or None
+
+    async def invalidate(self, *user_ids: int) -> None:
+        """Drop profiles after a write, on this and every other replica."""
+        if not user_ids:
+            return
+
+        keys = [str(user_id) for user_id in user_ids]
+        self._generation += 1
+        await self._local.delete(*keys)
+        if self._shared is None:
+            return
+
+        # Delete the shared copies first, so replicas reload from the database
+        await self._shared.delete(*keys)
+        try:
+            await self._publisher().publish(INVALIDATION_CHANNEL, ",".join(keys))
+        except Exception as e:
+            logging.error(f"Error publishing profile invalidation: {e}")
+
+    async def stats(self) -> Dict[str, Any]:
+        """Hit and miss counters of both tiers and the number of database loads."""
+        stats = {"loads": self.loads, "local": await self._local.stats()}
+        if self._shared is not None:
+            stats["shared"] = await self._shared.stats()
+        return stats
+
+    def _publisher(self):
+        """Redis client for publishing, created on first use if start() wasn't called."""
+        if self._redis is None:
+            from redis.asyncio import Redis
+
+            self._redis = Redis.from_url(settings.REDIS_URL)
+        return self._redis
+
+    async def _run(self) -> None:
+        """Drop local profiles announced by other replicas, resubscribing on errors."""
+        while True:
+            try:
+                async with self._redis.pubsub() as pubsub:
+                    await pubsub.subscribe(INVALIDATION_CHANNEL)
+                    # Invalidations may have been missed while unsubscribed
+                    await self._clear_local()
+
+                    async for message in pubsub.listen():
+                        if message["type"] != "message":
+                            continue
+                        keys = message["data"].decode().split(",")
+                        self._generation += 1
+                        await self._local.delete(*keys)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"Error in profile invalidation listener: {e}")
+                await asyncio.sleep(1)
+
+    async def _clear_local(self) -> None:
+        """Drop every locally cached profile."""
+        self._generation += 1
+        self._local = MemoryCache(self._local.maxsize, self._local.ttl)
@@ -0,0 +1,146 @@
+import logging
+import math
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, List, Tuple
+
+from bot.config import settings
+
+# A budget: (key, events, period in seconds). Up to `events` events may come
+# at once, after which they are allowed at a steady events/period rate.
+Limit = Tuple[str, int, float]
+
+# GCRA over all budgets of an event, atomically: the event is allowed only if
+# every budget has room, and is then charged to all of them. Rejected events
+# charge nothing. Uses the Redis clock so all replicas agree on the time.
+#
+# KEYS: budget keys; ARGV: emission interval and burst (ms, events) per key
+# Returns 0 if allowed, otherwise the milliseconds until it would be
+GCRA_SCRIPT = """
+local now_parts = redis.call('TIME')
+local now = tonumber(now_parts[1]) * 1000 + math.floor(tonumber(now_parts[2]) / 1000)
+local retry_after = 0
+local tats = {}
+for i, key in ipairs(KEYS) do
+    local interval = tonumber(ARGV[2 * i - 1])
+    local burst = tonumber(ARGV[2 * i])
+    local tat = tonumber(redis.call('GET', key) or now)
+    if tat < now then
+        tat = now
+    end
+    local allow_at = tat + interval - interval * burst
+    if allow_at > now then
+        retry_after = math.max(retry_after, allow_at - now)
+    end
+    tats[i] = tat + interval
+end
+if retry_after > 0 then
+    return retry_after
+end
+for i, key in ipairs(KEYS) do
+    redis.call('SET', key, tats[i], 'PX', tats[i] - now)
+end
+return 0
+"""
+
+def _interval_ms(events: int, period: float) -> int:
+    """Milliseconds between events at a budget's steady rate."""
+    return max(1, math.ceil(period * 1000 / events))
+
+class RateLimiter(ABC):
+    """Generic cell rate algorithm (GCRA) limiter over several budgets.
+
+    Each budget only stores its theoretical arrival time (TAT), so checking
+    an event is O(1) per budget and keys expire once their bucket is full
+    again.
+    """
+
+    @abstractmethod
+    async def hit(self, limits: List[Limit]) -> float:
+        """Count an event against all its budgets.
+
+        Returns:
+            float: 0 if the event is allowed, otherwise the seconds until it would be
+        """
+
+    async def close(self) -> None:
+        """Release the backend's resources."""
+
+class MemoryRateLimiter(RateLimiter):
+    """In-process limiter, for a single bot process or when Redis fails.
+
+    Nothing is evicted while its budget is still in use, so limits hold no
+    matter how many users are active. Keys whose bucket refilled are swept
+    whenever the table doubles in size, which keeps it proportional to the
+    number of budgets in use at amortized O(1) per hit.
+    """
+
+    def __init__(self):
+        self._tats: Dict[str, int] = {}
+        self._sweep_at = 1024
+
+    async def hit(self, limits: List[Limit]) -> float:
+        now = int(time.monotonic() * 1000)
+
+        retry_after = 0
+        tats = []
+        for key, events, period in limits:
+            interval = _interval_ms(events, period)
+            tat = max(self._tats.get(key, now), now)
+            retry_after = max(retry_after, tat + interval - interval * events - now)
+            tats.append(tat + interval)
+
+        if retry_after > 0:
+            return retry_after / 1000
+
+        for (key, _, _), tat in zip(limits, tats):
+            self._tats[key] = tat
+
+        # Drop refilled buckets, which are the same as missing ones
+        if len(self._tats) >= self._sweep_at:
+            self._tats = {key: tat for key, tat in self._tats.items() if tat > now}
+            self._sweep_at = max(1024, 2 * len(self._tats))
+        return 0
+
+class RedisRateLimiter(RateLimiter):
+    """Limiter shared by all bot processes through Redis.
+
+    Each event is one EVALSHA round trip. If Redis is unavailable, events
+    are limited in process instead, so the bot keeps working with
+    per-replica limits.
+    """
+
+    def __init__(self, url: str, prefix: str = "tipbot:ratelimit:"):
+        # Only needed when Redis is enabled
+        from redis.asyncio import Redis
+
+        self._redis = Redis.from_url(url)
+        self._script = self._redis.register_script(GCRA_SCRIPT)
+        self._fallback = MemoryRateLimiter()
+        self.prefix = prefix
+
+    async def hit(self, limits: List[Limit]) -> float:
+        args = []
+        for _, events, period in limits:
+            args += [_interval_ms(events, period), events]
+
+        try:
+            retry_after = await self._script(
+                keys=[self.prefix + key for key, _, _ in limits],
+                args=args
+            )
+        except Exception as e:
+            logging.error(f"Error checking rate limit in Redis: {e}")
+            return await self._fallback.hit(limits)
+        return int(retry_after) / 1000
+
+    async def close(self) -> None:
+        await self._redis.aclose()
+
+def create_rate_limiter() -> RateLimiter:
+    """Create a limiter on Redis if it is enabled, otherwise in process."""
+    if settings.USE_REDIS:
+        return RedisRateLimiter(settings.REDIS_URL)
+    return MemoryRateLimiter()
+
+rate_limiter = create_rate_limiter()
@@ -0,0 +1,380 @@
+import asyncio
+import json
+import logging
+import time
+from collections import deque
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple, Union
+
+from aiohttp import ClientConnectorError, ClientResponseError, ClientSession, ClientTimeout, TCPConnector
+from web3._utils.caching import async_handle_request_caching
+from web3.providers.async_base import AsyncJSONBaseProvider
+from web3.types import RPCEndpoint, RPCRequest, RPCResponse
+
+from bot.config import settings
+
+# Methods that don't change chain state and can safely be hedged or retried
+READ_ONLY_METHODS = frozenset({
+    "eth_blockNumber",
+    "eth_call",
+    "eth_chainId",
+    "eth_estimateGas",
+    "eth_feeHistory",
+    "eth_gasPrice",
+    "eth_getBalance",
+    "eth_getBlockByNumber",
+    "eth_getLogs",
+    "eth_getTransactionCount",
+    "eth_getTransactionReceipt",
+    "eth_maxPriorityFeePerGas",
+    "net_version",
+    "web3_clientVersion",
+})
+
+# JSON-RPC error codes that mean the endpoint itself is throttling us
+RATE_LIMIT_CODES = frozenset({-32005, 429})
+
+# HTTP status of a throttled request, which the endpoint never processed
+HTTP_TOO_MANY_REQUESTS = 429
+
+class RPCEndpointError(Exception):
+    """Raised when an endpoint fails or rate-limits a request."""
+
+class EndpointStats:
+    """Health and latency statistics for a single RPC endpoint."""
+
+    def __init__(self, url: str):
+        self.url = url
+        self.latencies: deque = deque(maxlen=settings.RPC_STATS_WINDOW)
+        self.outcomes: deque = deque(maxlen=settings.RPC_STATS_WINDOW)
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+
+    @property
+    def available(self) -> bool:
+        """Whether the circuit breaker lets requests through."""
+        return time.monotonic() >= self.open_until
+
+    @property
+    def error_rate(self) -> float:
+        """Share of failed requests in the recent window."""
+        if not self.outcomes:
+            return 0.0
+        return self.outcomes.count(False) / len(self.outcomes)
+
+    def percentile(self, q: float) -> float:
+        """Latency percentile in seconds over the recent window."""
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    @property
+    def p50(self) -> float:
+        return self.percentile(0.5)
+
+    @property
+    def p99(self) -> float:
+        return self.percentile(0.99)
+
+    def record_success(self, latency: float) -> None:
+        """Record a successful request and close the circuit."""
+        self.latencies.append(latency)
+        self.outcomes.append(True)
+        self.consecutive_failures = 0
+
+    def record_failure(self) -> None:
+        """Record a failed request, tripping the circuit after repeated failures.
+
+        Once the cooldown has passed the next request acts as a trial: a
+        success closes the circuit, another failure reopens it.
+        """
+        self.outcomes.append(False)
+        self.consecutive_failures += 1
+        if self.consecutive_failures >= settings.RPC_CIRCUIT_FAILURES:
+            if self.available:
+                logging.warning(f"Circuit opened for RPC endpoint {self.url}")
+            self.open_until = time.monotonic() + settings.RPC_CIRCUIT_COOLDOWN
+
+    def stats(self) -> Dict[str, Any]:
+        """Snapshot of the endpoint statistics."""
+        return {
+            "url": self.url,
+            "p50_ms": round(self.p50 * 1000, 1),
+            "p99_ms": round(self.p99 * 1000, 1),
+            "error_rate": round(self.error_rate, 3),
+            "available": self.available,
+        }
+
+class RPCPool:
+    """Latency-aware router over several JSON-RPC endpoints.
+
+    Requests go to the fastest healthy endpoint and fail over to the next one
+    on errors. Read-only requests can be hedged: if the first endpoint hasn't
+    answered within RPC_HEDGE_AFTER_MS, a second endpoint is tried as well and
+    whichever answers first wins.
+    """
+
+    def __init__(self, urls: Iterable[str]):
+        self.endpoints = [EndpointStats(url) for url in urls]
+        self._session: Optional[ClientSession] = None
+
+    async def open(self) -> None:
+        """Create the shared keep-alive HTTP session."""
+        if self._session is None or self._session.closed:
+            connector = TCPConnector(
+                limit=settings.RPC_POOL_SIZE,
+                keepalive_timeout=settings.RPC_KEEPALIVE_TIMEOUT,
+                ttl_dns_cache=300
+            )
+            self._session = ClientSession(
+                connector=connector,
+                timeout=ClientTimeout(total=settings.RPC_TIMEOUT),
+                headers={"Content-Type": "application/json"},
+                raise_for_status=True
+            )
+
+    async def close(self) -> None:
+        """Close the shared HTTP session."""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """Per-endpoint latency and health statistics."""
+        return [endpoint.stats() for endpoint in self.endpoints]
+
+    def _ranked(self, exclude: Set[EndpointStats]) -> List[EndpointStats]:
+        """Endpoints ordered by preference, healthiest and fastest first."""
+        candidates = [endpoint for endpoint in self.endpoints if endpoint not in exclude]
+        available = [endpoint for endpoint in candidates if endpoint.available]
+        if available:
+            return sorted(
+                available,
+                key=lambda e: (e.error_rate > settings.RPC_MAX_ERROR_RATE, e.p50)
+            )
+        # Every circuit is open: try the one that tripped longest ago
+        return sorted(candidates, key=lambda e: e.open_until)
+
+    async def request(self, payload: bytes, methods: Tuple[str, ...]) -> Union[RPCResponse, List[RPCResponse]]:
+        """Send an encoded JSON-RPC request or batch and return the decoded response."""
+        if self._session is None:
+            await self.open()
+
+        read_only = all(method in READ_ONLY_METHODS for method in methods)
+        tried: Set[EndpointStats] = set()
+        last_error: Optional[Exception] = None
+
+        while len(tried) < len(self.endpoints):
+            ranked = self._ranked(tried)
+            primary = ranked[0]
+            hedge = ranked[1] if read_only and settings.RPC_HEDGE_AFTER_MS > 0 and len(ranked) > 1 else None
+
+            tried.add(primary)
+            try:
+                if hedge is not None:
+                    return await self._hedged_post(primary, hedge, payload)
+                return await self._post(primary, payload)
+            except Exception as e:
+                last_error = e
+                # A write that may have reached the node must not be replayed
+                # elsewhere; refused connections and rate limits are safe to retry
+                if not read_only and not isinstance(e, (ClientConnectorError, RPCEndpointError)):
+                    raise
+                logging.warning(f"RPC request {methods[:3]} failed, failing over: {e}")
+
+        raise RPCEndpointError(f"All RPC endpoints failed: {last_error}")
+
+    async def _post(self, endpoint: EndpointStats, payload: bytes) -> Union[RPCResponse, List[RPCResponse]]:
+        """POST a payload to one endpoint and record the outcome."""
+        started = time.monotonic()
+        try:
+            async with self._session.post(endpoint.url, data=payload) as response:
+                raw = await response.read()
+            decoded = json.loads(raw)
+        except asyncio.CancelledError:
+            raise
+        except ClientResponseError as e:
+            endpoint.record_failure()
+            if e.status == HTTP_TOO_MANY_REQUESTS:
+                raise RPCEndpointError(f"Rate limited by {endpoint.url}") from e
+            raise
+        except Exception:
+            endpoint.record_failure()
+            raise
+
+        responses = decoded if isinstance(decoded, list) else [decoded]
+        if any((r.get("error") or {}).get("code") in RATE_LIMIT_CODES for r in responses if isinstance(r, dict)):
+            endpoint.record_failure()
+            raise RPCEndpointError(f"Rate limited by {endpoint.url}")
+
+        endpoint.record_success(time.monotonic() - started)
+        return decoded
+
+    async def _hedged_post(
+        self,
+        primary: EndpointStats,
+        hedge: EndpointStats,
+        payload: bytes
+    ) -> Union[RPCResponse, List[RPCResponse]]:
+        """Race a delayed second request against a slow first one."""
+        first = asyncio.create_task(self._post(primary, payload))
+        tasks = [first]
+        try:
+            done, _ = await asyncio.wait({first}, timeout=settings.RPC_HEDGE_AFTER_MS / 1000)
+            if done:
+                return first.result()
+
+            tasks.append(asyncio.create_task(self._post(hedge, payload)))
+            pending = set(tasks)
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            # Cancel the loser (or both, if we were cancelled) and wait for it,
+            # so no request outlives the call
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+class RPCBatcher:
+    """Coalesce JSON-RPC requests into batch arrays.
+
+    Requests submitted within the same event-loop tick, or within
+    RPC_BATCH_WINDOW_MS of the first one, are sent as a single JSON-RPC
+    batch and each caller receives its own response by id.
+    """
+
+    def __init__(self, pool: RPCPool, encode: Callable[[RPCRequest], bytes]):
+        self.pool = pool
+        self.encode = encode
+        self._queue: List[Tuple[RPCRequest, asyncio.Future]] = []
+        self._flush_handle: Optional[asyncio.Handle] = None
+        # The event loop only keeps weak references to tasks
+        self._sending: Set[asyncio.Task] = set()
+
+    async def request(self, rpc_dict: RPCRequest) -> RPCResponse:
+        """Queue a request and wait for its response."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._queue.append((rpc_dict, future))
+
+        if len(self._queue) >= settings.RPC_BATCH_MAX_SIZE:
+            self._flush()
+        elif self._flush_handle is None:
+            if settings.RPC_BATCH_WINDOW_MS > 0:
+                self._flush_handle = loop.call_later(settings.RPC_BATCH_WINDOW_MS / 1000, self._flush)
+            else:
+                self._flush_handle = loop.call_soon(self._flush)
+
+        return await future
+
+    def _flush(self) -> None:
+        """Send everything queued so far as one batch."""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+        batch, self._queue = self._queue, []
+        if batch:
+            task = asyncio.create_task(self._send(batch))
+            self._sending.add(task)
+            task.add_done_callback(self._sending.discard)
+
+    async def close(self) -> None:
+        """Send what is still queued and wait for all batches in flight."""
+        self._flush()
+        if self._sending:
+            await asyncio.gather(*self._sending, return_exceptions=True)
+
+    async def _send(self, batch: List[Tuple[RPCRequest, asyncio.Future]]) -> None:
+        """POST a batch and resolve each caller's future."""
+        methods = tuple(rpc_dict["method"] for rpc_dict, _ in batch)
+        if len(batch) == 1:
+            payload = self.encode(batch[0][0])
+        else:
+            payload = b"[" + b",".join(self.encode(rpc_dict) for rpc_dict, _ in batch) + b"]"
+
+        try:
+            response = await self.pool.request(payload, methods)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        if isinstance(response, list):
+            by_id = {item.get("id"): item for item in response if isinstance(item, dict)}
+        elif len(batch) == 1:
+            by_id = {batch[0][0]["id"]: response}
+        else:
+            # Some nodes answer a rejected batch with a single error object
+            by_id = {rpc_dict["id"]: response for rpc_dict, _ in batch}
+
+        for rpc_dict, future in batch:
+            if future.done():
+                continue
+            item = by_id.get(rpc_dict["id"])
+            if item is None:
+                future.set_exception(RPCEndpointError(f"No response for {rpc_dict['method']} in batch"))
+            else:
+                future.set_result(item)
+
+class PooledHTTPProvider(AsyncJSONBaseProvider):
+    """Async Web3 provider that routes every request through an RPCPool.
+
+    Read-only requests are coalesced into JSON-RPC batches when batching is
+    enabled; writes are always sent on their own. eth_chainId is answered
+    from web3's request cache after the first call, so the chain id checks
+    web3's validation middleware runs around every eth_call and
+    eth_estimateGas cost no round trip.
+    """
+
+    def __init__(self, pool: RPCPool, **kwargs: Any):
+        self.pool = pool
+        self.batcher = RPCBatcher(pool, self.encode_rpc_dict)
+        kwargs.setdefault("cache_allowed_requests", True)
+        kwargs.setdefault("cacheable_requests", {RPCEndpoint("eth_chainId")})
+        # No block-based requests are cached, so no finality threshold (and
+        # no extra eth_chainId lookup to pick one) is needed
+        kwargs.setdefault("request_cache_validation_threshold", None)
+        super().__init__(**kwargs)
+
+    def __str__(self) -> str:
+        return f"Pooled RPC connection to {len(self.pool.endpoints)} endpoints"
+
+    @async_handle_request_caching
+    async def make_request(self, method: RPCEndpoint, params: Any) -> RPCResponse:
+        rpc_dict = self.form_request(method, params)
+        if settings.RPC_BATCHING and method in READ_ONLY_METHODS:
+            return await self.batcher.request(rpc_dict)
+        return await self.pool.request(self.encode_rpc_dict(rpc_dict), (method,))
+
+    async def make_batch_request(
+        self, batch_requests: List[Tuple[RPCEndpoint, Any]]
+    ) -> Union[List[RPCResponse], RPCResponse]:
+        request_data = self.encode_batch_rpc_request(batch_requests)
+        response = await self.pool.request(
+            request_data,
+            tuple(method for method, _ in batch_requests)
+        )
+        if isinstance(response, list):
+            return sorted(response, key=lambda r: r.get("id", 0))
+        return response
+
+    async def is_connected(self, show_traceback: bool = False) -> bool:
+        try:
+            response = await self.make_request(RPCEndpoint("web3_clientVersion"), [])
+            return "result" in response
+        except Exception:
+            if show_traceback:
+                raise
+            return False
+
+    async def disconnect(self) -> None:
+        await self.batcher.close()
+        await self.pool.close()
@@ -0,0 +1,264 @@
+import asyncio
+import logging
+import time
+from functools import partial
+from typing import Dict, Any, Optional
+
+from web3 import Web3
+
+from bot.config import settings
+from bot.services import blockchain
+from bot.services.database import (
+    get_unbroadcast_withdrawals, get_transaction_hash, record_settlement_batch,
+    get_signed_settlement_batches, mark_settlement_batch_sent, drop_settlement_batch, fail_withdrawals
+)
+from bot.services.tracker import receipt_tracker
+
+class SettlementQueue:
+    """Pay pending ledger withdrawals from the hot wallet in batch transactions.
+
+    Withdrawals are collected for SETTLEMENT_BATCH_WINDOW seconds, or until
+    SETTLEMENT_BATCH_MAX_SIZE are waiting, and sent as a single Disperse
+    `disperseToken` call. Every Transactions row in a batch gets the same
+    hash, so the receipt tracker resolves all of them from one receipt.
+
+    A batch is signed and recorded on its withdrawals in one database
+    transaction before it is broadcast. If the broadcast is lost, the same
+    signed transaction is sent again, so a withdrawal only joins another
+    batch once its own can never be mined.
+    """
+
+    def __init__(self):
+        self._waiters: Dict[int, asyncio.Future] = {}
+        self._wakeup = asyncio.Event()
+        self._full = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._approved = False
+        self._single_transfer_gas: Optional[int] = None
+
+        # Throughput and gas statistics
+        self.batches = 0
+        self.transfers = 0
+        self.send_time = 0.0
+        self.mined_transfers = 0
+        self.gas_used = 0
+
+    @property
+    def enabled(self) -> bool:
+        """Whether withdrawals are batched through the hot wallet."""
+        return settings.SETTLEMENT_BATCHING and bool(settings.ADMIN_WALLET_PRIVATE_KEY)
+
+    @property
+    def hot_wallet_address(self) -> Optional[str]:
+        """Address of the hot wallet paying the batches."""
+        hot_wallet = blockchain.get_hot_wallet()
+        return hot_wallet.address if hot_wallet else None
+
+    async def start(self) -> None:
+        """Start the batching loop."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the batching loop."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def submit(self, transaction_id: int) -> str:
+        """Wait for a pending withdrawal to be sent in a batch.
+
+        Returns:
+            str: Hash of the batch transaction paying the withdrawal
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._waiters[transaction_id] = future
+        try:
+            # The row may have gone out in a batch that was read before we registered
+            tx_hash = await get_transaction_hash(transaction_id)
+            if tx_hash:
+                return tx_hash
+
+            self._wakeup.set()
+            if len(self._waiters) >= settings.SETTLEMENT_BATCH_MAX_SIZE:
+                self._full.set()
+            return await future
+        finally:
+            self._waiters.pop(transaction_id, None)
+
+    def stats(self) -> Dict[str, Any]:
+        """Batch throughput and gas per transfer compared with single transfers."""
+        return {
+            "batches": self.batches,
+            "transfers": self.transfers,
+            "transfers_per_transaction": round(self.transfers / self.batches, 1) if self.batches else 0,
+            "transfers_per_second": round(self.transfers / self.send_time, 1) if self.send_time else 0,
+            "gas_per_transfer": self.gas_used // self.mined_transfers if self.mined_transfers else None,
+            "single_transfer_gas": self._single_transfer_gas,
+        }
+
+    async def _run(self) -> None:
+        """Send a batch whenever withdrawals are waiting, and retry leftovers periodically."""
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=settings.SETTLEMENT_RETRY_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+            # Let more withdrawals join the batch unless it is already full
+            try:
+                await asyncio.wait_for(self._full.wait(), timeout=settings.SETTLEMENT_BATCH_WINDOW)
+            except asyncio.TimeoutError:
+                pass
+
+            self._wakeup.clear()
+            self._full.clear()
+
+            try:
+                while await self.run_once():
+                    pass
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"Error in settlement queue: {e}")
+
+    async def run_once(self) -> bool:
+        """Send one batch of pending withdrawals, after reconciling earlier ones.
+
+        Returns:
+            bool: True if a full batch was sent and more withdrawals may be waiting
+        """
+        await self.reconcile()
+
+        withdrawals = await get_unbroadcast_withdrawals(settings.SETTLEMENT_BATCH_MAX_SIZE)
+        if not withdrawals:
+            return False
+
+        # One withdrawal to an address the Disperse call can't encode would
+        # fail every batch it joins, so it is failed and refunded on its own
+        invalid = [
+            withdrawal["id"] for withdrawal in withdrawals
+            if not Web3.is_address(withdrawal["recipient_wallet"] or "")
+        ]
+        if invalid:
+            await fail_withdrawals(invalid)
+            logging.warning(f"Failed withdrawals {invalid} to invalid addresses and refunded them")
+            for transaction_id in invalid:
+                waiter = self._waiters.get(transaction_id)
+                if waiter and not waiter.done():
+                    waiter.set_exception(ValueError("Invalid withdrawal address"))
+            withdrawals = [withdrawal for withdrawal in withdrawals if withdrawal["id"] not in invalid]
+            if not withdrawals:
+                return True
+
+        # A batch the hot wallet can't cover would revert, so only the
+        # withdrawals it can pay are sent and the rest wait for a top-up
+        available = (await blockchain.get_hot_wallet_balance()).raw
+        affordable = 0
+        for withdrawal in withdrawals:
+            if withdrawal["amount"] > available:
+                break
+            available -= withdrawal["amount"]
+            affordable += 1
+        if affordable < len(withdrawals):
+            logging.warning(f"Hot wallet can only cover {affordable} of {len(withdrawals)} pending withdrawals")
+            error = RuntimeError("Hot wallet balance is too low, will retry")
+            for withdrawal in withdrawals[affordable:]:
+                waiter = self._waiters.get(withdrawal["id"])
+                if waiter and not waiter.done():
+                    waiter.set_exception(error)
+            withdrawals = withdrawals[:affordable]
+            if not withdrawals:
+                return False
+
+        transaction_ids = [withdrawal["id"] for withdrawal in withdrawals]
+        recipients = [withdrawal["recipient_wallet"] for withdrawal in withdrawals]
+        amounts = [withdrawal["amount"] for withdrawal in withdrawals]
+
+        started = time.monotonic()
+        try:
+            if not self._approved:
+                await blockchain.ensure_batch_allowance(sum(amounts))
+                self._approved = True
+
+            # The nonce is only used up if the batch is recorded
+            async with blockchain.nonce_manager.reserve(self.hot_wallet_address) as nonce:
+                signed_tx = await blockchain.sign_batch_transfer(recipients, amounts, nonce)
+                tx_hash = Web3.to_hex(signed_tx.hash)
+                await record_settlement_batch(
+                    transaction_ids, tx_hash, nonce, Web3.to_hex(signed_tx.raw_transaction)
+                )
+        except Exception as e:
+            logging.error(f"Error signing batch of {len(withdrawals)} withdrawals, will retry: {e}")
+            for transaction_id in transaction_ids:
+                waiter = self._waiters.get(transaction_id)
+                if waiter and not waiter.done():
+                    waiter.set_exception(e)
+            return False
+
+        # The withdrawals are now paid by this transaction; if the broadcast
+        # fails, reconcile() sends the same one again
+        try:
+            await blockchain.broadcast_transaction(signed_tx.raw_transaction)
+            await mark_settlement_batch_sent(tx_hash)
+        except Exception as e:
+            logging.error(f"Error broadcasting batch {tx_hash}, will retry: {e}")
+        elapsed = time.monotonic() - started
+
+        for transaction_id in transaction_ids:
+            waiter = self._waiters.get(transaction_id)
+            if waiter and not waiter.done():
+                waiter.set_result(tx_hash)
+
+        self.batches += 1
+        self.transfers += len(withdrawals)
+        self.send_time += elapsed
+
+        if self._single_transfer_gas is None:
+            try:
+                self._single_transfer_gas = await blockchain.estimate_transfer_gas(self.hot_wallet_address)
+            except Exception as e:
+                logging.warning(f"Could not estimate single transfer gas: {e}")
+
+        receipt_tracker.track(tx_hash, on_receipt=partial(self._record_receipt, tx_hash, len(withdrawals)))
+        logging.info(f"Sent {len(withdrawals)} withdrawals in transaction {tx_hash} in {elapsed:.2f}s")
+
+        return len(withdrawals) == settings.SETTLEMENT_BATCH_MAX_SIZE
+
+    async def reconcile(self) -> None:
+        """Make sure every recorded batch reached the network, oldest first.
+
+        A batch the node doesn't know is broadcast again as signed. One whose
+        nonce was used by another transaction can never be mined, so its
+        withdrawals are released to the next batch.
+        """
+        for batch in await get_signed_settlement_batches():
+            tx_hash = batch["tx_hash"]
+            raw_transaction = Web3.to_bytes(hexstr=batch["raw_transaction"])
+            if await blockchain.ensure_broadcast(tx_hash, raw_transaction, self.hot_wallet_address, batch["nonce"]):
+                await mark_settlement_batch_sent(tx_hash)
+                receipt_tracker.track(tx_hash)
+                logging.info(f"Batch {tx_hash} reached the network")
+                continue
+
+            released = await drop_settlement_batch(tx_hash)
+            blockchain.nonce_manager.reset(self.hot_wallet_address)
+            logging.warning(
+                f"Nonce {batch['nonce']} of batch {tx_hash} was used by another transaction, "
+                f"released {released} withdrawals"
+            )
+
+    def _record_receipt(self, tx_hash: str, transfer_count: int, receipt: Dict[str, Any]) -> None:
+        """Record the gas a mined batch used per transfer."""
+        self.mined_transfers += transfer_count
+        self.gas_used += receipt["gasUsed"]
+        logging.info(
+            f"Batch {tx_hash} used {receipt['gasUsed'] // transfer_count} gas per transfer "
+            f"for {transfer_count} transfers (single transfer: {self._single_transfer_gas})"
+        )
+
+settlement_queue = SettlementQueue()
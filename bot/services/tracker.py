@@ -0,0 +1,190 @@
+import asyncio
+import inspect
+import logging
+import time
+from typing import Dict, Any, Awaitable, Callable, Optional, Union
+
+from aiogram import Bot
+from web3.exceptions import TransactionNotFound
+
+from bot.config import settings
+from bot.services.blockchain import w3
+from bot.services.database import (
+    update_transaction_statuses, get_pending_transactions, get_pending_settlement_hashes
+)
+from bot.utils.i18n import get_translation_for_language
+
+class ReceiptTracker:
+    """Background task that resolves receipts for broadcast transactions.
+
+    Pending hashes are checked in batches once per new block, their
+    `Transactions.status` is updated and the user's message is edited
+    with the outcome. Several watchers can follow the same hash, e.g. the
+    users whose withdrawals were settled in one batch transaction.
+    """
+
+    def __init__(self):
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._bot: Optional[Bot] = None
+        self._last_block: Optional[int] = None
+
+    async def start(self, bot: Bot) -> None:
+        """Resume tracking of pending transactions and start the loop."""
+        self._bot = bot
+
+        try:
+            for tx in await get_pending_transactions():
+                self._entry(tx["tx_hash"])
+            # Withdrawals paid by several netting transfers only store the first hash
+            for tx_hash in await get_pending_settlement_hashes():
+                self._entry(tx_hash)
+        except Exception as e:
+            logging.error(f"Error loading pending transactions: {e}")
+
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the tracker loop."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def track(
+        self,
+        tx_hash: str,
+        chat_id: Optional[int] = None,
+        message_id: Optional[int] = None,
+        lang: Optional[str] = None,
+        success_key: Optional[str] = None,
+        failure_key: Optional[str] = None,
+        on_receipt: Optional[Callable[[Dict[str, Any]], Union[None, Awaitable[None]]]] = None,
+        **text_kwargs: Any
+    ) -> None:
+        """Follow a broadcast transaction and edit the given message when it resolves.
+        
+        `on_receipt`, if given, is called (and awaited if it is a coroutine
+        function) with the receipt once it is mined.
+        """
+        entry = self._entry(tx_hash)
+        if chat_id and message_id:
+            entry["watchers"].append({
+                "chat_id": chat_id,
+                "message_id": message_id,
+                "lang": lang or settings.DEFAULT_LANGUAGE,
+                "success_key": success_key,
+                "failure_key": failure_key,
+                "text_kwargs": text_kwargs
+            })
+        if on_receipt:
+            entry["callbacks"].append(on_receipt)
+        self._wakeup.set()
+    
+    def _entry(self, tx_hash: str) -> Dict[str, Any]:
+        """Get or create the tracking entry for a hash."""
+        return self._pending.setdefault(tx_hash, {
+            "submitted_at": time.monotonic(),
+            "watchers": [],
+            "callbacks": []
+        })
+
+    @property
+    def pending_count(self) -> int:
+        """Number of transactions currently being followed."""
+        return len(self._pending)
+
+    async def _run(self) -> None:
+        """Poll for new blocks and check receipts once per block."""
+        while True:
+            try:
+                if not self._pending:
+                    self._wakeup.clear()
+                    await self._wakeup.wait()
+
+                block_number = await w3.eth.block_number
+                if block_number != self._last_block:
+                    self._last_block = block_number
+                    await self._check_receipts()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"Error in receipt tracker: {e}")
+
+            await asyncio.sleep(settings.RECEIPT_POLL_INTERVAL)
+
+    async def _check_receipts(self) -> None:
+        """Fetch receipts for all pending hashes in fixed-size batches."""
+        hashes = list(self._pending)
+        statuses: Dict[str, str] = {}
+        receipts_by_hash: Dict[str, Dict[str, Any]] = {}
+        now = time.monotonic()
+
+        for i in range(0, len(hashes), settings.RECEIPT_BATCH_SIZE):
+            batch = hashes[i:i + settings.RECEIPT_BATCH_SIZE]
+            receipts = await asyncio.gather(
+                *(w3.eth.get_transaction_receipt(tx_hash) for tx_hash in batch),
+                return_exceptions=True
+            )
+
+            for tx_hash, receipt in zip(batch, receipts):
+                if isinstance(receipt, TransactionNotFound):
+                    # Still in the mempool; stop following it after the timeout
+                    # and leave the row pending so a restart picks it up again
+                    if now - self._pending[tx_hash]["submitted_at"] > settings.RECEIPT_TIMEOUT:
+                        logging.warning(f"No receipt for {tx_hash} after {settings.RECEIPT_TIMEOUT}s")
+                        del self._pending[tx_hash]
+                    continue
+                if isinstance(receipt, Exception):
+                    logging.error(f"Error getting receipt for {tx_hash}: {receipt}")
+                    continue
+
+                statuses[tx_hash] = "completed" if receipt["status"] == 1 else "failed"
+                receipts_by_hash[tx_hash] = receipt
+
+        if not statuses:
+            return
+
+        await update_transaction_statuses(statuses)
+
+        notifications = []
+        for tx_hash, status in statuses.items():
+            entry = self._pending.pop(tx_hash, None)
+            if not entry:
+                continue
+            for callback in entry["callbacks"]:
+                try:
+                    result = callback(receipts_by_hash[tx_hash])
+                    if inspect.isawaitable(result):
+                        await result
+                except Exception as e:
+                    logging.error(f"Error in receipt callback for {tx_hash}: {e}")
+            for info in entry["watchers"]:
+                notifications.append(self._notify(tx_hash, status, info))
+
+        if notifications:
+            await asyncio.gather(*notifications, return_exceptions=True)
+
+    async def _notify(self, tx_hash: str, status: str, info: Dict[str, Any]) -> None:
+        """Edit the user's message with the final transaction status."""
+        key = info["success_key"] if status == "completed" else info["failure_key"]
+        if not key or not self._bot:
+            return
+
+        _ = get_translation_for_language(info["lang"])
+        try:
+            await self._bot.edit_message_text(
+                text=_(key).format(tx_hash=tx_hash, **info["text_kwargs"]),
+                chat_id=info["chat_id"],
+                message_id=info["message_id"],
+                parse_mode="HTML"
+            )
+        except Exception as e:
+            logging.error(f"Error notifying about transaction {tx_hash}: {e}")
+
+receipt_tracker = ReceiptTracker()
@@ -0,0 +1,107 @@
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from bot.config import settings
+from bot.services.database import save_transaction, save_transactions
+
+class TransactionWriter:
+    """Group-commit writer for transaction records.
+    
+    Records saved while a write is in flight, or within
+    TRANSACTION_BATCH_WINDOW seconds of each other, are written with one
+    multi-row INSERT and a single commit, up to TRANSACTION_BATCH_MAX_SIZE
+    at a time. Each caller is resolved only after the commit holding its
+    record succeeded. Idempotency keys are handled as in save_transaction:
+    a duplicate key is not inserted and its caller gets False.
+    """
+    
+    def __init__(self):
+        self._queue: List[Tuple[Dict[str, Any], asyncio.Future]] = []
+        self._wakeup = asyncio.Event()
+        self._full = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        
+        # Batching statistics
+        self.batches = 0
+        self.records = 0
+    
+    async def start(self) -> None:
+        """Start the writer loop."""
+        if self._task is None:
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+    
+    async def stop(self) -> None:
+        """Write the queued records and stop the writer loop."""
+        if self._task is not None:
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+    
+    async def save(self, **record: Any) -> bool:
+        """Queue a transaction record and wait until it is committed.
+        
+        Takes the keyword arguments of save_transaction and writes directly
+        when the writer isn't running.
+        
+        Returns:
+            bool: False if a transaction with the same idempotency key already exists
+        """
+        if self._task is None or self._stopping:
+            return await save_transaction(**record)
+        
+        future = asyncio.get_running_loop().create_future()
+        self._queue.append((record, future))
+        self._wakeup.set()
+        if len(self._queue) >= settings.TRANSACTION_BATCH_MAX_SIZE:
+            self._full.set()
+        return await future
+    
+    async def _run(self) -> None:
+        """Write queued records in batches until stopped."""
+        while not (self._stopping and not self._queue):
+            await self._wakeup.wait()
+            
+            # Let more records join the batch unless it is already full
+            if not self._stopping and len(self._queue) < settings.TRANSACTION_BATCH_MAX_SIZE:
+                try:
+                    await asyncio.wait_for(self._full.wait(), timeout=settings.TRANSACTION_BATCH_WINDOW)
+                except asyncio.TimeoutError:
+                    pass
+            
+            self._wakeup.clear()
+            self._full.clear()
+            
+            while self._queue:
+                batch = self._queue[:settings.TRANSACTION_BATCH_MAX_SIZE]
+                del self._queue[:len(batch)]
+                await self._write(batch)
+    
+    async def _write(self, batch: List[Tuple[Dict[str, Any], asyncio.Future]]) -> None:
+        """Write one batch and resolve its callers."""
+        try:
+            results = await save_transactions([record for record, _ in batch])
+        except Exception as e:
+            # Retry one by one so a bad record only fails its own caller
+            logging.error(f"Error writing batch of {len(batch)} transactions, retrying individually: {e}")
+            for record, future in batch:
+                try:
+                    result = await save_transaction(**record)
+                except Exception as e:
+                    if not future.done():
+                        future.set_exception(e)
+                    continue
+                if not future.done():
+                    future.set_result(result)
+            return
+        
+        self.batches += 1
+        self.records += len(batch)
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+transaction_writer = TransactionWriter()
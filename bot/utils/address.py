@@ -0,0 +1,10 @@
+from functools import lru_cache
+
+from web3 import Web3
+
+from bot.config import settings
+
+@lru_cache(maxsize=settings.ADDRESS_CACHE_SIZE)
+def checksum_address(address: str) -> str:
+    """Checksum an address, caching the keccak computation per address."""
+    return Web3.to_checksum_address(address)
@@ -0,0 +1,88 @@
+from bot.config import settings
+
+# Token amounts are integers of base units: 1 TIP == SCALE base units
+DECIMALS = settings.TOKEN_DECIMALS
+SCALE = 10 ** DECIMALS
+
+class TokenAmount:
+    """Exact token amount stored as an integer number of base units (wei).
+
+    Amounts are parsed from user input and formatted for display at the
+    edges; everything in between compares and adds plain integers.
+    """
+
+    __slots__ = ("raw",)
+
+    def __init__(self, raw: int = 0):
+        self.raw = raw
+
+    @classmethod
+    def parse(cls, text: str) -> "TokenAmount":
+        """Parse a decimal token amount such as "12.5" without rounding.
+
+        Raises:
+            ValueError: If the text isn't a plain non-negative decimal number
+                or has more than DECIMALS fractional digits
+        """
+        text = text.strip()
+        whole, _, fraction = text.partition(".")
+        if not (
+            text.isascii()
+            and (whole.isdigit() if whole else fraction)
+            and (fraction.isdigit() or not fraction)
+        ):
+            raise ValueError(f"Invalid token amount: {text!r}")
+        if len(fraction) > DECIMALS:
+            raise ValueError(f"Token amount has more than {DECIMALS} decimals: {text!r}")
+
+        # Shifting the decimal point in the string avoids any arithmetic
+        return cls(int(whole + fraction + "0" * (DECIMALS - len(fraction))))
+
+    def __str__(self) -> str:
+        raw = self.raw
+        if raw < 0:
+            return "-" + str(TokenAmount(-raw))
+        if not DECIMALS:
+            return str(raw)
+
+        # Place the decimal point in the digit string instead of dividing
+        digits = str(raw).rjust(DECIMALS + 1, "0")
+        whole, fraction = digits[:-DECIMALS], digits[-DECIMALS:].rstrip("0")
+        return f"{whole}.{fraction}" if fraction else whole
+
+    def __repr__(self) -> str:
+        return f"TokenAmount('{self}')"
+
+    def __int__(self) -> int:
+        return self.raw
+
+    def __bool__(self) -> bool:
+        return self.raw != 0
+
+    def __hash__(self) -> int:
+        return hash(self.raw)
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, TokenAmount):
+            return self.raw == other.raw
+        return NotImplemented
+
+    def __lt__(self, other: "TokenAmount") -> bool:
+        return self.raw < other.raw
+
+    def __le__(self, other: "TokenAmount") -> bool:
+        return self.raw <= other.raw
+
+    def __gt__(self, other: "TokenAmount") -> bool:
+        return self.raw > other.raw
+
+    def __ge__(self, other: "TokenAmount") -> bool:
+        return self.raw >= other.raw
+
+    def __add__(self, other: "TokenAmount") -> "TokenAmount":
+        return TokenAmount(self.raw + other.raw)
+
+    def __sub__(self, other: "TokenAmount") -> "TokenAmount":
+        return TokenAmount(self.raw - other.raw)
+
+ZERO = TokenAmount(0)
@@ -1,45 +1,71 @@
 import os
+import sys
 import json
 import logging
-from typing import Dict, Optional
+from typing import Callable, Dict, Optional
 
 from bot.config import settings
 
-# Cache for translations
-_translations_cache = {}
-
-def get_translation_for_language(lang_code: str) -> callable:
-    """Get translation function for a specific language."""
-    # Load translations if not cached
-    if lang_code not in _translations_cache:
-        _load_translation(lang_code)
+class Translator(dict):
+    """Read-only catalog of one language's messages.
+    
+    Handlers get its bound __getitem__ as `_`, so a lookup is a single C
+    level dict lookup on interned keys and allocates nothing; unknown keys
+    translate to themselves.
+    """
+    
+    __slots__ = ("lang",)
+    
+    def __init__(self, lang: str, messages: Dict[str, str]):
+        super().__init__(messages)
+        self.lang = lang
+    
+    def __missing__(self, key: str) -> str:
+        return key
     
-    # Get translations dictionary
-    translations = _translations_cache.get(lang_code, {})
+    def __repr__(self) -> str:
+        return f"Translator({self.lang!r}, {len(self)} messages)"
     
-    # Return translation function
-    def translate(key: str) -> str:
-        return translations.get(key, key)
+    def _read_only(self, *args, **kwargs):
+        raise TypeError("Translation catalogs are read-only")
     
-    return translate
+    __setitem__ = __delitem__ = _read_only
+    clear = pop = popitem = setdefault = update = _read_only
 
-def _load_translation(lang_code: str) -> None:
-    """Load translations for a language from file."""
+def _load_messages(lang_code: str) -> Dict[str, str]:
+    """Load a language's messages from its locale file."""
+    locales_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), "locales")
     try:
-        # Construct path to translation file
-        locales_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), "locales")
-        file_path = os.path.join(locales_dir, f"{lang_code}.json")
-        
-        # Load translations from file
-        with open(file_path, "r", encoding="utf-8") as f:
-            translations = json.load(f)
-        
-        # Cache translations
-        _translations_cache[lang_code] = translations
+        with open(os.path.join(locales_dir, f"{lang_code}.json"), "r", encoding="utf-8") as f:
+            messages = json.load(f)
     except (FileNotFoundError, json.JSONDecodeError) as e:
         logging.error(f"Error loading translations for {lang_code}: {e}")
-        # Use empty dict as fallback
-        _translations_cache[lang_code] = {}
+        return {}
+    
+    # Interned keys hash once and compare by identity with the literal keys
+    # handlers pass
+    return {sys.intern(key): text for key, text in messages.items()}
+
+def _build_catalog() -> Dict[str, Translator]:
+    """Build every available language's translator, filling gaps from the default language."""
+    default = _load_messages(settings.DEFAULT_LANGUAGE)
+    catalog = {settings.DEFAULT_LANGUAGE: Translator(settings.DEFAULT_LANGUAGE, default)}
+    for lang_code in settings.AVAILABLE_LANGUAGES:
+        if lang_code not in catalog:
+            catalog[lang_code] = Translator(lang_code, {**default, **_load_messages(lang_code)})
+    return catalog
+
+# Process-wide catalog, built once at import and shared by every update
+CATALOG: Dict[str, Translator] = _build_catalog()
+
+# Translation functions, bound once so updates don't create any
+_translators: Dict[str, Callable[[str], str]] = {
+    lang_code: translator.__getitem__ for lang_code, translator in CATALOG.items()
+}
+
+def get_translation_for_language(lang_code: Optional[str]) -> Callable[[str], str]:
+    """Get the translation function for a language, or the default language's if it isn't available."""
+    return _translators.get(lang_code) or _translators[settings.DEFAULT_LANGUAGE]
 
 def get_language_name(lang_code: str) -> str:
     """Get human-readable language name."""
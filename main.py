@@ -27,7 +27,8 @@ WEBHOOK_URL = f"{settings.WEBHOOK_HOST}{WEBHOOK_PATH}"
 
 @app.on_event("startup")
 async def on_startup():
-    """Set webhook on startup."""
+    """Start services and set webhook on startup."""
+    await dp.emit_startup(bot=bot)
     webhook_info = await bot.get_webhook_info()
     if webhook_info.url != WEBHOOK_URL:
         await bot.set_webhook(
@@ -50,6 +51,7 @@ async def bot_webhook(request: Request):
 async def on_shutdown():
     """Delete webhook and close connections on shutdown."""
     await bot.delete_webhook()
+    await dp.emit_shutdown(bot=bot)
     await dp.storage.close()
     await bot.session.close()
 
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# The services create their engine on import; nothing connects until a query runs
+os.environ.setdefault("DATABASE_URL", "postgresql+asyncpg://postgres@localhost/tipbot")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,22 @@
+# pragma version ^0.4.0
+# Multicall3's aggregate3, with the same ABI as the canonical deployment
+struct Call3:
+    target: address
+    allowFailure: bool
+    callData: Bytes[1024]
+
+struct Result:
+    success: bool
+    returnData: Bytes[1024]
+
+@external
+@payable
+def aggregate3(calls: DynArray[Call3, 1024]) -> DynArray[Result, 1024]:
+    results: DynArray[Result, 1024] = []
+    for c: Call3 in calls:
+        success: bool = False
+        data: Bytes[1024] = b""
+        success, data = raw_call(c.target, c.callData, max_outsize=1024, revert_on_failure=False)
+        assert success or c.allowFailure, "Multicall3: call failed"
+        results.append(Result(success=success, returnData=data))
+    return results
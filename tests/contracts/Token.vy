@@ -0,0 +1,33 @@
+# pragma version ^0.4.0
+# Minimal ERC-20 whose balanceOf reverts for blocked holders, so a batched
+# read can mix successful and failed calls
+event Transfer:
+    sender: indexed(address)
+    receiver: indexed(address)
+    value: uint256
+
+balances: HashMap[address, uint256]
+blocked: public(HashMap[address, bool])
+totalSupply: public(uint256)
+
+@deploy
+def __init__(supply: uint256):
+    self.balances[msg.sender] = supply
+    self.totalSupply = supply
+
+@view
+@external
+def balanceOf(owner: address) -> uint256:
+    assert not self.blocked[owner], "blocked"
+    return self.balances[owner]
+
+@external
+def transfer(to: address, amount: uint256) -> bool:
+    self.balances[msg.sender] -= amount
+    self.balances[to] += amount
+    log Transfer(sender=msg.sender, receiver=to, value=amount)
+    return True
+
+@external
+def block(owner: address):
+    self.blocked[owner] = True
@@ -0,0 +1,143 @@
+"""Batched token balance reads against Multicall3 and an ERC-20 on an in-process chain.
+
+The contracts in tests/contracts are compiled with `vyper -f abi,bytecode`.
+"""
+import asyncio
+import json
+import os
+
+import pytest
+
+pytest.importorskip("eth_tester")
+
+from web3 import AsyncWeb3
+from web3.providers.eth_tester import AsyncEthereumTesterProvider
+
+from bot.config import settings
+from bot.services import blockchain
+
+CONTRACTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "contracts")
+SUPPLY = 10 ** 30
+
+def _artifact(name):
+    with open(os.path.join(CONTRACTS, f"{name}.json")) as f:
+        artifact = json.load(f)
+    return artifact["abi"], artifact["bytecode"]
+
+@pytest.fixture
+def eth_calls(monkeypatch):
+    """Targets of the eth_call requests sent to the test chain."""
+    calls = []
+    make_request = AsyncEthereumTesterProvider.make_request
+
+    async def counting_request(self, method, params):
+        if method == "eth_call":
+            calls.append(params[0]["to"])
+        return await make_request(self, method, params)
+
+    # web3 caches the request function per provider, so patch the class
+    # before the chain fixture creates one
+    monkeypatch.setattr(AsyncEthereumTesterProvider, "make_request", counting_request)
+    return calls
+
+@pytest.fixture
+def chain(monkeypatch, eth_calls):
+    """Deploy the token and Multicall3, and point the blockchain service at them."""
+    monkeypatch.setattr(settings, "MULTICALL_CHUNK_SIZE", 4)
+
+    async def deploy():
+        w3 = AsyncWeb3(AsyncEthereumTesterProvider())
+        accounts = await w3.eth.accounts
+
+        async def deploy_contract(name, *args):
+            abi, bytecode = _artifact(name)
+            tx_hash = await w3.eth.contract(abi=abi, bytecode=bytecode).constructor(*args).transact({"from": accounts[0]})
+            receipt = await w3.eth.get_transaction_receipt(tx_hash)
+            return w3.eth.contract(address=receipt["contractAddress"], abi=abi)
+
+        token = await deploy_contract("Token", SUPPLY)
+        multicall = await deploy_contract("Multicall3")
+        return w3, accounts, token, multicall
+
+    loop = asyncio.new_event_loop()
+    w3, accounts, token, multicall = loop.run_until_complete(deploy())
+
+    # Bind with the bot's own ABIs, so the test also checks they match the contracts
+    monkeypatch.setattr(blockchain, "w3", w3)
+    monkeypatch.setattr(blockchain, "token_contract", w3.eth.contract(address=token.address, abi=blockchain.TOKEN_ABI))
+    monkeypatch.setattr(blockchain, "multicall_contract", w3.eth.contract(address=multicall.address, abi=blockchain.MULTICALL3_ABI))
+
+    eth_calls.clear()
+    yield loop, w3, accounts, token, multicall
+    loop.close()
+
+def _holders(count):
+    return [AsyncWeb3.to_checksum_address(f"0x{i:040x}") for i in range(1, count + 1)]
+
+def _fund(loop, token, sender, holders):
+    async def fund():
+        for i, holder in enumerate(holders):
+            await token.functions.transfer(holder, (i + 1) * 10 ** 18).transact({"from": sender})
+    loop.run_until_complete(fund())
+    return {holder: (i + 1) * 10 ** 18 for i, holder in enumerate(holders)}
+
+def test_balances_are_read_in_multicall_chunks(chain, eth_calls):
+    loop, w3, accounts, token, multicall = chain
+    holders = _holders(10)
+    expected = _fund(loop, token, accounts[0], holders)
+
+    # Duplicates, lowercase addresses and empty wallets are normalized away
+    addresses = holders + [holder.lower() for holder in holders[:3]] + [None]
+    balances = loop.run_until_complete(blockchain.get_token_balances(addresses))
+
+    assert {address: balance.raw for address, balance in balances.items()} == expected
+    # 10 addresses in chunks of 4, all through Multicall3
+    assert eth_calls == [multicall.address] * 3
+
+def test_failed_calls_are_left_out(chain, eth_calls):
+    loop, w3, accounts, token, multicall = chain
+    holders = _holders(6)
+    expected = _fund(loop, token, accounts[0], holders)
+
+    async def block(holder):
+        await token.functions.block(holder).transact({"from": accounts[0]})
+    for holder in holders[1:3]:
+        loop.run_until_complete(block(holder))
+
+    balances = loop.run_until_complete(blockchain.get_token_balances(holders))
+
+    # allowFailure keeps the rest of the chunk; the reverted reads are dropped
+    # without falling back to single balanceOf calls
+    assert {address: balance.raw for address, balance in balances.items()} == {
+        holder: expected[holder] for holder in holders if holder not in holders[1:3]
+    }
+    assert eth_calls == [multicall.address] * 2
+
+def test_balances_at_block(chain):
+    loop, w3, accounts, token, multicall = chain
+    holder = _holders(1)[0]
+    _fund(loop, token, accounts[0], [holder])
+    block_number = loop.run_until_complete(w3.eth.block_number)
+    _fund(loop, token, accounts[0], [holder])
+
+    at_block = loop.run_until_complete(blockchain.get_token_balances([holder], block_identifier=block_number))
+    latest = loop.run_until_complete(blockchain.get_token_balances([holder]))
+
+    assert at_block[holder].raw == 10 ** 18
+    assert latest[holder].raw == 2 * 10 ** 18
+
+def test_falls_back_to_single_reads_without_multicall(chain, eth_calls, monkeypatch):
+    loop, w3, accounts, token, multicall = chain
+    holders = _holders(3)
+    expected = _fund(loop, token, accounts[0], holders)
+
+    # No contract at the configured Multicall3 address
+    monkeypatch.setattr(
+        blockchain,
+        "multicall_contract",
+        w3.eth.contract(address=accounts[5], abi=blockchain.MULTICALL3_ABI)
+    )
+    balances = loop.run_until_complete(blockchain.get_token_balances(holders))
+
+    assert {address: balance.raw for address, balance in balances.items()} == expected
+    assert eth_calls == [accounts[5]] + [token.address] * 3